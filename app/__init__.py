@@ -1,13 +1,94 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.core.firebase import initialize_firebase
+from app.core.http import start_http_client, close_http_client
+from app.core.metrics import MetricsMiddleware
+from app.core.profiler import profiler
+from app.utils.tokens import token_verifier
+from app.utils.uploads import UploadSizeLimitMiddleware, UPLOAD_CHUNK_SIZE
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_http_client()
+    token_verifier.start()
+    if settings.serves_auth:
+        # Credentials are parsed and the Admin SDK set up here, not at import
+        await asyncio.to_thread(initialize_firebase)
+
+    if settings.serves_predictions:
+        async with prediction_lifespan():
+            yield
+    else:
+        yield
+
+    if settings.serves_auth:
+        from app.services.email import email_service
+        # Deliver queued emails before the process exits
+        await email_service.stop()
+    await token_verifier.stop()
+    await close_http_client()
+
+@asynccontextmanager
+async def prediction_lifespan():
+    """
+    Model, inference queues, usage recording and admission control; only
+    started (and the ML stack only imported) by workers that serve predictions.
+    """
+    from app.ml.backends import SIDECAR_BACKEND
+    from app.ml.batching import inference_batcher, similarity_batcher
+    from app.ml.executor import configure_tensorflow_threads, inference_executor
+    from app.ml.prediction_cache import prediction_cache
+    from app.ml.predict import load_model_in_background, watch_registry
+    from app.services.usage import usage_recorder
+    from app.utils.rate_limit import admission_controller
+
+    inference_executor.start()
+    # Load and warm up the model in the background so /auth is served right away.
+    # TensorFlow threads must be set before the model initializes the runtime.
+    use_sidecar = settings.INFERENCE_BACKEND == SIDECAR_BACKEND
+    load_model_in_background(
+        # With the sidecar, TensorFlow is never imported in this worker
+        before_load=None if use_sidecar else lambda: configure_tensorflow_threads(
+            settings.TF_INTRA_OP_THREADS, settings.TF_INTER_OP_THREADS
+        ),
+        warm_up_batch_sizes=sorted({1, settings.INFERENCE_MAX_BATCH_SIZE}),
+    )
+    inference_batcher.start()
+    usage_recorder.start()
+    registry_watcher = None
+    if settings.MODEL_REGISTRY_POLL_SECONDS > 0:
+        registry_watcher = asyncio.create_task(watch_registry(settings.MODEL_REGISTRY_POLL_SECONDS))
+    
+    yield
+    
+    if registry_watcher is not None:
+        registry_watcher.cancel()
+    await inference_batcher.stop()
+    await similarity_batcher.stop()
+    inference_executor.shutdown()
+    if use_sidecar:
+        from app.ml.sidecar import sidecar_client
+        sidecar_client.close()
+    prediction_cache.close()
+    # Write buffered prediction history (spilled to disk if Supabase is unreachable)
+    await usage_recorder.stop()
+    await admission_controller.close()
 
 def create_app() -> FastAPI:
-    app = FastAPI(title=settings.PROJECT_NAME)
+    app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
     
-    # Initialize Firebase
-    initialize_firebase()
+    # Reject oversized uploads while they stream in (extra chunk for multipart framing)
+    app.add_middleware(
+        UploadSizeLimitMiddleware,
+        limits={
+            f"{settings.API_V1_STR}/predict": settings.MAX_UPLOAD_BYTES + UPLOAD_CHUNK_SIZE,
+            f"{settings.API_V1_STR}/predict/batch": settings.MAX_BATCH_UPLOAD_BYTES,
+            f"{settings.API_V1_STR}/similar": settings.MAX_UPLOAD_BYTES + UPLOAD_CHUNK_SIZE,
+        },
+    )
     
     # Configure CORS
     app.add_middleware(
@@ -18,4 +99,9 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
     
-    return app 
\ No newline at end of file
+    # Per-route latency, in-flight requests and (when enabled) slow-request profiles
+    if settings.PROFILER_ENABLED:
+        profiler.enable()
+    app.add_middleware(MetricsMiddleware, profiler=profiler)
+    
+    return app
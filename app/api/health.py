@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Response
+from app.core.config import settings
+
+router = APIRouter()
+
+@router.get("/health")
+async def health():
+    """
+    Liveness probe: the process is up and serving requests.
+    """
+    if not settings.serves_predictions:
+        return {"status": "ok", "role": settings.SERVICE_ROLE}
+    from app.ml.prediction_cache import prediction_cache
+    from app.ml.predict import get_model_status
+
+    return {
+        "status": "ok",
+        "role": settings.SERVICE_ROLE,
+        "model": get_model_status(),
+        "prediction_cache": prediction_cache.stats(),
+    }
+
+@router.get("/ready")
+async def ready(response: Response):
+    """
+    Readiness probe: only succeeds once the model is loaded and warmed up,
+    so load balancers route classification traffic to warmed workers only.
+    Auth-only workers are ready as soon as they serve requests.
+    """
+    if not settings.serves_predictions:
+        return {"status": "ready", "role": settings.SERVICE_ROLE}
+    from app.ml.predict import get_model_status, is_model_ready
+
+    status = get_model_status()
+    if not is_model_ready():
+        response.status_code = 503
+        return {"status": "not_ready", "model": status}
+    return {"status": "ready", "model": status}
@@ -0,0 +1,87 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from app.core.config import settings
+from app.core.metrics import cache_metrics, labeled_counter, labeled_gauge, runtime_collector
+
+router = APIRouter()
+
+MODEL_STATES = ("not_loaded", "loading", "ready", "unavailable", "failed")
+
+def inference_metrics():
+    from app.ml.batching import inference_batcher
+    from app.ml.executor import inference_executor
+    from app.ml.predict import get_model_status
+
+    status = get_model_status()
+    yield GaugeMetricFamily("dino_inference_queue_depth", "Images waiting to be batched", value=inference_batcher.queue_depth)
+    yield GaugeMetricFamily("dino_inference_queued_clients", "Clients with images waiting to be batched", value=inference_batcher.queued_clients)
+    yield GaugeMetricFamily("dino_inference_executor_pending", "Batches queued or running on the inference executor", value=inference_executor.pending)
+    yield labeled_gauge("dino_model_state", "1 for the current model lifecycle state", "state", {
+        state: 1.0 if status["state"] == state else 0.0 for state in MODEL_STATES
+    })
+    if status.get("version"):
+        yield labeled_gauge("dino_model_info", "Model version being served", "version", {status["version"]: 1.0})
+
+def cache_sources():
+    from app.services.profiles import profile_repository
+    from app.utils.tokens import token_verifier
+
+    caches = {
+        "profiles": profile_repository.stats(),
+        "tokens": token_verifier.stats(),
+    }
+    if settings.serves_predictions:
+        from app.ml.prediction_cache import prediction_cache
+
+        prediction_stats = prediction_cache.stats()
+        if prediction_stats["memory"] is not None:
+            caches["predictions_memory"] = prediction_stats["memory"]
+        if prediction_stats["disk"] is not None:
+            caches["predictions_disk"] = prediction_stats["disk"]
+    yield from cache_metrics(caches)
+
+def email_metrics():
+    from app.services.email import email_service
+
+    stats = email_service.stats()
+    yield GaugeMetricFamily("dino_email_queue_depth", "Emails waiting to be delivered", value=stats["queue_depth"])
+    yield GaugeMetricFamily("dino_email_waiting_retry", "Emails waiting to be retried", value=stats["waiting_retry"])
+    yield labeled_counter("dino_email_messages", "Emails by delivery outcome", "outcome", {
+        outcome: stats[outcome] for outcome in ("queued", "sent", "retried", "failed")
+    })
+    yield CounterMetricFamily("dino_smtp_connections_opened", "SMTP connections opened", value=stats["connections_opened"])
+
+def usage_metrics():
+    from app.services.usage import usage_recorder
+
+    stats = usage_recorder.stats()
+    yield GaugeMetricFamily("dino_usage_events_pending", "Prediction history events waiting to be written", value=stats["pending"])
+    yield labeled_counter("dino_usage_events", "Prediction history events by outcome", "outcome", {
+        outcome: stats[outcome] for outcome in ("recorded", "flushed", "dropped", "spilled", "recovered")
+    })
+    yield CounterMetricFamily("dino_usage_failed_flushes", "Usage writes to Supabase that failed", value=stats["failed_flushes"])
+
+def admission_metrics():
+    from app.utils.rate_limit import admission_controller
+
+    stats = admission_controller.stats()
+    yield labeled_counter("dino_admission_requests", "Inference requests by rate limit decision", "outcome", {
+        outcome: stats[outcome] for outcome in ("admitted", "limited")
+    })
+    yield CounterMetricFamily("dino_admission_backend_errors", "Rate limit checks that failed open", value=stats["backend_errors"])
+
+runtime_collector.add_source("caches", cache_sources)
+if settings.serves_auth:
+    runtime_collector.add_source("email", email_metrics)
+if settings.serves_predictions:
+    runtime_collector.add_source("inference", inference_metrics)
+    runtime_collector.add_source("usage", usage_metrics)
+    runtime_collector.add_source("admission", admission_metrics)
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus scrape endpoint.
+    """
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
@@ -1,7 +1,18 @@
 from fastapi import APIRouter
-from app.api.v1.endpoints import auth, predict
+from app.api.v1.endpoints import admin
+from app.core.config import settings
 
 api_router = APIRouter()
 
-api_router.include_router(auth.router, prefix="/auth", tags=["Authentication"])
-api_router.include_router(predict.router, prefix="/predict", tags=["Predictions"]) 
\ No newline at end of file
+# Routers are imported only for the role this worker serves, so an auth worker
+# never imports the ML stack and a predict worker never imports Firebase Admin
+if settings.serves_auth:
+    from app.api.v1.endpoints import admin_users, auth
+    api_router.include_router(auth.router, prefix="/auth", tags=["Authentication"])
+    api_router.include_router(admin_users.router, prefix="/admin", tags=["Admin"])
+if settings.serves_predictions:
+    from app.api.v1.endpoints import admin_models, predict, similar
+    api_router.include_router(predict.router, prefix="/predict", tags=["Predictions"])
+    api_router.include_router(similar.router, prefix="/similar", tags=["Predictions"])
+    api_router.include_router(admin_models.router, prefix="/admin", tags=["Admin"])
+api_router.include_router(admin.router, prefix="/admin", tags=["Admin"])
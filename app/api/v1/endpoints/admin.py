@@ -0,0 +1,48 @@
+import secrets
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+from app.core.config import settings
+from app.core.profiler import profiler
+from pydantic import BaseModel
+from typing import Optional
+import os
+
+router = APIRouter()
+
+class ProfilerToggle(BaseModel):
+    enabled: bool
+    slow_request_ms: Optional[float] = None
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not settings.ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.ADMIN_API_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@router.get("/profiler", dependencies=[Depends(require_admin)])
+async def profiler_status():
+    """
+    Shows whether slow-request profiling is on and the captured profiles.
+    """
+    return profiler.status()
+
+@router.post("/profiler", dependencies=[Depends(require_admin)])
+async def toggle_profiler(body: ProfilerToggle):
+    """
+    Turns the sampling profiler on or off in this worker, optionally changing
+    the latency above which a request gets profiled.
+    """
+    if body.enabled:
+        profiler.enable(body.slow_request_ms)
+    else:
+        profiler.disable()
+    return profiler.status()
+
+@router.get("/profiler/{name}", dependencies=[Depends(require_admin)])
+async def download_profile(name: str):
+    """
+    Downloads one captured profile as folded stacks (flamegraph.pl / speedscope input).
+    """
+    if name not in profiler.list_profiles():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(os.path.join(profiler.output_dir, name), media_type="text/plain")
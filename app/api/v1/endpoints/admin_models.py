@@ -0,0 +1,60 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from app.api.v1.endpoints.admin import require_admin
+from app.ml.predict import get_model_status, reload_model
+from app.ml.registry import RegistryError, model_registry
+from pydantic import BaseModel
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+class ModelReload(BaseModel):
+    version: Optional[str] = None
+
+@router.get("/models", dependencies=[Depends(require_admin)])
+async def list_models():
+    """
+    Lists the registered model versions and the one this worker is serving.
+    """
+    return {
+        "active": model_registry.active_version(),
+        "serving": get_model_status(),
+        "versions": await run_in_threadpool(model_registry.list_versions),
+    }
+
+@router.post("/models/reload", dependencies=[Depends(require_admin)])
+async def reload_models(body: Optional[ModelReload] = None):
+    """
+    Activates the given version (or re-reads the active one) and hot-swaps
+    it in. Loading happens off the event loop while the current model keeps
+    serving; the swap itself is instantaneous. The version is only
+    activated once it has loaded and warmed up here.
+    """
+    try:
+        version = body.version if body is not None else None
+        if version is not None and not model_registry.has_version(version):
+            raise RegistryError(f"Unknown model version: {version}")
+        served = await run_in_threadpool(reload_model, version, activate=version is not None)
+    except RegistryError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Model reload failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Model reload failed: {str(e)}")
+    return {"message": "Model reloaded", "version": served.version}
+
+@router.post("/models/rollback", dependencies=[Depends(require_admin)])
+async def rollback_model():
+    """
+    Re-activates the previously active version and hot-swaps it in.
+    """
+    try:
+        version = await run_in_threadpool(model_registry.rollback)
+        served = await run_in_threadpool(reload_model, version)
+    except RegistryError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Model rollback failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Model rollback failed: {str(e)}")
+    return {"message": "Model rolled back", "version": served.version}
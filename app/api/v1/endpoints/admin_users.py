@@ -0,0 +1,46 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from app.api.v1.endpoints.admin import require_admin
+from app.core.config import settings
+from app.services.user_import import job_store, run_import_job
+from pydantic import BaseModel
+from typing import Any, Dict, List
+
+router = APIRouter()
+
+class UserImport(BaseModel):
+    # Rows are validated one by one during the import so errors are reported per row
+    users: List[Dict[str, Any]]
+
+@router.post("/users/import", status_code=202, dependencies=[Depends(require_admin)])
+async def import_users(body: UserImport, background_tasks: BackgroundTasks):
+    """
+    Starts a bulk import of users (email, password, full_name,
+    profile_picture). Runs in the background; poll the returned status URL
+    for progress and the per-row report.
+    """
+    if not body.users:
+        raise HTTPException(status_code=400, detail="No users to import")
+    if len(body.users) > settings.BULK_IMPORT_MAX_USERS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BULK_IMPORT_MAX_USERS} users per import"
+        )
+    job = await run_in_threadpool(job_store.create, len(body.users))
+    # Sync function, so Starlette runs it on its thread pool after responding
+    background_tasks.add_task(run_import_job, job, body.users)
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"{settings.API_V1_STR}/admin/users/import/{job['id']}",
+    }
+
+@router.get("/users/import/{job_id}", dependencies=[Depends(require_admin)])
+async def import_status(job_id: str):
+    """
+    Progress of a bulk import and, once finished, the outcome of every row.
+    """
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
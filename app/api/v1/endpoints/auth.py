@@ -1,8 +1,11 @@
-from fastapi import APIRouter, HTTPException, Depends, Response
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Response
+from fastapi.concurrency import run_in_threadpool
 from firebase_admin import auth as firebase_auth
-from app.core.supabase import supabase
+from app.core.metrics import stage
 from app.models.user import UserCreate, UserLogin, UserProfile, PasswordReset, UserUpdate
-from app.utils.auth import verify_password_firebase
+from app.services.email import EmailQueueFull, email_service
+from app.services.profiles import profile_repository
+from app.utils.auth import verify_password_firebase, verify_firebase_token
 from typing import Optional
 import uuid
 import os
@@ -18,17 +21,15 @@ def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
 async def get_current_user(token: str) -> dict:
-    try:
-        decoded_token = firebase_auth.verify_id_token(token)
-        return decoded_token
-    except:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    # Verified locally against cached signing keys; raises 401 when invalid
+    return await verify_firebase_token(token)
 
 @router.post("/register", response_model=UserProfile)
 async def register_user(user: UserCreate):
     try:
         # Crear usuario en Firebase
-        firebase_user = firebase_auth.create_user(
+        firebase_user = await run_in_threadpool(
+            firebase_auth.create_user,
             email=user.email,
             password=user.password
         )
@@ -36,18 +37,19 @@ async def register_user(user: UserCreate):
         # Crear perfil en Supabase (sin password_hash)
         user_data = {
             "id": str(uuid.uuid4()),
+            "firebase_uid": firebase_user.uid,
             "email": user.email,
             "full_name": user.full_name,
             "profile_picture": user.profile_picture
         }
-        result = supabase.table("profiles").insert(user_data).execute()
+        profile = await profile_repository.create(user_data)
         
-        if not result.data:
+        if not profile:
             # Si falla la creación del perfil, eliminar el usuario de Firebase
-            firebase_auth.delete_user(firebase_user.uid)
+            await run_in_threadpool(firebase_auth.delete_user, firebase_user.uid)
             raise HTTPException(status_code=400, detail="Failed to create user profile")
         
-        return UserProfile(**result.data[0])
+        return UserProfile(**profile)
     
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -56,15 +58,17 @@ async def register_user(user: UserCreate):
 async def login_user(user: UserLogin, response: Response):
     try:
         # Verify credentials with Firebase Auth REST API
-        auth_result = await verify_password_firebase(user.email, user.password)
+        with stage("login.firebase_sign_in"):
+            auth_result = await verify_password_firebase(user.email, user.password)
         
         if not auth_result:
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
-        # Get user profile from Supabase
-        result = supabase.table("profiles").select("*").eq("email", user.email).execute()
+        # Get user profile (cached, falls back to Supabase)
+        with stage("login.profile_lookup"):
+            profile = await profile_repository.get_by_email(user.email)
         
-        if not result.data:
+        if not profile:
             raise HTTPException(status_code=404, detail="User profile not found")
         
         # Set httpOnly cookie
@@ -82,7 +86,7 @@ async def login_user(user: UserLogin, response: Response):
             "token_type": "bearer",
             "expires_in": int(auth_result["expiresIn"]),
             "refresh_token": auth_result["refreshToken"],
-            "profile": result.data[0]
+            "profile": profile
         }
     
     except HTTPException:
@@ -90,14 +94,33 @@ async def login_user(user: UserLogin, response: Response):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.post("/reset-password")
-async def reset_password(reset_data: PasswordReset):
+async def send_password_reset(email: str):
+    """
+    Generates the reset link and queues the email once the response is sent.
+    """
+    if not email_service.enabled:
+        logger.warning(f"SMTP is not configured; password reset email to {email} not sent")
+        return
     try:
-        # Firebase maneja el envío del email automáticamente
-        link = firebase_auth.generate_password_reset_link(reset_data.email)
-        return {"message": "Password reset link sent to your email"}
+        with stage("reset_password.generate_link"):
+            link = await run_in_threadpool(firebase_auth.generate_password_reset_link, email)
+    except firebase_auth.UserNotFoundError:
+        # Same response either way, so the endpoint doesn't reveal which emails exist
+        logger.info(f"Password reset requested for unknown email {email}")
+        return
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        logger.error(f"Could not generate password reset link for {email}: {str(e)}")
+        return
+    try:
+        await email_service.send_password_reset_email(email, link)
+    except EmailQueueFull as e:
+        logger.error(f"Password reset email to {email} dropped: {str(e)}")
+
+@router.post("/reset-password")
+async def reset_password(reset_data: PasswordReset, background_tasks: BackgroundTasks):
+    # El enlace se genera y el email se envía en segundo plano
+    background_tasks.add_task(send_password_reset, reset_data.email)
+    return {"message": "Password reset link sent to your email"}
 
 @router.post("/logout")
 async def logout_user(response: Response):
@@ -1,15 +1,69 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, File, UploadFile, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from app.core.config import settings
+from app.core.metrics import stage
+from app.ml.batching import inference_batcher
+from app.ml.executor import ClientQueueFullError, QueueFullError
+from app.ml.prediction_cache import content_digest, prediction_cache
+from app.ml.predict import decode_image, get_served_model
+from app.services.usage import usage_recorder
+from app.utils.rate_limit import Caller, admission_controller, admit_request
+from app.utils.uploads import RequestStreamingResponse, iter_multipart_files, read_upload
+from collections import deque
+from typing import AsyncIterator, Dict, Any, Optional, Tuple
+import asyncio
+import json
+import math
 import os
-from fastapi import APIRouter, File, UploadFile, HTTPException
-from app.ml.predict import predict_dinosaur
-from app.ml.train import get_train_generator
-from typing import Dict, Any
+import zipfile
 
 router = APIRouter()
 
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+
+async def lookup_cached_prediction(content: bytes) -> Tuple[Optional[tuple], Optional[dict], Optional[str]]:
+    """
+    Looks an upload up by content and the exact model being served.
+    Returns (cache key, cached result, tier); the key is None when caching
+    doesn't apply and the result is None on a miss.
+    """
+    served = get_served_model()
+    if served is None or not prediction_cache.enabled:
+        return None, None, None
+    # Hashing up to MAX_UPLOAD_BYTES is CPU bound; keep it off the event loop
+    digest = await run_in_threadpool(content_digest, content)
+    cached = prediction_cache.get_memory(digest, served.fingerprint)
+    tier = "memory"
+    if cached is None and prediction_cache.disk_path is not None:
+        cached = await run_in_threadpool(prediction_cache.get_disk, digest, served.fingerprint)
+        tier = "disk"
+    return (digest, served), cached, tier if cached is not None else None
+
+def store_prediction(key: Optional[tuple], result: dict, background_tasks: BackgroundTasks):
+    if key is None:
+        return
+    digest, served = key
+    # Only cache results produced by the model the key was computed for
+    if result.get("model_version") != served.version:
+        return
+    prediction_cache.set_memory(digest, served.fingerprint, result)
+    if prediction_cache.disk_path is not None:
+        background_tasks.add_task(prediction_cache.set_disk, digest, served.fingerprint, result)
+
 @router.post("/predict/", response_model=Dict[str, Any])
-async def predict_image(image: UploadFile = File(...)):
+async def predict_image(
+    response: Response,
+    background_tasks: BackgroundTasks,
+    image: UploadFile = File(...),
+    caller: Caller = Depends(admit_request),
+):
     """
     Endpoint to predict dinosaur species from an image.
+    Repeated uploads of the same bytes are answered from the prediction cache
+    (reported in the X-Cache and X-Cache-Tier headers). Predictions of
+    signed-in users are added to their history. Each caller is rate limited
+    and gets a fair share of the inference queue.
     """
     if not image.content_type.startswith("image/"):
         raise HTTPException(
@@ -17,39 +71,259 @@ async def predict_image(image: UploadFile = File(...)):
             detail="File must be an image"
         )
     
-    # Create temporary directory for image processing
-    temp_dir = os.path.join(os.path.dirname(__file__), "..", "..", "..", "ml", "data", "temp")
-    os.makedirs(temp_dir, exist_ok=True)
-    img_path = os.path.join(temp_dir, "temp_image.jpg")
-    
     try:
-        # Save uploaded image
-        with open(img_path, "wb") as buffer:
-            content = await image.read()
-            buffer.write(content)
+        # Read the upload in memory, rejecting it early if it is too large
+        with stage("predict.upload_read"):
+            content = await read_upload(image, settings.MAX_UPLOAD_BYTES)
+        
+        with stage("predict.cache_lookup"):
+            key, cached, tier = await lookup_cached_prediction(content)
+        if cached is not None:
+            response.headers["X-Cache"] = "HIT"
+            response.headers["X-Cache-Tier"] = tier
+            usage_recorder.record(caller.uid, caller.email, cached)
+            return cached
+        if key is not None:
+            response.headers["X-Cache"] = "MISS"
+        
+        try:
+            # Decoding large images is CPU bound; keep it off the event loop
+            with stage("predict.decode"):
+                img_array = await run_in_threadpool(decode_image, content)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
         
-        # Get prediction
-        result = predict_dinosaur(img_path, get_train_generator().class_indices)
+        # Get prediction; concurrent requests are grouped into one forward pass
+        with stage("predict.inference"):
+            result = await inference_batcher.submit(img_array, caller.key, caller.queue_limit)
         
         # Handle prediction errors
         if "error" in result:
-            raise HTTPException(
-                status_code=500 if result["error"] != "Model not available" else 503,
-                detail=result["message"]
-            )
+            if result["error"] in ("Model not available", "Model loading"):
+                raise HTTPException(
+                    status_code=503,
+                    detail=result["message"],
+                    headers={"Retry-After": str(settings.INFERENCE_RETRY_AFTER_SECONDS)}
+                )
+            raise HTTPException(status_code=500, detail=result["message"])
+        
+        store_prediction(key, result, background_tasks)
+        # Buffered; written to Supabase after the response
+        usage_recorder.record(caller.uid, caller.email, result)
         
         return result
     
     except HTTPException:
         raise
     
+    except ClientQueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(settings.INFERENCE_RETRY_AFTER_SECONDS)}
+        )
+    
+    except QueueFullError:
+        raise HTTPException(
+            status_code=503,
+            detail="Prediction service is busy, please retry shortly",
+            headers={"Retry-After": str(settings.INFERENCE_RETRY_AFTER_SECONDS)}
+        )
+    
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"An unexpected error occurred: {str(e)}"
         )
-    
+
+def is_zip_upload(upload: UploadFile) -> bool:
+    return upload.content_type in ZIP_CONTENT_TYPES or (upload.filename or "").lower().endswith(".zip")
+
+def read_zip_member(archive: zipfile.ZipFile, member: zipfile.ZipInfo) -> bytes:
+    # ZipExtFile stops at the declared size and checks the CRC, so a member
+    # can't inflate past the size checked before reading it
+    with archive.open(member) as f:
+        return f.read()
+
+def batch_file_limit(upload: UploadFile) -> int:
+    # Archives are spooled whole (zip needs random access); images are read in memory
+    return settings.BATCH_PREDICT_MAX_ARCHIVE_BYTES if is_zip_upload(upload) else settings.MAX_UPLOAD_BYTES
+
+async def iter_batch_items(
+    parts: AsyncIterator[Tuple[str, Optional[UploadFile], Optional[dict]]],
+) -> AsyncIterator[Tuple[str, Optional[bytes], Optional[dict]]]:
+    """
+    Yields (name, content, error) for every image of the request as its
+    part arrives, expanding zip archives member by member, so only one
+    uploaded file and one image of it are held at a time.
+    """
+    async for filename, upload, error in parts:
+        name = filename or "upload"
+        if error is not None:
+            yield name, None, error
+            continue
+        if is_zip_upload(upload):
+            try:
+                archive = await run_in_threadpool(zipfile.ZipFile, upload.file)
+            except zipfile.BadZipFile as e:
+                yield name, None, {"error": "Invalid archive", "message": str(e)}
+                continue
+            with archive:
+                for member in archive.infolist():
+                    basename = os.path.basename(member.filename)
+                    if member.is_dir() or not basename or basename.startswith(".") or member.filename.startswith("__MACOSX/"):
+                        continue
+                    member_name = f"{name}/{member.filename}"
+                    if member.file_size > settings.MAX_UPLOAD_BYTES:
+                        yield member_name, None, {
+                            "error": "File too large",
+                            "message": f"File exceeds the {settings.MAX_UPLOAD_BYTES} bytes limit",
+                        }
+                        continue
+                    try:
+                        content = await run_in_threadpool(read_zip_member, archive, member)
+                    except (zipfile.BadZipFile, NotImplementedError, RuntimeError) as e:
+                        yield member_name, None, {"error": "Invalid archive member", "message": str(e)}
+                        continue
+                    yield member_name, content, None
+        elif not (upload.content_type or "").startswith("image/"):
+            yield name, None, {"error": "Invalid file", "message": "File must be an image or a zip archive"}
+        else:
+            try:
+                content = await read_upload(upload, settings.MAX_UPLOAD_BYTES)
+            except HTTPException as e:
+                yield name, None, {"error": "File too large", "message": e.detail}
+                continue
+            yield name, content, None
+
+async def classify_item(name: str, content: bytes, background_tasks: BackgroundTasks, caller: Caller) -> dict:
+    """
+    The result line for one image. Never raises: any failure becomes an
+    error line, so one image can't cut the batch's stream short.
+    """
+    try:
+        key, cached, tier = await lookup_cached_prediction(content)
+        if cached is not None:
+            usage_recorder.record(caller.uid, caller.email, cached)
+            return {"file": name, **cached, "cache": tier}
+        try:
+            with stage("batch.decode"):
+                img_array = await run_in_threadpool(decode_image, content)
+        except Exception as e:
+            return {"file": name, "error": "Invalid image", "message": str(e)}
+        with stage("batch.inference"):
+            result = await inference_batcher.submit(img_array, caller.key, caller.queue_limit)
+        if "error" not in result:
+            store_prediction(key, result, background_tasks)
+            usage_recorder.record(caller.uid, caller.email, result)
+        return {"file": name, **result}
+    except QueueFullError:
+        return {"file": name, "error": "Busy", "message": "Prediction service is busy, please retry shortly"}
+    except Exception as e:
+        return {"file": name, "error": "Prediction failed", "message": str(e) or type(e).__name__}
+
+async def stream_predictions(
+    parts: AsyncIterator[Tuple[str, Optional[UploadFile], Optional[dict]]],
+    background_tasks: BackgroundTasks,
+    caller: Caller,
+) -> AsyncIterator[str]:
+    """
+    Classifies the uploaded images while the request is still arriving,
+    with at most BATCH_PREDICT_CONCURRENCY of them decoded or in flight at
+    once (so the batcher can fill large batches while memory stays bounded)
+    and yields one NDJSON line per image, in input order. The images wait
+    in the caller's own queue, so a large batch doesn't hold up other
+    clients. Every image takes a token from the caller's per-image rate
+    limit bucket; once it is empty the image gets a 429 line and the batch
+    stops there.
+    """
+    window = deque()
+    try:
+        async for name, content, error in iter_batch_items(parts):
+            if error is not None:
+                task = asyncio.get_running_loop().create_future()
+                task.set_result({"file": name, **error})
+            else:
+                retry_after = await admission_controller.admit_images(caller)
+                if retry_after:
+                    while window:
+                        yield json.dumps(await window.popleft()) + "\n"
+                    yield json.dumps({
+                        "file": name,
+                        "error": "Too many requests",
+                        "status": 429,
+                        "message": "Rate limit reached, the rest of the batch was not processed",
+                        "retry_after": math.ceil(retry_after),
+                    }) + "\n"
+                    return
+                task = asyncio.ensure_future(classify_item(name, content, background_tasks, caller))
+            window.append(task)
+            while len(window) >= settings.BATCH_PREDICT_CONCURRENCY or (window and window[0].done()):
+                yield json.dumps(await window.popleft()) + "\n"
+        while window:
+            yield json.dumps(await window.popleft()) + "\n"
+    except ClientDisconnect:
+        pass
     finally:
-        # Cleanup temporary file
-        if os.path.exists(img_path):
-            os.remove(img_path) 
\ No newline at end of file
+        # Stop classifying if the client went away, and drop the spooled upload
+        for pending in window:
+            pending.cancel()
+        await parts.aclose()
+
+async def with_first(first, rest: AsyncIterator) -> AsyncIterator:
+    try:
+        yield first
+        async for item in rest:
+            yield item
+    finally:
+        await rest.aclose()
+
+BATCH_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "required": ["images"],
+                "properties": {
+                    "images": {"type": "array", "items": {"type": "string", "format": "binary"}},
+                },
+            },
+        },
+    },
+}
+
+@router.post("/batch/", openapi_extra={"requestBody": BATCH_REQUEST_BODY})
+async def predict_batch_images(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    caller: Caller = Depends(admit_request),
+):
+    """
+    Classifies many images, sent as several `images` files and/or zip
+    archives, and streams one JSON result per line (application/x-ndjson) as
+    they complete. The body is parsed as it arrives, so results start while
+    later files are still uploading. Per-image failures are reported on
+    their own line without aborting the batch.
+    """
+    if get_served_model() is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Model not available",
+            headers={"Retry-After": str(settings.INFERENCE_RETRY_AFTER_SECONDS)}
+        )
+    # Read from the raw body rather than File(...) parameters, which FastAPI
+    # only hands over once the whole request has been spooled
+    body_consumed = asyncio.Event()
+    parts = iter_multipart_files(
+        request, "images", settings.BATCH_PREDICT_MAX_FILES, batch_file_limit, body_consumed
+    )
+    first = await anext(parts, None)
+    if first is None:
+        raise HTTPException(status_code=400, detail="No images uploaded")
+    return RequestStreamingResponse(
+        stream_predictions(with_first(first, parts), background_tasks, caller),
+        body_consumed,
+        media_type="application/x-ndjson",
+        background=background_tasks,
+    )
@@ -0,0 +1,91 @@
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from app.core.config import settings
+from app.core.metrics import stage
+from app.ml.batching import similarity_batcher
+from app.ml.executor import ClientQueueFullError, QueueFullError
+from app.ml.predict import decode_image
+from app.ml.similarity import similarity_index
+from app.utils.rate_limit import Caller, admit_request
+from app.utils.uploads import read_upload
+from typing import Any, Dict
+import os
+
+router = APIRouter()
+
+UNAVAILABLE_ERRORS = ("Model not available", "Model loading", "Similarity unavailable")
+
+@router.post("/", response_model=Dict[str, Any])
+async def similar_images(
+    image: UploadFile = File(...),
+    k: int = Query(8, ge=1, le=settings.SIMILARITY_MAX_RESULTS, description="Number of similar images to return"),
+    caller: Caller = Depends(admit_request),
+):
+    """
+    Reference images from dataset/train and dataset/validation that look most
+    like the upload, best first, with their cosine similarity score.
+    """
+    if not image.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+
+    with stage("similar.upload_read"):
+        content = await read_upload(image, settings.MAX_UPLOAD_BYTES)
+    try:
+        with stage("similar.decode"):
+            img_array = await run_in_threadpool(decode_image, content)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
+
+    try:
+        # Concurrent queries share one embedding pass and one index scan
+        with stage("similar.search"):
+            result = await similarity_batcher.submit((img_array, k), caller.key, caller.queue_limit)
+    except ClientQueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(settings.INFERENCE_RETRY_AFTER_SECONDS)}
+        )
+    except QueueFullError:
+        raise HTTPException(
+            status_code=503,
+            detail="Similarity service is busy, please retry shortly",
+            headers={"Retry-After": str(settings.INFERENCE_RETRY_AFTER_SECONDS)}
+        )
+
+    if "error" in result:
+        if result["error"] in UNAVAILABLE_ERRORS:
+            raise HTTPException(
+                status_code=503,
+                detail=result["message"],
+                headers={"Retry-After": str(settings.INFERENCE_RETRY_AFTER_SECONDS)}
+            )
+        raise HTTPException(status_code=500, detail=result["message"])
+
+    for match in result["matches"]:
+        match["image_url"] = f"{settings.API_V1_STR}/similar/images/{match['key']}"
+    return result
+
+@router.get("/images/{key}")
+async def reference_image(key: str):
+    """
+    Serves an indexed reference image by its content hash.
+    """
+    try:
+        similarity_index.refresh()
+    except (OSError, ValueError, KeyError) as e:
+        # A corrupt or wrong-format index, as in similar_images_batch
+        raise HTTPException(
+            status_code=503,
+            detail=f"The similarity index can't be read; rebuild it ({str(e)})",
+            headers={"Retry-After": str(settings.INFERENCE_RETRY_AFTER_SECONDS)}
+        )
+    item = similarity_index.item(key)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    path = similarity_index.image_path(item)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Image was removed from the dataset")
+    # Keyed by content, so the bytes behind a URL never change
+    return FileResponse(path, headers={"Cache-Control": "public, max-age=31536000, immutable"})
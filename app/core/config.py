@@ -6,8 +6,14 @@ from dotenv import load_dotenv
 # Asegurarse de que .env se carga
 load_dotenv(override=True)
 
+ALL_ROLE = "all"
+AUTH_ROLE = "auth"
+PREDICT_ROLE = "predict"
+SERVICE_ROLES = (ALL_ROLE, AUTH_ROLE, PREDICT_ROLE)
+
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Dino Encyclopedia API"
+    API_V1_STR: str = "/api/v1"
     ALLOWED_ORIGINS: List[str] = [
         "http://localhost:5173",
         "http://localhost:5174",
@@ -19,6 +25,10 @@ class Settings(BaseSettings):
     PORT: int = int(os.getenv("PORT", 8000))
     HOST: str = "0.0.0.0"
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
+
+    # What this worker serves: "all", "auth" (/auth and user admin, never imports the
+    # ML stack) or "predict" (/predict, /similar and model admin, never initializes Firebase Admin)
+    SERVICE_ROLE: str = "all"
     
     # Firebase configuration
     FIREBASE_PROJECT_ID: Optional[str] = None
@@ -28,11 +38,148 @@ class Settings(BaseSettings):
     FIREBASE_CLIENT_ID: Optional[str] = None
     FIREBASE_CLIENT_CERT_URL: Optional[str] = None
     FIREBASE_WEB_API_KEY: Optional[str] = None
+    FIREBASE_AUTH_URL: str = "https://identitytoolkit.googleapis.com/v1"
+    FIREBASE_TOKEN_URL: str = "https://securetoken.googleapis.com/v1"
+    FIREBASE_CERTS_URL: str = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+
+    # ID token verification cache
+    TOKEN_CACHE_SIZE: int = 10000
+    TOKEN_CACHE_MAX_TTL_SECONDS: float = 300.0
+    TOKEN_CLOCK_SKEW_SECONDS: int = 0
     
     # Supabase configuration
     SUPABASE_URL: Optional[str] = None
     SUPABASE_KEY: Optional[str] = None
 
+    # Profile read-through cache
+    PROFILE_CACHE_SIZE: int = 10000
+    PROFILE_CACHE_TTL_SECONDS: float = 60.0
+
+    # Outgoing HTTP client configuration
+    HTTP_TIMEOUT_SECONDS: float = 10.0
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_MAX_RETRIES: int = 2
+    HTTP_RETRY_BACKOFF_SECONDS: float = 0.2
+
+    # Inference batching configuration
+    INFERENCE_MAX_BATCH_SIZE: int = 16
+    INFERENCE_MAX_WAIT_MS: float = 10.0
+    INFERENCE_MAX_QUEUE_SIZE: int = 256
+    # Fair queuing: most images one client may have waiting, and how much of the
+    # queue anonymous callers may fill before they are turned away (503)
+    INFERENCE_MAX_QUEUE_PER_CLIENT: int = 64
+    INFERENCE_ANONYMOUS_QUEUE_SHARE: float = 0.5
+
+    # Per-client admission for /predict and /similar: token bucket refill rate (requests/second)
+    # and burst for signed-in users and, by IP, for anonymous callers. "memory" buckets are per
+    # worker; "redis" shares them through RATE_LIMIT_REDIS_URL (needs the redis package)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_USER_RATE: float = 5.0
+    RATE_LIMIT_USER_BURST: float = 20
+    RATE_LIMIT_IP_RATE: float = 2.0
+    RATE_LIMIT_IP_BURST: float = 10
+    # Images of /predict/batch, on top of the request itself: per-image rate and burst
+    RATE_LIMIT_BATCH_USER_RATE: float = 50.0
+    RATE_LIMIT_BATCH_USER_BURST: float = 1000
+    RATE_LIMIT_BATCH_IP_RATE: float = 10.0
+    RATE_LIMIT_BATCH_IP_BURST: float = 200
+    RATE_LIMIT_BACKEND: str = "memory"
+    RATE_LIMIT_REDIS_URL: str = "redis://localhost:6379/0"
+    # Take the client IP from X-Forwarded-For (only behind a proxy that sets it)
+    RATE_LIMIT_TRUST_FORWARDED_FOR: bool = False
+
+    # Inference executor configuration (0 threads = TensorFlow default)
+    INFERENCE_WORKERS: int = 1
+    INFERENCE_EXECUTOR_MAX_PENDING: int = 32
+    INFERENCE_RETRY_AFTER_SECONDS: int = 1
+    TF_INTRA_OP_THREADS: int = 0
+    TF_INTER_OP_THREADS: int = 0
+
+    # Inference backend: "keras", "tflite" (served from the version's model.tflite export)
+    # or "sidecar" (one shared inference process for all workers, see app/ml/sidecar.py)
+    INFERENCE_BACKEND: str = "keras"
+
+    # Model cascade: answer from the version's small first-stage model (train.py train-cascade)
+    # when its confidence clears the calibrated threshold (or this override), else from the full model
+    INFERENCE_CASCADE_ENABLED: bool = False
+    INFERENCE_CASCADE_THRESHOLD: Optional[float] = None
+
+    # Inference sidecar: Unix socket path (its directory must be private, mode 0700) or host:port,
+    # the backend it runs, the shared key both ends must know (required) and timeouts
+    INFERENCE_SIDECAR_ADDRESS: str = "/tmp/dino-inference/inference.sock"
+    INFERENCE_SIDECAR_BACKEND: str = "keras"
+    INFERENCE_SIDECAR_AUTHKEY: Optional[str] = None
+    INFERENCE_SIDECAR_TIMEOUT_SECONDS: float = 30.0
+    INFERENCE_SIDECAR_CONNECT_TIMEOUT_SECONDS: float = 120.0
+
+    # Model registry: how often workers check for a newly activated version (0 disables)
+    MODEL_REGISTRY_POLL_SECONDS: float = 30.0
+
+    # Prediction result cache keyed by upload hash + model (0 disables the memory tier,
+    # no path disables the SQLite disk tier)
+    PREDICTION_CACHE_SIZE: int = 1024
+    PREDICTION_CACHE_PATH: Optional[str] = None
+    PREDICTION_CACHE_DISK_MAX_ENTRIES: int = 100000
+
+    # Token required in the X-Admin-Token header for /admin endpoints (unset disables them)
+    ADMIN_API_TOKEN: Optional[str] = None
+
+    # Upload limits
+    MAX_UPLOAD_BYTES: int = 10 * 1024 * 1024
+
+    # Batch predictions: whole request size, size of each zip archive (spooled to disk),
+    # files per request and images in flight at once
+    MAX_BATCH_UPLOAD_BYTES: int = 512 * 1024 * 1024
+    BATCH_PREDICT_MAX_ARCHIVE_BYTES: int = 100 * 1024 * 1024
+    BATCH_PREDICT_MAX_FILES: int = 1000
+    BATCH_PREDICT_CONCURRENCY: int = 64
+
+    # Similar-image search: index location (default app/ml/data/similarity) and most results per query
+    SIMILARITY_INDEX_DIR: Optional[str] = None
+    SIMILARITY_MAX_RESULTS: int = 50
+
+    # Outgoing mail (no SMTP_SERVER disables it; username/password only when the server requires AUTH)
+    SMTP_SERVER: Optional[str] = None
+    SMTP_PORT: int = 587
+    SMTP_USERNAME: Optional[str] = None
+    SMTP_PASSWORD: Optional[str] = None
+    SMTP_STARTTLS: bool = True
+    SMTP_USE_SSL: bool = False
+    SMTP_TIMEOUT_SECONDS: float = 10.0
+    SMTP_IDLE_TIMEOUT_SECONDS: float = 30.0
+    SMTP_MAX_MESSAGES_PER_CONNECTION: int = 100
+    EMAIL_SENDER: Optional[str] = None
+
+    # Mail delivery queue: size, messages per batch, how long a batch waits to fill and retries
+    EMAIL_QUEUE_SIZE: int = 1000
+    EMAIL_BATCH_SIZE: int = 20
+    EMAIL_BATCH_WAIT_MS: float = 50.0
+    EMAIL_MAX_RETRIES: int = 5
+    EMAIL_RETRY_BACKOFF_SECONDS: float = 2.0
+
+    # Prediction history and upload counters, written to Supabase behind the response:
+    # flush interval, events per write, most events held in memory and where unwritten ones go at shutdown
+    USAGE_RECORDING_ENABLED: bool = True
+    USAGE_FLUSH_INTERVAL_SECONDS: float = 5.0
+    USAGE_FLUSH_MAX_ROWS: int = 500
+    USAGE_BUFFER_MAX_EVENTS: int = 100000
+    USAGE_SPILL_DIR: Optional[str] = "usage_spill"
+
+    # Bulk user import: most users per job, Firebase users per import call (max 1000),
+    # profile rows per insert, PBKDF2 rounds of the imported password hashes and where job status is kept
+    BULK_IMPORT_MAX_USERS: int = 10000
+    BULK_IMPORT_FIREBASE_BATCH_SIZE: int = 500
+    BULK_IMPORT_PROFILE_CHUNK_SIZE: int = 200
+    BULK_IMPORT_PBKDF2_ROUNDS: int = 10000
+    BULK_IMPORT_JOBS_DIR: str = "import_jobs"
+
+    # Sampling profiler for slow requests (can also be toggled at runtime via /admin/profiler)
+    PROFILER_ENABLED: bool = False
+    PROFILER_INTERVAL_MS: float = 10.0
+    PROFILER_SLOW_REQUEST_MS: float = 1000.0
+    PROFILER_OUTPUT_DIR: str = "profiles"
+
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -57,11 +204,16 @@ class Settings(BaseSettings):
                 self.SUPABASE_KEY
             ]):
                 raise ValueError("All environment variables are required in production mode")
+        if self.SERVICE_ROLE not in SERVICE_ROLES:
+            raise ValueError(f"SERVICE_ROLE must be one of {', '.join(SERVICE_ROLES)}")
+
+    @property
+    def serves_auth(self) -> bool:
+        return self.SERVICE_ROLE in (ALL_ROLE, AUTH_ROLE)
+
+    @property
+    def serves_predictions(self) -> bool:
+        return self.SERVICE_ROLE in (ALL_ROLE, PREDICT_ROLE)
 
 settings = Settings()
 
-# Para debugging solo en desarrollo
-if settings.ENVIRONMENT == "development":
-    print("Loaded settings:")
-    print(f"FIREBASE_PROJECT_ID: {settings.FIREBASE_PROJECT_ID}")
-    print(f"SUPABASE_URL: {settings.SUPABASE_URL}") 
\ No newline at end of file
@@ -1,20 +1,31 @@
-import firebase_admin
-from firebase_admin import credentials, auth
+import threading
 from app.core.config import settings
 
-cred = credentials.Certificate({
-    "type": "service_account",
-    "project_id": settings.FIREBASE_PROJECT_ID,
-    "private_key_id": settings.FIREBASE_PRIVATE_KEY_ID,
-    "private_key": settings.FIREBASE_PRIVATE_KEY,
-    "client_email": settings.FIREBASE_CLIENT_EMAIL,
-    "client_id": settings.FIREBASE_CLIENT_ID,
-    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-    "token_uri": "https://oauth2.googleapis.com/token",
-    "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-    "client_x509_cert_url": settings.FIREBASE_CLIENT_CERT_URL
-})
+_lock = threading.Lock()
+
+def firebase_credentials():
+    from firebase_admin import credentials
+    return credentials.Certificate({
+        "type": "service_account",
+        "project_id": settings.FIREBASE_PROJECT_ID,
+        "private_key_id": settings.FIREBASE_PRIVATE_KEY_ID,
+        "private_key": settings.FIREBASE_PRIVATE_KEY,
+        "client_email": settings.FIREBASE_CLIENT_EMAIL,
+        "client_id": settings.FIREBASE_CLIENT_ID,
+        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+        "client_x509_cert_url": settings.FIREBASE_CLIENT_CERT_URL
+    })
 
 def initialize_firebase():
-    firebase_app = firebase_admin.initialize_app(cred)
-    return firebase_app
+    """
+    Initializes the default Firebase Admin app the first time it is called
+    (at startup of the workers that serve auth) and returns it.
+    """
+    import firebase_admin
+    with _lock:
+        try:
+            return firebase_admin.get_app()
+        except ValueError:
+            return firebase_admin.initialize_app(firebase_credentials())
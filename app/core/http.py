@@ -0,0 +1,60 @@
+import asyncio
+import logging
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+
+def _create_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(settings.HTTP_TIMEOUT_SECONDS),
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+    )
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the shared keep-alive client, creating it on first use.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+    return _client
+
+async def start_http_client():
+    get_http_client()
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def post_json(url: str, payload: dict, **kwargs) -> httpx.Response:
+    """
+    POSTs a JSON payload through the shared client, retrying connection
+    errors and transient upstream statuses with exponential backoff.
+    """
+    client = get_http_client()
+    attempt = 0
+    while True:
+        try:
+            response = await client.post(url, json=payload, **kwargs)
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= settings.HTTP_MAX_RETRIES:
+                return response
+            logger.warning(f"Retrying POST {url.split('?')[0]} after status {response.status_code}")
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+            if attempt >= settings.HTTP_MAX_RETRIES:
+                raise
+            logger.warning(f"Retrying POST {url.split('?')[0]} after {type(e).__name__}")
+        await asyncio.sleep(settings.HTTP_RETRY_BACKOFF_SECONDS * (2 ** attempt))
+        attempt += 1
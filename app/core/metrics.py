@@ -0,0 +1,153 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Buckets from sub-millisecond cache hits up to slow cold inferences
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    "dino_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "dino_http_requests_in_flight",
+    "HTTP requests currently being served",
+)
+STAGE_LATENCY = Histogram(
+    "dino_stage_duration_seconds",
+    "Time spent in each stage of a request (upload read, decode, inference, auth calls...)",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    "dino_stage_errors_total",
+    "Stages that ended with an exception",
+    ["stage"],
+)
+INFERENCE_BATCH_SIZE = Histogram(
+    "dino_inference_batch_size",
+    "Images per forward pass",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+CASCADE_IMAGES = Counter(
+    "dino_cascade_images_total",
+    "Images answered by the cascade's first stage or escalated to the full model",
+    ["stage"],
+)
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Times a block as one stage of the current request, e.g.
+
+        with stage("predict.decode"):
+            img_array = await run_in_threadpool(decode_image, content)
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.labels(name).inc()
+        raise
+    finally:
+        STAGE_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+def observe_stage(name: str, seconds: float):
+    STAGE_LATENCY.labels(name).observe(seconds)
+
+class RuntimeCollector:
+    """
+    Reports values that already live in the running services (queue depths,
+    cache hit rates, model state) at scrape time instead of mirroring them.
+    Each source returns prometheus metric families.
+    """
+
+    def __init__(self):
+        self._sources: Dict[str, Callable[[], Iterable]] = {}
+
+    def add_source(self, name: str, source: Callable[[], Iterable]):
+        self._sources[name] = source
+
+    def collect(self):
+        for source in list(self._sources.values()):
+            try:
+                families = list(source())
+            except Exception:
+                # A broken source must not break the whole scrape
+                continue
+            yield from families
+
+runtime_collector = RuntimeCollector()
+REGISTRY.register(runtime_collector)
+
+def labeled_gauge(name: str, documentation: str, label: str, values: Dict[str, float]) -> GaugeMetricFamily:
+    family = GaugeMetricFamily(name, documentation, labels=[label])
+    for label_value, value in values.items():
+        family.add_metric([label_value], value)
+    return family
+
+def labeled_counter(name: str, documentation: str, label: str, values: Dict[str, float]) -> CounterMetricFamily:
+    family = CounterMetricFamily(name, documentation, labels=[label])
+    for label_value, value in values.items():
+        family.add_metric([label_value], value)
+    return family
+
+def cache_metrics(caches: Dict[str, dict]) -> List:
+    """
+    Families for TTLCache-style stats() dicts, keyed by cache name.
+    """
+    return [
+        labeled_counter("dino_cache_hits", "Cache hits", "cache", {name: stats["hits"] for name, stats in caches.items()}),
+        labeled_counter("dino_cache_misses", "Cache misses", "cache", {name: stats["misses"] for name, stats in caches.items()}),
+        labeled_gauge("dino_cache_hit_ratio", "Cache hit ratio since start", "cache", {name: stats["hit_rate"] for name, stats in caches.items()}),
+        labeled_gauge("dino_cache_entries", "Entries currently cached", "cache", {
+            name: stats["size"] for name, stats in caches.items() if "size" in stats
+        }),
+    ]
+
+def _route_of(scope: Scope) -> str:
+    route = scope.get("route")
+    # Unmatched paths share one label so random URLs can't explode cardinality
+    return getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+    """
+    Records latency and status per route template and the number of requests
+    in flight. With a profiler attached, requests slower than its threshold
+    get the stack samples taken while they ran written out as a flame graph.
+    """
+
+    def __init__(self, app: ASGIApp, profiler=None):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        token = self.profiler.request_started() if self.profiler is not None else None
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUESTS_IN_FLIGHT.dec()
+            route = _route_of(scope)
+            REQUEST_LATENCY.labels(scope.get("method", ""), route, str(status["code"])).observe(elapsed)
+            if token is not None:
+                self.profiler.request_finished(token, f"{scope.get('method', '')} {route}", elapsed)
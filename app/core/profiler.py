@@ -0,0 +1,146 @@
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class SamplingProfiler:
+    """
+    Opt-in statistical profiler for slow requests, built on
+    sys._current_frames() so it needs no extra dependency.
+
+    While enabled and at least one request is in flight, a daemon thread
+    samples every thread's stack each interval_ms into a bounded ring buffer.
+    When a request takes longer than slow_request_ms, the samples taken while
+    it ran are aggregated into folded stacks ("thread;frame;frame count" per
+    line, the input of flamegraph.pl and speedscope) and written to output_dir.
+    Samples cover the whole process, so the event loop and the inference
+    workers both show up.
+    """
+
+    def __init__(
+        self,
+        interval_ms: float = 10.0,
+        slow_request_ms: float = 1000.0,
+        output_dir: str = "profiles",
+        max_samples: int = 50000,
+        max_files: int = 100,
+    ):
+        self.interval = interval_ms / 1000.0
+        self.slow_request_ms = slow_request_ms
+        self.output_dir = output_dir
+        self.max_files = max_files
+        self._samples = deque(maxlen=max_samples)
+        self._enabled = False
+        self._active = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    def enable(self, slow_request_ms: Optional[float] = None):
+        if slow_request_ms is not None:
+            self.slow_request_ms = slow_request_ms
+        with self._lock:
+            self._enabled = True
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        logger.info(f"Sampling profiler enabled (slow requests >= {self.slow_request_ms}ms)")
+
+    def disable(self):
+        with self._lock:
+            self._enabled = False
+            self._samples.clear()
+        self._wake.set()
+        logger.info("Sampling profiler disabled")
+
+    def request_started(self) -> Optional[float]:
+        if not self._enabled:
+            return None
+        with self._lock:
+            self._active += 1
+        self._wake.set()
+        return time.monotonic()
+
+    def request_finished(self, started: float, name: str, elapsed: float):
+        with self._lock:
+            self._active -= 1
+        if not self._enabled or elapsed * 1000 < self.slow_request_ms:
+            return
+        stacks = Counter(stack for taken_at, stack in list(self._samples) if taken_at >= started)
+        if stacks:
+            self._write(name, elapsed, stacks)
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while self._enabled:
+            if self._active <= 0:
+                self._wake.wait(1.0)
+                self._wake.clear()
+                continue
+            now = time.monotonic()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                self._samples.append((now, self._fold(names.get(ident, str(ident)), frame)))
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _fold(thread_name: str, frame) -> str:
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        frames.append(thread_name)
+        return ";".join(reversed(frames))
+
+    def _write(self, name: str, elapsed: float, stacks: Counter):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")
+            filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(elapsed * 1000)}ms-{slug}.folded"
+            with open(os.path.join(self.output_dir, filename), "w") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            self._prune()
+            logger.info(f"Slow request {name} ({elapsed * 1000:.0f}ms) profiled to {filename}")
+        except OSError as e:
+            logger.warning(f"Could not write profile: {str(e)}")
+
+    def _prune(self):
+        files = self.list_profiles()
+        for filename in files[:-self.max_files] if len(files) > self.max_files else []:
+            os.remove(os.path.join(self.output_dir, filename))
+
+    def list_profiles(self) -> List[str]:
+        if not os.path.isdir(self.output_dir):
+            return []
+        return sorted(name for name in os.listdir(self.output_dir) if name.endswith(".folded"))
+
+    def status(self) -> dict:
+        return {
+            "enabled": self._enabled,
+            "interval_ms": self.interval * 1000,
+            "slow_request_ms": self.slow_request_ms,
+            "output_dir": self.output_dir,
+            "profiles": self.list_profiles(),
+        }
+
+profiler = SamplingProfiler(
+    interval_ms=settings.PROFILER_INTERVAL_MS,
+    slow_request_ms=settings.PROFILER_SLOW_REQUEST_MS,
+    output_dir=settings.PROFILER_OUTPUT_DIR,
+)
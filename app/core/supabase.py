@@ -1,4 +1,20 @@
-from supabase import create_client, Client
+import threading
 from app.core.config import settings
 
-supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY) 
\ No newline at end of file
+_client = None
+_lock = threading.Lock()
+
+def get_supabase():
+    """
+    Shared Supabase client, created on first use: importing supabase and
+    building the client is a good part of startup, and auth-less paths
+    never need it.
+    """
+    global _client
+    if _client is None:
+        # Called from the threads that run the blocking queries
+        with _lock:
+            if _client is None:
+                from supabase import create_client
+                _client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+    return _client
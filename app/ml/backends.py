@@ -0,0 +1,158 @@
+import logging
+import threading
+from typing import TYPE_CHECKING, Dict, Optional
+
+import numpy as np
+
+from app.core.metrics import CASCADE_IMAGES
+
+if TYPE_CHECKING:
+    import tensorflow as tf
+
+logger = logging.getLogger(__name__)
+
+KERAS_BACKEND = "keras"
+TFLITE_BACKEND = "tflite"
+# Forward passes run in the shared inference process (app/ml/sidecar.py)
+SIDECAR_BACKEND = "sidecar"
+CASCADE_BACKEND = "cascade"
+
+class KerasBackend:
+    """
+    Runs the full Keras model.
+    """
+
+    name = KERAS_BACKEND
+
+    def __init__(self, model: "tf.keras.Model"):
+        self.model = model
+        self._embedder = None
+        self._embedding_fingerprint: Optional[str] = None
+        self._embedder_lock = threading.Lock()
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model.predict_on_batch(batch))
+
+    def _get_embedder(self):
+        with self._embedder_lock:
+            if self._embedder is None:
+                from app.ml.features import base_fingerprint
+                from app.ml.similarity import create_embedder
+                embedder = create_embedder(self.model)
+                self._embedding_fingerprint = base_fingerprint(embedder)
+                self._embedder = embedder
+            return self._embedder
+
+    @property
+    def embedding_fingerprint(self) -> str:
+        self._get_embedder()
+        return self._embedding_fingerprint
+
+    def embed(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Pooled MobileNetV2 features of the batch, from the same weights.
+        """
+        return np.asarray(self._get_embedder().predict_on_batch(batch))
+
+def _load_interpreter_class():
+    # The standalone runtime keeps the worker footprint small; fall back to
+    # the interpreter bundled with TensorFlow when it isn't installed.
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+class TFLiteBackend:
+    """
+    Runs an exported TFLite model (optionally float16/int8 quantized).
+
+    An interpreter is not thread-safe and resizing its input reallocates all
+    tensors, so one interpreter is kept per power-of-two batch bucket; each
+    batch is zero-padded up to its bucket and runs under that bucket's lock.
+    """
+
+    name = TFLITE_BACKEND
+
+    def __init__(self, model_path: str, num_threads: Optional[int] = None):
+        self.model_path = model_path
+        self.num_threads = num_threads or None
+        self._interpreter_class = _load_interpreter_class()
+        with open(model_path, "rb") as f:
+            self._model_content = f.read()
+        self._interpreters: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+        self.model = None
+
+    def _bucket(self, batch_size: int) -> int:
+        return 1 << (batch_size - 1).bit_length()
+
+    def _interpreter_for(self, bucket: int) -> tuple:
+        with self._lock:
+            entry = self._interpreters.get(bucket)
+            if entry is None:
+                interpreter = self._interpreter_class(
+                    model_content=self._model_content, num_threads=self.num_threads
+                )
+                input_details = interpreter.get_input_details()[0]
+                interpreter.resize_tensor_input(
+                    input_details["index"], [bucket, *input_details["shape"][1:]]
+                )
+                interpreter.allocate_tensors()
+                entry = (
+                    interpreter,
+                    threading.Lock(),
+                    input_details["index"],
+                    interpreter.get_output_details()[0]["index"],
+                )
+                self._interpreters[bucket] = entry
+            return entry
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        batch_size = len(batch)
+        bucket = self._bucket(batch_size)
+        if bucket != batch_size:
+            padding = np.zeros((bucket - batch_size, *batch.shape[1:]), dtype=batch.dtype)
+            batch = np.concatenate([batch, padding])
+        interpreter, lock, input_index, output_index = self._interpreter_for(bucket)
+        with lock:
+            interpreter.set_tensor(input_index, batch.astype(np.float32, copy=False))
+            interpreter.invoke()
+            return interpreter.get_tensor(output_index)[:batch_size].copy()
+
+class CascadeBackend:
+    """
+    Two-stage inference: every image goes through a small first-stage model
+    and only those whose top softmax score is below threshold are sent on
+    to the full model. Embeddings always come from the full model.
+    Serving counts both stages in dino_cascade_images_total; offline
+    evaluation passes record_metrics=False to stay out of it.
+    """
+
+    name = CASCADE_BACKEND
+
+    def __init__(self, first_stage, full, threshold: float, record_metrics: bool = True):
+        self.first_stage = first_stage
+        self.full = full
+        self.threshold = threshold
+        self.record_metrics = record_metrics
+        self.model = full.model
+
+    @property
+    def embedding_fingerprint(self) -> Optional[str]:
+        return getattr(self.full, "embedding_fingerprint", None)
+
+    def embed(self, batch: np.ndarray) -> np.ndarray:
+        return self.full.embed(batch)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        probabilities = np.array(self.first_stage.predict(batch), dtype=np.float32)
+        escalate = probabilities.max(axis=1) < self.threshold
+        escalated = int(escalate.sum())
+        if escalated:
+            probabilities[escalate] = self.full.predict(batch[escalate])
+        if self.record_metrics:
+            CASCADE_IMAGES.labels("first_stage").inc(len(batch) - escalated)
+            CASCADE_IMAGES.labels("escalated").inc(escalated)
+        return probabilities
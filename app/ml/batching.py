@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Hashable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import observe_stage
+from app.ml.executor import ClientQueueFullError, InferenceExecutor, QueueFullError, inference_executor
+from app.ml.predict import predict_batch
+from app.ml.similarity import similar_images_batch
+
+logger = logging.getLogger(__name__)
+
+class FairQueue:
+    """
+    One FIFO per client, served round robin: each get takes the next item
+    of the client whose turn it is, so a client with hundreds of images
+    queued delays everyone else by at most one image per batch slot instead
+    of all of them.
+    """
+
+    def __init__(self, maxsize: int, max_per_client: Optional[int] = None):
+        self.maxsize = maxsize
+        self.max_per_client = max_per_client or maxsize
+        self._queues: "OrderedDict[Hashable, Deque]" = OrderedDict()
+        self._size = 0
+        self._not_empty = asyncio.Event()
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    @property
+    def clients(self) -> int:
+        return len(self._queues)
+
+    def put_nowait(self, client: Hashable, entry: Any, limit: Optional[int] = None):
+        """
+        limit rejects the entry once the whole queue holds that many items
+        (lower than maxsize for callers to turn away first under load).
+        """
+        if self._size >= min(self.maxsize, limit if limit is not None else self.maxsize):
+            raise QueueFullError("Inference queue is full")
+        queue = self._queues.get(client)
+        if queue is None:
+            queue = self._queues[client] = deque()
+        elif len(queue) >= self.max_per_client:
+            raise ClientQueueFullError(f"Too many requests waiting (at most {self.max_per_client} per client)")
+        queue.append(entry)
+        self._size += 1
+        self._not_empty.set()
+
+    def get_nowait(self) -> Any:
+        if not self._size:
+            raise asyncio.QueueEmpty
+        client, queue = next(iter(self._queues.items()))
+        entry = queue.popleft()
+        self._size -= 1
+        if queue:
+            self._queues.move_to_end(client)
+        else:
+            del self._queues[client]
+        return entry
+
+    async def get(self) -> Any:
+        while not self._size:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        return self.get_nowait()
+
+    def drain(self) -> List[Any]:
+        entries = [entry for queue in self._queues.values() for entry in queue]
+        self._queues.clear()
+        self._size = 0
+        return entries
+
+class BatchingPredictor:
+    """
+    Collects concurrent inference requests into micro-batches.
+
+    Requests are queued until either max_batch_size items are waiting or
+    max_wait_ms has passed since the first one arrived, then a single forward
+    pass runs over the whole batch and each caller receives its own result.
+    Batches run on the inference executor, at most one per executor worker at
+    a time; while they run, new requests keep accumulating for the next one.
+    Requests are taken from each client's queue in turn (FairQueue).
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[List[Any]], List[dict]],
+        executor: InferenceExecutor,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10.0,
+        max_queue_size: int = 256,
+        max_queue_per_client: Optional[int] = None,
+    ):
+        self.predict_fn = predict_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_size = max_queue_size
+        self.max_queue_per_client = max_queue_per_client
+        self._queue: Optional[FairQueue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._dispatching = set()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def queued_clients(self) -> int:
+        return self._queue.clients if self._queue is not None else 0
+
+    def start(self):
+        """Starts the batching loop on the running event loop."""
+        if self._task is not None and not self._task.done():
+            return
+        self._queue = FairQueue(self.max_queue_size, self.max_queue_per_client)
+        self._slots = asyncio.Semaphore(self.executor.max_workers)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops the batching loop and fails any request still waiting."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._queue is not None:
+            for _, future, _ in self._queue.drain():
+                if not future.done():
+                    future.set_exception(RuntimeError("Inference service is shutting down"))
+
+    async def submit(self, item: Any, client: Hashable = None, queue_limit: Optional[int] = None) -> dict:
+        """
+        Queues one preprocessed image on behalf of client and waits for its
+        prediction. Raises QueueFullError when the queue holds max_queue_size
+        (or queue_limit) items, ClientQueueFullError when the client already
+        has max_queue_per_client waiting.
+        """
+        if self._task is None or self._task.done():
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(client, (item, future, time.perf_counter()), queue_limit)
+        return await future
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future, float]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            # Skip callers that went away while waiting in the queue
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatching.add(task)
+            task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future, float]]):
+        dispatched_at = time.perf_counter()
+        for _, _, enqueued_at in batch:
+            observe_stage("inference.queue_wait", dispatched_at - enqueued_at)
+        try:
+            results = await self.executor.run(self.predict_fn, [item for item, _, _ in batch])
+        except Exception as e:
+            logger.error(f"Batch inference failed: {str(e)}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+inference_batcher = BatchingPredictor(
+    predict_batch,
+    inference_executor,
+    max_batch_size=settings.INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=settings.INFERENCE_MAX_WAIT_MS,
+    max_queue_size=settings.INFERENCE_MAX_QUEUE_SIZE,
+    max_queue_per_client=settings.INFERENCE_MAX_QUEUE_PER_CLIENT,
+)
+
+# Similar-image queries share the executor; each batch is one embedding pass and one index scan
+similarity_batcher = BatchingPredictor(
+    similar_images_batch,
+    inference_executor,
+    max_batch_size=settings.INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=settings.INFERENCE_MAX_WAIT_MS,
+    max_queue_size=settings.INFERENCE_MAX_QUEUE_SIZE,
+    max_queue_per_client=settings.INFERENCE_MAX_QUEUE_PER_CLIENT,
+)
@@ -0,0 +1,347 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from app.ml.predict import IMAGE_SCALE, IMAGE_SIZE, decode_image_uint8
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+DATASET_DIR = os.path.join(DATA_DIR, 'dataset')
+SHARDS_DIR = os.path.join(DATA_DIR, 'shards')
+SHARDS_MANIFEST = 'manifest.json'
+SHARDS_FORMAT_VERSION = 2
+SPLITS = ('train', 'validation')
+IMAGES_PER_SHARD = 128
+
+def list_images(split: str, class_names: List[str]) -> List[Tuple[str, int]]:
+    """
+    Returns (path, label) pairs for dataset/<split>, labels indexing class_names.
+    """
+    items = []
+    for label, class_name in enumerate(class_names):
+        class_dir = os.path.join(DATASET_DIR, split, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        for filename in sorted(os.listdir(class_dir)):
+            items.append((os.path.join(class_dir, filename), label))
+    return items
+
+def get_class_names() -> List[str]:
+    """
+    Class names are the sub-directories of dataset/train, in sorted order
+    (the same order flow_from_directory assigns indices in).
+    """
+    train_dir = os.path.join(DATASET_DIR, 'train')
+    return sorted(
+        name for name in os.listdir(train_dir)
+        if os.path.isdir(os.path.join(train_dir, name))
+    )
+
+def source_fingerprint(class_names: List[str]) -> str:
+    """
+    Cheap fingerprint of the source images (path, size, mtime) used to tell
+    whether the shards are stale without reading any image.
+    """
+    digest = hashlib.sha1()
+    for split in SPLITS:
+        for path, label in list_images(split, class_names):
+            stat = os.stat(path)
+            digest.update(f"{os.path.relpath(path, DATASET_DIR)}:{label}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+def content_fingerprint(class_names: List[str], splits: dict) -> str:
+    """
+    Fingerprint of what training sees: the classes and each split's image
+    contents and labels. Touching or renaming a file doesn't change it.
+    """
+    digest = hashlib.sha1(json.dumps(class_names).encode())
+    for split in SPLITS:
+        for key, labels in sorted(splits[split]["labels"].items()):
+            digest.update(f"{split}:{key}:{sorted(labels)}\n".encode())
+    return digest.hexdigest()
+
+def read_manifest(shards_dir: str = SHARDS_DIR) -> Optional[dict]:
+    path = os.path.join(shards_dir, SHARDS_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SHARDS_FORMAT_VERSION or manifest.get("image_size") != list(IMAGE_SIZE):
+        return None
+    return manifest
+
+def _file_key(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def _load_example(item: Tuple[str, str]) -> bytes:
+    path, key = item
+    with open(path, 'rb') as f:
+        image = decode_image_uint8(f.read(), IMAGE_SIZE)
+    return _serialize(image.tobytes(), key)
+
+def _serialize(image: bytes, key: str) -> bytes:
+    return tf.train.Example(features=tf.train.Features(feature={
+        'image': tf.train.Feature(bytes_list=tf.train.BytesList(value=[image])),
+        'key': tf.train.Feature(bytes_list=tf.train.BytesList(value=[key.encode()])),
+    })).SerializeToString()
+
+def _shard_index(shard_name: str) -> int:
+    return int(shard_name.rsplit('-', 1)[1].split('.')[0])
+
+def _write_shard(path: str, records: List[bytes]):
+    tmp_path = path + '.tmp'
+    with tf.io.TFRecordWriter(tmp_path) as writer:
+        for record in records:
+            writer.write(record)
+    os.replace(tmp_path, path)
+
+def build_shards(
+    shards_dir: str = SHARDS_DIR,
+    images_per_shard: int = IMAGES_PER_SHARD,
+    workers: Optional[int] = None,
+    rebuild: bool = False,
+) -> dict:
+    """
+    Decodes the images of dataset/train and dataset/validation, resizes
+    them to the model input size and packs the uint8 pixels into TFRecord
+    shards, so training never decodes a JPEG again.
+
+    Records are keyed by the image's content hash and carry no label; the
+    manifest maps each split's keys to the labels of the files with that
+    content. An update only decodes
+    images whose content isn't in that split's shards yet and appends them
+    to its last shard and new ones. Files whose size and mtime are
+    unchanged aren't even re-read. Records of removed images are skipped
+    when reading and dropped when their shard is rewritten or empties.
+    rebuild starts over.
+    """
+    class_names = get_class_names()
+    previous = None if rebuild else read_manifest(shards_dir)
+    if previous is None:
+        shutil.rmtree(shards_dir, ignore_errors=True)
+        previous = {"sources": {}, "splits": {split: {"shards": [], "shard_keys": {}} for split in SPLITS}}
+    os.makedirs(shards_dir, exist_ok=True)
+
+    manifest = {
+        "format_version": SHARDS_FORMAT_VERSION,
+        "image_size": list(IMAGE_SIZE),
+        "class_names": class_names,
+        "source_fingerprint": source_fingerprint(class_names),
+        "sources": {},
+        "splits": {},
+    }
+    removed_shards = []
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for split in SPLITS:
+            # Content keys, hashing only files that changed since the last build
+            items = list_images(split, class_names)
+            keys = [None] * len(items)
+            to_hash = []
+            for index, (path, _) in enumerate(items):
+                relpath = os.path.relpath(path, DATASET_DIR)
+                stat = os.stat(path)
+                source = previous["sources"].get(relpath)
+                if source and source["size"] == stat.st_size and source["mtime_ns"] == stat.st_mtime_ns:
+                    keys[index] = source["key"]
+                else:
+                    to_hash.append(index)
+                manifest["sources"][relpath] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            for index, key in zip(to_hash, pool.map(_file_key, [items[index][0] for index in to_hash])):
+                keys[index] = key
+            # Identical files are stored once and read back once per file
+            labels, paths = {}, {}
+            for (path, label), key in zip(items, keys):
+                manifest["sources"][os.path.relpath(path, DATASET_DIR)]["key"] = key
+                labels.setdefault(key, []).append(label)
+                paths[key] = path
+
+            # Keep shards that still hold live records, then append the new images
+            shards, shard_keys = [], {}
+            for shard_name in previous["splits"][split]["shards"]:
+                if any(key in labels for key in previous["splits"][split]["shard_keys"][shard_name]):
+                    shards.append(shard_name)
+                    shard_keys[shard_name] = previous["splits"][split]["shard_keys"][shard_name]
+                else:
+                    removed_shards.append(shard_name)
+            stored = {key for shard_name in shards for key in shard_keys[shard_name]}
+            new_keys = [key for key in labels if key not in stored]
+            decoded = len(new_keys)
+            next_index = max((_shard_index(name) + 1 for name in shards), default=0)
+            if new_keys and shards and len(shard_keys[shards[-1]]) < images_per_shard:
+                # Top up the last shard: its records are copied as they are, dead ones dropped
+                shard_name = shards.pop()
+                kept = [
+                    (key, record) for key, record in zip(
+                        shard_keys.pop(shard_name),
+                        tf.data.TFRecordDataset(os.path.join(shards_dir, shard_name)).as_numpy_iterator(),
+                    ) if key in labels
+                ]
+                next_index = _shard_index(shard_name)
+            else:
+                kept = []
+            while new_keys:
+                batch = new_keys[:images_per_shard - len(kept)]
+                new_keys = new_keys[len(batch):]
+                records = [record for _, record in kept]
+                records.extend(pool.map(_load_example, [(paths[key], key) for key in batch]))
+                shard_name = f"{split}-{next_index:05d}.tfrecord"
+                _write_shard(os.path.join(shards_dir, shard_name), records)
+                shards.append(shard_name)
+                shard_keys[shard_name] = [key for key, _ in kept] + batch
+                next_index += 1
+                kept = []
+            manifest["splits"][split] = {
+                "count": len(items),
+                "shards": shards,
+                "shard_keys": shard_keys,
+                "labels": labels,
+            }
+            logger.info(f"{split}: {len(items)} images in {len(shards)} shards, {decoded} newly decoded")
+
+    manifest["fingerprint"] = content_fingerprint(class_names, manifest["splits"])
+    tmp_path = os.path.join(shards_dir, SHARDS_MANIFEST + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(shards_dir, SHARDS_MANIFEST))
+    for shard_name in removed_shards:
+        os.remove(os.path.join(shards_dir, shard_name))
+    return manifest
+
+def ensure_shards(shards_dir: str = SHARDS_DIR) -> dict:
+    """
+    Returns the shard manifest, bringing the shards up to date first if
+    they are missing or the source images changed.
+    """
+    manifest = read_manifest(shards_dir)
+    class_names = get_class_names()
+    if (
+        manifest is None
+        or manifest["class_names"] != class_names
+        or manifest["source_fingerprint"] != source_fingerprint(class_names)
+    ):
+        manifest = build_shards(shards_dir)
+    return manifest
+
+def _parse(serialized):
+    features = tf.io.parse_single_example(serialized, {
+        'image': tf.io.FixedLenFeature([], tf.string),
+        'key': tf.io.FixedLenFeature([], tf.string),
+    })
+    image = tf.reshape(tf.io.decode_raw(features['image'], tf.uint8), (*IMAGE_SIZE, 3))
+    return image, features['key']
+
+def raw_dataset(split: str, manifest: dict, shards_dir: str = SHARDS_DIR, deterministic: bool = True) -> tf.data.Dataset:
+    """
+    (uint8 image, label, key) examples of a split, read from all shards in
+    parallel, one per source file. Labels come from the manifest; records
+    of images that are no longer in the split are skipped.
+    """
+    labels = manifest["splits"][split]["labels"]
+    table = tf.lookup.StaticHashTable(
+        tf.lookup.KeyValueTensorInitializer(
+            tf.constant(list(labels), dtype=tf.string),
+            tf.constant([" ".join(map(str, values)) for values in labels.values()], dtype=tf.string),
+        ),
+        default_value="",
+    )
+
+    def parse(serialized):
+        image, key = _parse(serialized)
+        labels = tf.strings.to_number(tf.strings.split(table.lookup(key)), tf.int64)
+        copies = tf.shape(labels)[0]
+        return tf.repeat(image[None], copies, axis=0), labels, tf.repeat(key[None], copies, axis=0)
+
+    files = [os.path.join(shards_dir, shard) for shard in manifest["splits"][split]["shards"]]
+    return tf.data.Dataset.from_tensor_slices(tf.constant(files, dtype=tf.string)).interleave(
+        tf.data.TFRecordDataset,
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=deterministic,
+    ).map(parse, num_parallel_calls=tf.data.AUTOTUNE, deterministic=deterministic).unbatch()
+
+def augment_batch(images: tf.Tensor, rotation_degrees: float = 20, shift: float = 0.2) -> tf.Tensor:
+    """
+    Batch-wise equivalent of the ImageDataGenerator augmentation (random
+    rotation, width/height shifts, horizontal flips, nearest fill). Rotation
+    and shift are composed into one projective transform per image, so the
+    whole batch is resampled in a single op.
+    """
+    shape = tf.shape(images)
+    batch = shape[0]
+    height = tf.cast(shape[1], tf.float32)
+    width = tf.cast(shape[2], tf.float32)
+
+    flip = tf.random.uniform([batch]) < 0.5
+    images = tf.where(flip[:, None, None, None], tf.reverse(images, axis=[2]), images)
+
+    angle = tf.random.uniform([batch], -rotation_degrees, rotation_degrees) * (np.pi / 180)
+    dx = tf.random.uniform([batch], -shift, shift) * width
+    dy = tf.random.uniform([batch], -shift, shift) * height
+    cos, sin = tf.cos(angle), tf.sin(angle)
+    # Output pixel -> input pixel: undo the shift, then rotate about the centre
+    x_offset = ((width - 1) - (cos * (width - 1) - sin * (height - 1))) / 2
+    y_offset = ((height - 1) - (sin * (width - 1) + cos * (height - 1))) / 2
+    zeros = tf.zeros_like(angle)
+    transforms = tf.stack([
+        cos, -sin, -cos * dx + sin * dy + x_offset,
+        sin, cos, -sin * dx - cos * dy + y_offset,
+        zeros, zeros,
+    ], axis=1)
+    return tf.raw_ops.ImageProjectiveTransformV3(
+        images=images,
+        transforms=transforms,
+        output_shape=shape[1:3],
+        fill_value=0.0,
+        interpolation='BILINEAR',
+        fill_mode='NEAREST',
+    )
+
+def make_dataset(
+    split: str,
+    manifest: dict,
+    batch_size: int = 32,
+    training: bool = False,
+    shards_dir: str = SHARDS_DIR,
+) -> tf.data.Dataset:
+    """
+    Input pipeline for model.fit: parallel shard reads and parsing, an
+    in-memory cache of the compact uint8 images, shuffling, vectorized
+    augmentation on whole batches and prefetching. Yields float images
+    scaled like serving and one-hot labels.
+    """
+    num_classes = len(manifest["class_names"])
+    dataset = raw_dataset(split, manifest, shards_dir, deterministic=not training)
+    dataset = dataset.map(lambda image, label, key: (image, label)).cache()
+    if training:
+        dataset = dataset.shuffle(manifest["splits"][split]["count"], reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+
+    def to_model_input(images, labels):
+        images = tf.cast(images, tf.float32) * IMAGE_SCALE
+        if training:
+            images = augment_batch(images)
+        return images, tf.one_hot(labels, num_classes)
+
+    return dataset.map(to_model_input, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+def shards_summary(manifest: dict) -> dict:
+    return {
+        "fingerprint": manifest["fingerprint"],
+        "class_names": manifest["class_names"],
+        "splits": {
+            split: {"count": info["count"], "shards": len(info["shards"])}
+            for split, info in manifest["splits"].items()
+        },
+    }
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(shards_summary(build_shards()), indent=2))
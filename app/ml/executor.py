@@ -0,0 +1,80 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    """Raised when the inference queue cannot accept more work."""
+
+class ClientQueueFullError(QueueFullError):
+    """Raised when one client already has as many requests waiting as it may."""
+
+def configure_tensorflow_threads(intra_op_threads: int, inter_op_threads: int):
+    """
+    Sets TensorFlow's intra-op and inter-op thread pools. Must run before the
+    TensorFlow runtime is initialized (i.e. before the model is loaded);
+    0 keeps TensorFlow's default.
+    """
+    import tensorflow as tf
+
+    try:
+        if intra_op_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        if inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError as e:
+        logger.warning(f"Could not configure TensorFlow threads: {str(e)}")
+
+class InferenceExecutor:
+    """
+    Bounded thread pool that runs blocking ML work off the event loop.
+
+    At most max_workers calls run at once and at most max_pending calls may be
+    queued or running; beyond that run() fails fast with QueueFullError so the
+    caller can shed load instead of piling up requests.
+    """
+
+    def __init__(self, max_workers: int = 1, max_pending: int = 32):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pending = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="inference"
+            )
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if self._pending >= self.max_pending:
+            raise QueueFullError("Inference queue is full")
+        if self._executor is None:
+            self.start()
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(fn, *args, **kwargs)
+            )
+        finally:
+            self._pending -= 1
+
+inference_executor = InferenceExecutor(
+    max_workers=settings.INFERENCE_WORKERS,
+    max_pending=settings.INFERENCE_EXECUTOR_MAX_PENDING,
+)
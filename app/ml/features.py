@@ -0,0 +1,126 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from app.ml.dataset import SHARDS_DIR, raw_dataset
+from app.ml.predict import IMAGE_SCALE, IMAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+FEATURES_DIR = os.path.join(DATA_DIR, 'features')
+FEATURES_FILE = 'features.f32'
+KEYS_FILE = 'keys.json'
+
+def create_feature_extractor(base_model: tf.keras.Model) -> tf.keras.Model:
+    """
+    The frozen part of the classifier: convolutional base + global pooling.
+    """
+    pooled = tf.keras.layers.GlobalAveragePooling2D()(base_model.output)
+    return tf.keras.Model(inputs=base_model.input, outputs=pooled)
+
+def base_fingerprint(base_model: tf.keras.Model) -> str:
+    """
+    Identifies the base weights and input preprocessing, so features computed
+    with a different base (or image size/scaling) are never reused.
+    """
+    digest = hashlib.sha1(f"{base_model.name}:{IMAGE_SIZE}:{IMAGE_SCALE}:avg".encode())
+    for weights in base_model.get_weights():
+        digest.update(np.ascontiguousarray(weights).tobytes())
+    return digest.hexdigest()
+
+class FeatureCache:
+    """
+    Append-only store of pooled base features, one float32 row per image,
+    keyed by the image's content hash (the shard key).
+
+    Rows live in a flat file read through np.memmap; keys.json maps keys to
+    rows and is replaced atomically after the rows are written, so a crash
+    mid-append only leaves unreferenced bytes that the next append truncates.
+    """
+
+    def __init__(self, directory: str, dim: int):
+        self.directory = directory
+        self.dim = dim
+        self.data_path = os.path.join(directory, FEATURES_FILE)
+        self.keys_path = os.path.join(directory, KEYS_FILE)
+        os.makedirs(directory, exist_ok=True)
+        self._keys: List[str] = []
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path) as f:
+                self._keys = json.load(f)
+        self._rows: Dict[str, int] = {key: row for row, key in enumerate(self._keys)}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def row(self, key: str):
+        return self._rows.get(key)
+
+    def features(self) -> np.memmap:
+        if not self._keys:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.memmap(self.data_path, dtype=np.float32, mode='r', shape=(len(self._keys), self.dim))
+
+    def append(self, keys: List[str], features: np.ndarray) -> List[int]:
+        features = np.ascontiguousarray(features, dtype=np.float32).reshape(len(keys), self.dim)
+        first_row = len(self._keys)
+        with open(self.data_path, 'ab') as f:
+            f.truncate(first_row * self.dim * 4)
+            f.write(features.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._keys.extend(keys)
+        tmp_path = self.keys_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._keys, f)
+        os.replace(tmp_path, self.keys_path)
+        for offset, key in enumerate(keys):
+            self._rows[key] = first_row + offset
+        return list(range(first_row, first_row + len(keys)))
+
+def split_features(
+    split: str,
+    manifest: dict,
+    extractor: tf.keras.Model,
+    cache: FeatureCache,
+    batch_size: int = 64,
+    shards_dir: str = SHARDS_DIR,
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Returns (cache rows, labels, newly extracted count) for a split. Only
+    images whose key is not cached yet are run through the extractor.
+    """
+    keys, labels = [], []
+    pending_images, pending_keys = [], []
+    extracted = 0
+
+    def flush():
+        nonlocal extracted
+        batch = np.stack(pending_images).astype(np.float32) * IMAGE_SCALE
+        cache.append(pending_keys, extractor.predict_on_batch(batch))
+        extracted += len(pending_keys)
+        pending_images.clear()
+        pending_keys.clear()
+
+    for image, label, key in raw_dataset(split, manifest, shards_dir).as_numpy_iterator():
+        key = key.decode()
+        # Identical files share one row
+        if cache.row(key) is None and key not in pending_keys:
+            pending_images.append(image)
+            pending_keys.append(key)
+            if len(pending_keys) >= batch_size:
+                flush()
+        keys.append(key)
+        labels.append(label)
+    if pending_keys:
+        flush()
+
+    logger.info(f"{split}: {len(keys)} images, {extracted} new feature rows extracted")
+    rows = np.array([cache.row(key) for key in keys], dtype=np.int64)
+    return rows, np.array(labels, dtype=np.int64), extracted
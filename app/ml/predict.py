@@ -1,72 +1,419 @@
-import tensorflow as tf
 import numpy as np
-from app.ml.train import get_data_generators
+import asyncio
+import io
+import json
+import logging
 import os
-from typing import Optional
+import threading
+import time
+from PIL import Image
+from typing import TYPE_CHECKING, BinaryIO, Callable, List, Optional, Sequence, Tuple, Union
+from app.core.config import settings
+from app.core.metrics import INFERENCE_BATCH_SIZE, stage
+from app.ml.backends import CascadeBackend, KerasBackend, TFLiteBackend, SIDECAR_BACKEND, TFLITE_BACKEND
+from app.ml.registry import CASCADE_ARTIFACT, LABELS_ARTIFACT, MODEL_ARTIFACT, TFLITE_ARTIFACT, RegistryError, model_registry
+
+if TYPE_CHECKING:
+    import tensorflow as tf
+
+logger = logging.getLogger(__name__)
 
 # Define base path for data
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
-_model: Optional[tf.keras.Model] = None
+# Legacy single-model location, served when the registry has no active version
+MODEL_PATH = os.path.join(DATA_DIR, 'models', 'dino_analyzer_model.keras')
+LABELS_PATH = os.path.join(DATA_DIR, 'models', 'dino_analyzer_model.labels.json')
+LEGACY_VERSION = "legacy"
+SUPPORTED_LABELS_VERSIONS = (1,)
+IMAGE_SIZE = (224, 224)
+# Same scaling as the ImageDataGenerator used in training (rescale=1./255)
+IMAGE_SCALE = 1. / 255
+
+# Model lifecycle states
+MODEL_NOT_LOADED = "not_loaded"
+MODEL_LOADING = "loading"
+MODEL_READY = "ready"
+MODEL_UNAVAILABLE = "unavailable"
+MODEL_FAILED = "failed"
 
-def load_model() -> Optional[tf.keras.Model]:
+class ServedModel:
+    """
+    A loaded inference backend together with the version and labels it was
+    published with. Swapped as a whole, so a batch that grabbed one keeps
+    using it even if a new version is activated meanwhile.
+    """
+
+    def __init__(self, version: str, backend, class_indices: dict, fingerprint: Optional[str] = None):
+        self.version = version
+        self.backend = backend
+        self.class_indices = class_indices
+        self.class_mapping = {v: k for k, v in class_indices.items()}
+        # Identifies exactly what produces the predictions (used to key cached results)
+        self.fingerprint = fingerprint or f"{version}:{backend.name}"
+
+    @property
+    def model(self) -> Optional["tf.keras.Model"]:
+        # Only the Keras backend exposes a Keras model
+        return self.backend.model
+
+_served: Optional[ServedModel] = None
+_model_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_model_state = MODEL_NOT_LOADED
+_model_error: Optional[str] = None
+_model_load_seconds: Optional[float] = None
+_reloading: Optional[str] = None
+_warm_up_batch_sizes: Sequence[int] = (1,)
+
+def load_model(model_path: str = MODEL_PATH) -> Optional["tf.keras.Model"]:
     """
     Loads the model if it exists, returns None if the model file is not found.
     """
-    model_path = os.path.join(DATA_DIR, 'models', 'dino_analyzer_model.keras')
     if not os.path.exists(model_path):
         return None
+    # TensorFlow is only imported once a model actually needs loading
+    import tensorflow as tf
     return tf.keras.models.load_model(model_path)
 
-def get_model() -> Optional[tf.keras.Model]:
+def load_class_indices(labels_path: str = LABELS_PATH) -> Optional[dict]:
     """
-    Returns the loaded model or attempts to load it if not already loaded.
+    Loads the class-label manifest written by train_model next to the model.
+    Returns None if the manifest is missing or has an unsupported version.
     """
-    global _model
-    if _model is None:
-        _model = load_model()
-    return _model
+    if not os.path.exists(labels_path):
+        logger.warning(f"Label manifest not found at {labels_path}")
+        return None
+    with open(labels_path) as f:
+        manifest = json.load(f)
+    if manifest.get("version") not in SUPPORTED_LABELS_VERSIONS:
+        logger.error(f"Unsupported label manifest version: {manifest.get('version')}")
+        return None
+    return manifest["class_indices"]
 
-def predict_dinosaur(image_path: str, class_indices: dict) -> dict:
+def resolve_model_source(version: Optional[str] = None) -> Optional[Tuple[str, str, str]]:
     """
-    Predicts dinosaur class from image. Returns error information if model is not available.
+    Returns (version, model path, labels path) for the requested registry
+    version, the active one, or the legacy model when the registry is empty.
     """
-    model = get_model()
-    if model is None:
-        return {
-            "error": "Model not available",
-            "message": "The dinosaur classification model has not been trained yet. Please train the model first."
-        }
-    
-    if not os.path.exists(image_path):
+    if version is None:
+        version = model_registry.active_version()
+    if version is not None:
+        if not model_registry.has_version(version):
+            raise RegistryError(f"Unknown model version: {version}")
+        return (
+            version,
+            model_registry.artifact_path(version, MODEL_ARTIFACT),
+            model_registry.artifact_path(version, LABELS_ARTIFACT),
+        )
+    if os.path.exists(MODEL_PATH):
+        return LEGACY_VERSION, MODEL_PATH, LABELS_PATH
+    return None
+
+def warm_up(backend, batch_sizes: Sequence[int] = (1,)):
+    """
+    Runs dummy forward passes so graph tracing and tensor allocation happen
+    before real traffic.
+    """
+    for batch_size in batch_sizes:
+        backend.predict(np.zeros((batch_size, *IMAGE_SIZE, 3), dtype=np.float32))
+
+def load_backend(model_path: str, backend_name: str):
+    """
+    Creates the configured inference backend, falling back to Keras when the
+    optimized export doesn't exist for this version.
+    """
+    if backend_name == TFLITE_BACKEND:
+        tflite_path = os.path.join(os.path.dirname(model_path), TFLITE_ARTIFACT)
+        if os.path.exists(tflite_path):
+            return TFLiteBackend(tflite_path, num_threads=settings.TF_INTRA_OP_THREADS)
+        logger.warning(f"No TFLite export at {tflite_path}, serving the Keras model")
+    model = load_model(model_path)
+    return KerasBackend(model) if model is not None else None
+
+def load_cascade(version: str, model_path: str, full_backend, warm_up_batch_sizes: Sequence[int] = (1,)):
+    """
+    Puts the version's first-stage model in front of full_backend, with the
+    threshold calibrated when it was trained unless INFERENCE_CASCADE_THRESHOLD
+    overrides it. Returns full_backend alone when the version has no cascade.
+    """
+    cascade_path = os.path.join(os.path.dirname(model_path), CASCADE_ARTIFACT)
+    threshold = settings.INFERENCE_CASCADE_THRESHOLD
+    if threshold is None and model_registry.has_version(version):
+        threshold = model_registry.read_metrics(version).get("cascade", {}).get("threshold")
+    if not os.path.exists(cascade_path) or threshold is None:
+        logger.warning(f"Model {version} has no calibrated cascade, serving the full model only")
+        return full_backend
+    first_stage = KerasBackend(load_model(cascade_path))
+    warm_up(first_stage, warm_up_batch_sizes)
+    return CascadeBackend(first_stage, full_backend, threshold)
+
+def load_served_model(
+    version: Optional[str] = None,
+    warm_up_batch_sizes: Sequence[int] = (1,),
+    backend_name: Optional[str] = None,
+) -> Optional[ServedModel]:
+    """
+    Loads and warms up a model version without touching the one being served.
+    Returns None when there is no model to load.
+    """
+    backend_name = backend_name or settings.INFERENCE_BACKEND
+    if backend_name == SIDECAR_BACKEND:
+        # The sidecar resolves the version, loads the weights and warms them up
+        from app.ml.sidecar import sidecar_client
+        return sidecar_client.load(version, warm_up_batch_sizes)
+    source = resolve_model_source(version)
+    if source is None:
+        return None
+    version, model_path, labels_path = source
+    class_indices = load_class_indices(labels_path)
+    if class_indices is None:
+        return None
+    backend = load_backend(model_path, backend_name)
+    if backend is None:
+        return None
+    warm_up(backend, warm_up_batch_sizes)
+    # The legacy model keeps its version name when retrained in place, so the
+    # served file's size and mtime are part of its identity
+    artifact = os.stat(getattr(backend, 'model_path', None) or model_path)
+    fingerprint = f"{version}:{backend.name}:{artifact.st_size}:{artifact.st_mtime_ns}"
+    if settings.INFERENCE_CASCADE_ENABLED:
+        backend = load_cascade(version, model_path, backend, warm_up_batch_sizes)
+        if isinstance(backend, CascadeBackend):
+            # Answers from the first stage differ slightly from the full model's
+            fingerprint += f":{CASCADE_ARTIFACT}:{backend.threshold}"
+    return ServedModel(version, backend, class_indices, fingerprint)
+
+def load_and_warm_up(warm_up_batch_sizes: Sequence[int] = (1,)) -> bool:
+    """
+    Loads the active model and its label manifest and warms it up. Safe to
+    call from several threads; only the first call does the work.
+    Returns True when the model is ready to serve.
+    """
+    global _served, _model_state, _model_error, _model_load_seconds, _warm_up_batch_sizes
+    with _model_lock:
+        if _model_state in (MODEL_READY, MODEL_UNAVAILABLE, MODEL_FAILED):
+            return _model_state == MODEL_READY
+        _model_state = MODEL_LOADING
+        _warm_up_batch_sizes = warm_up_batch_sizes
+        started = time.perf_counter()
+        try:
+            served = load_served_model(warm_up_batch_sizes=warm_up_batch_sizes)
+            if served is None:
+                _model_state = MODEL_UNAVAILABLE
+                logger.warning("Dinosaur classification model is not available")
+                return False
+        except Exception as e:
+            _model_state = MODEL_FAILED
+            _model_error = str(e)
+            logger.error(f"Failed to load model: {str(e)}")
+            return False
+        _served = served
+        _model_load_seconds = time.perf_counter() - started
+        _model_state = MODEL_READY
+        logger.info(f"Model {served.version} loaded and warmed up in {_model_load_seconds:.2f}s")
+        return True
+
+def load_model_in_background(
+    before_load: Optional[Callable[[], None]] = None,
+    warm_up_batch_sizes: Sequence[int] = (1,),
+) -> threading.Thread:
+    """
+    Starts loading the model on a background thread so the server can accept
+    requests (e.g. /auth) immediately. Until it finishes, predictions report
+    the model as loading.
+    """
+    global _model_state
+    if _model_state == MODEL_NOT_LOADED:
+        _model_state = MODEL_LOADING
+
+    def run():
+        if before_load is not None:
+            before_load()
+        load_and_warm_up(warm_up_batch_sizes)
+
+    thread = threading.Thread(target=run, name="model-loader", daemon=True)
+    thread.start()
+    return thread
+
+def reload_model(version: Optional[str] = None, activate: bool = False) -> ServedModel:
+    """
+    Loads the given version (default: the registry's active one) next to the
+    serving model, warms it up and then swaps it in with a single reference
+    assignment. Requests keep being served by the old model meanwhile and
+    in-flight batches finish on it. Raises if the new model can't be loaded,
+    in which case the current model stays in service. With activate, the
+    version also becomes the registry's active one, but only once it has
+    loaded and warmed up, so other workers never follow a broken version.
+    """
+    global _served, _model_state, _model_error, _model_load_seconds, _reloading
+    with _reload_lock:
+        _reloading = version or "active"
+        try:
+            started = time.perf_counter()
+            served = load_served_model(version, _warm_up_batch_sizes)
+            if served is None:
+                raise RegistryError("No model available to load")
+            if activate:
+                model_registry.activate(version or served.version)
+            _served = served
+            _model_load_seconds = time.perf_counter() - started
+            _model_error = None
+            _model_state = MODEL_READY
+            logger.info(f"Swapped in model {served.version}")
+            return served
+        finally:
+            _reloading = None
+
+async def watch_registry(interval: float):
+    """
+    Polls the registry's active version and hot-swaps when it changes, so
+    every worker process follows an activation or rollback made elsewhere.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            active = model_registry.active_version()
+            served = _served
+            if _model_state in (MODEL_NOT_LOADED, MODEL_LOADING):
+                continue
+            if active is not None and (served is None or served.version != active):
+                await asyncio.to_thread(reload_model, active)
+        except Exception as e:
+            logger.error(f"Failed to follow registry active version: {str(e)}")
+
+def get_served_model() -> Optional[ServedModel]:
+    """
+    Returns the model being served, loading it synchronously on first use
+    when no background load was started (scripts, notebooks). Returns None
+    while a background load is still running or if no model is available.
+    """
+    if _model_state == MODEL_NOT_LOADED:
+        load_and_warm_up()
+    return _served
+
+def get_model_status() -> dict:
+    served = _served
+    return {
+        "state": _model_state,
+        "version": served.version if served is not None else None,
+        "backend": served.backend.name if served is not None else None,
+        "reloading": _reloading,
+        "error": _model_error,
+        "load_seconds": _model_load_seconds,
+    }
+
+def is_model_ready() -> bool:
+    return _model_state == MODEL_READY
+
+def get_model() -> Optional["tf.keras.Model"]:
+    """
+    Returns the loaded Keras model, see get_served_model.
+    """
+    served = get_served_model()
+    return served.model if served is not None else None
+
+def get_class_indices() -> Optional[dict]:
+    """
+    Returns the class indices that belong to the loaded model.
+    """
+    served = get_served_model()
+    return served.class_indices if served is not None else None
+
+def get_model_version() -> Optional[str]:
+    served = _served
+    return served.version if served is not None else None
+
+def model_unavailable_error() -> dict:
+    if _model_state == MODEL_LOADING:
         return {
-            "error": "File not found",
-            "message": f"The image file {image_path} was not found."
+            "error": "Model loading",
+            "message": "The dinosaur classification model is still loading. Please retry shortly."
         }
+    return {
+        "error": "Model not available",
+        "message": "The dinosaur classification model has not been trained yet. Please train the model first."
+    }
+
+def decode_image_uint8(data: Union[bytes, BinaryIO], size: Tuple[int, int] = IMAGE_SIZE) -> np.ndarray:
+    """
+    Decodes raw image bytes (or a binary buffer) in memory into a resized
+    (height, width, 3) uint8 array.
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = io.BytesIO(data)
+    with Image.open(data) as img:
+        # Same conversion and interpolation as keras load_img used in training
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img = img.resize(size, Image.NEAREST)
+        return np.asarray(img, dtype=np.uint8)
+
+def decode_image(data: Union[bytes, BinaryIO]) -> np.ndarray:
+    """
+    Decodes raw image bytes (or a binary buffer) in memory into a
+    (224, 224, 3) float array ready for the model.
+    """
+    return decode_image_uint8(data).astype(np.float32) * IMAGE_SCALE
+
+def preprocess_image(image_path: str) -> np.ndarray:
+    """
+    Loads an image from disk as a (224, 224, 3) float array ready for the model.
+    """
+    with open(image_path, "rb") as f:
+        return decode_image(f)
+
+def predict_batch(images: List[np.ndarray], class_indices: Optional[dict] = None) -> List[dict]:
+    """
+    Runs a single forward pass over a list of preprocessed images and returns
+    one result dict per image, in the same order.
+    """
+    served = get_served_model()
+    if served is None:
+        return [model_unavailable_error() for _ in images]
 
     try:
-        img = tf.keras.preprocessing.image.load_img(
-            image_path, target_size=(224, 224)
-        )
-        img_array = tf.keras.preprocessing.image.img_to_array(img)
-        img_array = np.expand_dims(img_array, 0)
-        
-        predictions = model.predict(img_array)
-        predicted_class = np.argmax(predictions[0])
-        
+        INFERENCE_BATCH_SIZE.observe(len(images))
+        with stage("inference.model_predict"):
+            predictions = served.backend.predict(np.stack(images))
+    except Exception as e:
+        return [{"error": "Prediction failed", "message": str(e)} for _ in images]
+
+    if class_indices is None:
+        class_mapping = served.class_mapping
+    else:
         # Invert the class dictionary
         class_mapping = {v: k for k, v in class_indices.items()}
-        predicted_name = class_mapping[predicted_class]
-        
-        return {
+    results = []
+    for prediction in predictions:
+        predicted_class = int(np.argmax(prediction))
+        results.append({
             "success": True,
-            "prediction": predicted_name,
-            "confidence": float(predictions[0][predicted_class])
+            "prediction": class_mapping[predicted_class],
+            "confidence": float(prediction[predicted_class]),
+            "model_version": served.version
+        })
+    return results
+
+def predict_dinosaur(image: Union[str, bytes, BinaryIO], class_indices: Optional[dict] = None) -> dict:
+    """
+    Predicts dinosaur class from an image path, raw bytes or a binary buffer.
+    Returns error information if model is not available.
+    Uses the label manifest loaded with the model unless class_indices is given.
+    """
+    if get_served_model() is None:
+        return model_unavailable_error()
+
+    if isinstance(image, str) and not os.path.exists(image):
+        return {
+            "error": "File not found",
+            "message": f"The image file {image} was not found."
         }
+
+    try:
+        img_array = preprocess_image(image) if isinstance(image, str) else decode_image(image)
     except Exception as e:
         return {
             "error": "Prediction failed",
             "message": str(e)
         }
-
-# Initialize model (but don't fail if not available)
-_model = load_model() 
\ No newline at end of file
+    return predict_batch([img_array], class_indices)[0]
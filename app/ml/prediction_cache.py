@@ -0,0 +1,147 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from app.core.config import settings
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Inserts between trims of the disk tier back to its maximum size
+DISK_TRIM_INTERVAL = 256
+
+def content_digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+class PredictionCache:
+    """
+    Content-addressed cache of prediction results.
+
+    Results are keyed by the SHA-256 of the uploaded bytes plus the
+    fingerprint of the model that produced them, so activating or retraining
+    a model invalidates every entry without any explicit purge. A bounded LRU
+    in memory sits in front of an optional SQLite file that survives restarts
+    and can be shared by the workers on one host.
+    """
+
+    def __init__(self, maxsize: int, disk_path: Optional[str] = None, disk_max_entries: int = 100000):
+        self.memory = TTLCache(maxsize=maxsize) if maxsize > 0 else None
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()
+        self._inserts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory is not None or self.disk_path is not None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.disk_path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                " digest TEXT NOT NULL, model TEXT NOT NULL, result TEXT NOT NULL,"
+                " created_at REAL NOT NULL, PRIMARY KEY (digest, model))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS predictions_created_at ON predictions (created_at)")
+            self._conn = conn
+        return self._conn
+
+    def get_memory(self, digest: str, model: str) -> Optional[dict]:
+        if self.memory is None:
+            return None
+        result = self.memory.get((digest, model))
+        return dict(result) if result is not None else None
+
+    def get_disk(self, digest: str, model: str) -> Optional[dict]:
+        """
+        Blocking SQLite lookup; call it from a worker thread. Hits are
+        promoted to the memory tier.
+        """
+        if self.disk_path is None:
+            return None
+        try:
+            with self._disk_lock:
+                row = self._connection().execute(
+                    "SELECT result FROM predictions WHERE digest = ? AND model = ?",
+                    (digest, model),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Prediction cache lookup failed: {str(e)}")
+            return None
+        if row is None:
+            self.disk_misses += 1
+            return None
+        self.disk_hits += 1
+        result = json.loads(row[0])
+        if self.memory is not None:
+            self.memory.set((digest, model), result)
+        return dict(result)
+
+    def set_memory(self, digest: str, model: str, result: dict):
+        if self.memory is not None:
+            self.memory.set((digest, model), dict(result))
+
+    def set_disk(self, digest: str, model: str, result: dict):
+        """
+        Blocking SQLite insert; call it from a worker thread.
+        """
+        if self.disk_path is None:
+            return
+        try:
+            with self._disk_lock:
+                conn = self._connection()
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO predictions (digest, model, result, created_at) VALUES (?, ?, ?, ?)",
+                        (digest, model, json.dumps(result), time.time()),
+                    )
+                self._inserts += 1
+                if self._inserts % DISK_TRIM_INTERVAL == 0:
+                    self._trim(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Prediction cache write failed: {str(e)}")
+
+    def _trim(self, conn: sqlite3.Connection):
+        with conn:
+            conn.execute(
+                "DELETE FROM predictions WHERE rowid IN ("
+                " SELECT rowid FROM predictions ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_entries,),
+            )
+
+    def close(self):
+        with self._disk_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        disk_total = self.disk_hits + self.disk_misses
+        return {
+            "memory": self.memory.stats() if self.memory is not None else None,
+            "disk": {
+                "hits": self.disk_hits,
+                "misses": self.disk_misses,
+                "hit_rate": self.disk_hits / disk_total if disk_total else 0.0,
+            } if self.disk_path is not None else None,
+        }
+
+prediction_cache = PredictionCache(
+    maxsize=settings.PREDICTION_CACHE_SIZE,
+    disk_path=settings.PREDICTION_CACHE_PATH or None,
+    disk_max_entries=settings.PREDICTION_CACHE_DISK_MAX_ENTRIES,
+)
@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+REGISTRY_DIR = os.path.join(DATA_DIR, 'models', 'registry')
+MODEL_ARTIFACT = 'model.keras'
+TFLITE_ARTIFACT = 'model.tflite'
+# Small first-stage model of the cascade (train.py train-cascade)
+CASCADE_ARTIFACT = 'cascade.keras'
+LABELS_ARTIFACT = 'labels.json'
+METRICS_ARTIFACT = 'metrics.json'
+ACTIVE_FILE = 'active.json'
+LABELS_MANIFEST_VERSION = 1
+
+class RegistryError(Exception):
+    pass
+
+def _write_json_atomic(path: str, data: dict):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def write_label_manifest(class_indices: dict, directory: str, filename: str = LABELS_ARTIFACT, model_filename: str = MODEL_ARTIFACT) -> str:
+    """
+    Writes the class-label manifest next to the saved model so serving never
+    needs to rescan the dataset to map output indices back to class names.
+    """
+    manifest_path = os.path.join(directory, filename)
+    _write_json_atomic(manifest_path, {
+        "version": LABELS_MANIFEST_VERSION,
+        "model": model_filename,
+        "class_indices": {name: int(index) for name, index in class_indices.items()},
+    })
+    return manifest_path
+
+class ModelRegistry:
+    """
+    Versioned store of trained models on the local filesystem.
+
+    Each version is a directory holding the model, its label manifest and
+    training metrics. Versions are written to a temporary directory and
+    renamed into place, and the active version is recorded in active.json
+    (replaced atomically), so readers never see a half-written version.
+    """
+
+    def __init__(self, root: str = REGISTRY_DIR):
+        self.root = root
+
+    def version_dir(self, version: str) -> str:
+        return os.path.join(self.root, version)
+
+    def artifact_path(self, version: str, artifact: str) -> str:
+        return os.path.join(self.version_dir(version), artifact)
+
+    def has_version(self, version: str) -> bool:
+        return os.path.exists(self.artifact_path(version, LABELS_ARTIFACT))
+
+    def _read_active(self) -> dict:
+        path = os.path.join(self.root, ACTIVE_FILE)
+        if not os.path.exists(path):
+            return {"version": None, "history": []}
+        with open(path) as f:
+            return json.load(f)
+
+    def active_version(self) -> Optional[str]:
+        return self._read_active().get("version")
+
+    def read_labels(self, version: str) -> dict:
+        with open(self.artifact_path(version, LABELS_ARTIFACT)) as f:
+            return json.load(f)
+
+    def read_metrics(self, version: str) -> dict:
+        path = self.artifact_path(version, METRICS_ARTIFACT)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def list_versions(self) -> List[dict]:
+        if not os.path.isdir(self.root):
+            return []
+        active = self.active_version()
+        versions = []
+        for version in sorted(os.listdir(self.root)):
+            if version.startswith('.') or not self.has_version(version):
+                continue
+            versions.append({
+                "version": version,
+                "active": version == active,
+                "metrics": self.read_metrics(version),
+            })
+        return versions
+
+    def publish(self, model, class_indices: dict, metrics: Optional[dict] = None, activate: bool = True) -> str:
+        """
+        Stores a trained Keras model with its label manifest and metrics as a
+        new version and optionally makes it the active one.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        version = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')
+        suffix = 1
+        while os.path.exists(self.version_dir(version)):
+            suffix += 1
+            version = f"{version.split('.')[0]}.{suffix}"
+
+        staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=self.root)
+        try:
+            model.save(os.path.join(staging_dir, MODEL_ARTIFACT))
+            write_label_manifest(class_indices, staging_dir)
+            _write_json_atomic(os.path.join(staging_dir, METRICS_ARTIFACT), {
+                **(metrics or {}),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            })
+            os.rename(staging_dir, self.version_dir(version))
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+        logger.info(f"Published model version {version}")
+        if activate:
+            self.activate(version)
+        return version
+
+    def add_artifact(self, version: str, artifact: str, content: bytes) -> str:
+        """
+        Adds a derived artifact (e.g. an optimized export) to an existing version.
+        """
+        if not self.has_version(version):
+            raise RegistryError(f"Unknown model version: {version}")
+        path = self.artifact_path(version, artifact)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        return path
+
+    def update_metrics(self, version: str, updates: dict):
+        metrics = self.read_metrics(version)
+        metrics.update(updates)
+        _write_json_atomic(self.artifact_path(version, METRICS_ARTIFACT), metrics)
+
+    def activate(self, version: str):
+        if not self.has_version(version):
+            raise RegistryError(f"Unknown model version: {version}")
+        active = self._read_active()
+        if active.get("version") == version:
+            return
+        history = active.get("history", [])
+        if active.get("version"):
+            history.append(active["version"])
+        _write_json_atomic(os.path.join(self.root, ACTIVE_FILE), {
+            "version": version,
+            "history": history[-20:],
+        })
+        logger.info(f"Activated model version {version}")
+
+    def rollback(self) -> str:
+        """
+        Re-activates the previously active version and returns it.
+        """
+        active = self._read_active()
+        history = active.get("history", [])
+        while history:
+            version = history.pop()
+            if self.has_version(version):
+                _write_json_atomic(os.path.join(self.root, ACTIVE_FILE), {
+                    "version": version,
+                    "history": history,
+                })
+                logger.info(f"Rolled back to model version {version}")
+                return version
+        raise RegistryError("No previous model version to roll back to")
+
+model_registry = ModelRegistry()
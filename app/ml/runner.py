@@ -0,0 +1,270 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import tensorflow as tf
+
+from app.ml.registry import _write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+RUNS_DIR = os.path.join(DATA_DIR, 'runs')
+RUN_RECORD = 'run.json'
+LAST_CHECKPOINT = 'last.keras'
+BEST_CHECKPOINT = 'best.keras'
+LATEST_RUN = 'latest'
+
+# Run states
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+class TrainingRun:
+    """
+    One training run on disk: run.json (configuration, state and one entry
+    per finished epoch with its wall time, images/sec, learning rate and
+    metrics), the last checkpoint to resume from and the best one so far.
+    """
+
+    def __init__(self, directory: str, record: dict):
+        self.directory = directory
+        self.record = record
+
+    @property
+    def run_id(self) -> str:
+        return self.record["run_id"]
+
+    @classmethod
+    def create(cls, config: dict, root: str = RUNS_DIR) -> "TrainingRun":
+        os.makedirs(root, exist_ok=True)
+        run_id = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')
+        suffix = 1
+        while os.path.exists(os.path.join(root, run_id)):
+            suffix += 1
+            run_id = f"{run_id.split('.')[0]}.{suffix}"
+        directory = os.path.join(root, run_id)
+        os.makedirs(directory)
+        run = cls(directory, {
+            "run_id": run_id,
+            "status": RUNNING,
+            "config": config,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "epochs": [],
+            "checkpoint": None,
+            "best": None,
+            "stop_reason": None,
+            "version": None,
+            "error": None,
+        })
+        run.save()
+        return run
+
+    @classmethod
+    def load(cls, run_id: str, root: str = RUNS_DIR) -> "TrainingRun":
+        """
+        Loads a run by id, or the most recently created one for "latest".
+        """
+        if run_id == LATEST_RUN:
+            runs = []
+            for name in os.listdir(root) if os.path.isdir(root) else []:
+                try:
+                    runs.append(cls.load(name, root))
+                except (OSError, ValueError):
+                    continue
+            if not runs:
+                raise FileNotFoundError(f"No training runs in {root}")
+            # By creation time, not by name: ids needn't sort chronologically
+            return max(runs, key=lambda run: run.created_at)
+        directory = os.path.join(root, run_id)
+        with open(os.path.join(directory, RUN_RECORD)) as f:
+            return cls(directory, json.load(f))
+
+    @property
+    def created_at(self) -> datetime:
+        try:
+            created_at = datetime.fromisoformat(self.record["created_at"])
+        except (KeyError, TypeError, ValueError):
+            # Fall back to when the record was last written
+            return datetime.fromtimestamp(os.path.getmtime(self.path(RUN_RECORD)), timezone.utc)
+        return created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def save(self):
+        self.record["updated_at"] = datetime.now(timezone.utc).isoformat()
+        _write_json_atomic(self.path(RUN_RECORD), self.record)
+
+    def save_checkpoint(self, model: tf.keras.Model, name: str):
+        # Keras wants the .keras suffix, so write under another .keras name and rename
+        tmp_path = self.path(f".{name}.partial.keras")
+        model.save(tmp_path)
+        os.replace(tmp_path, self.path(name))
+
+    def load_checkpoint(self, name: str = LAST_CHECKPOINT) -> Optional[tf.keras.Model]:
+        """
+        The checkpointed model, compiled with its optimizer state, or None.
+        """
+        if not os.path.exists(self.path(name)):
+            return None
+        return tf.keras.models.load_model(self.path(name))
+
+class PlateauControl(tf.keras.callbacks.Callback):
+    """
+    Early stopping and learning-rate reduction on a validation metric.
+    Keras' EarlyStopping and ReduceLROnPlateau start over on every fit();
+    this keeps its counters in a plain dict that is saved with each
+    checkpoint, so a resumed run carries on with the same patience.
+    """
+
+    def __init__(
+        self,
+        state: Optional[dict] = None,
+        monitor: str = 'val_loss',
+        patience: int = 3,
+        lr_patience: int = 1,
+        lr_factor: float = 0.5,
+        min_lr: float = 1e-6,
+        min_delta: float = 1e-4,
+    ):
+        super().__init__()
+        self.monitor = monitor
+        self.patience = patience
+        self.lr_patience = lr_patience
+        self.lr_factor = lr_factor
+        self.min_lr = min_lr
+        self.min_delta = min_delta
+        self.state = dict(state or {"best": None, "best_epoch": None, "wait": 0, "lr_wait": 0})
+        self.improved = False
+        # Accuracy-like metrics improve upwards
+        self._sign = 1 if 'loss' in monitor else -1
+
+    def on_epoch_end(self, epoch, logs=None):
+        value = (logs or {}).get(self.monitor)
+        if value is None:
+            logger.warning(f"Early stopping needs {self.monitor}, which this run doesn't report")
+            return
+        best = self.state["best"]
+        self.improved = best is None or self._sign * (best - value) > self.min_delta
+        if self.improved:
+            self.state.update(best=float(value), best_epoch=epoch + 1, wait=0, lr_wait=0)
+            return
+        self.state["wait"] += 1
+        self.state["lr_wait"] += 1
+        if self.state["lr_wait"] >= self.lr_patience:
+            learning_rate = float(tf.keras.backend.get_value(self.model.optimizer.learning_rate))
+            if learning_rate > self.min_lr:
+                reduced = max(learning_rate * self.lr_factor, self.min_lr)
+                tf.keras.backend.set_value(self.model.optimizer.learning_rate, reduced)
+                logger.info(f"{self.monitor} did not improve, learning rate {learning_rate:.2e} -> {reduced:.2e}")
+            self.state["lr_wait"] = 0
+        if self.state["wait"] >= self.patience:
+            self.model.stop_training = True
+
+class RunRecorder(tf.keras.callbacks.Callback):
+    """
+    Appends each finished epoch to the run record, keeps the best model and
+    checkpoints every checkpoint_every epochs, on improvement and at the end.
+    """
+
+    def __init__(self, run: TrainingRun, plateau: PlateauControl, train_samples: int, epochs: int, checkpoint_every: int = 1):
+        super().__init__()
+        self.run = run
+        self.plateau = plateau
+        self.train_samples = train_samples
+        self.epochs = epochs
+        self.checkpoint_every = checkpoint_every
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._started = time.perf_counter()
+        self._train_seconds = None
+        self._learning_rate = float(tf.keras.backend.get_value(self.model.optimizer.learning_rate))
+
+    def on_test_begin(self, logs=None):
+        # Validation runs inside the epoch; throughput counts the training part only
+        if self._train_seconds is None:
+            self._train_seconds = time.perf_counter() - self._started
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self._started
+        train_seconds = self._train_seconds or seconds
+        entry = {
+            "epoch": epoch + 1,
+            "seconds": seconds,
+            "train_seconds": train_seconds,
+            "images_per_sec": self.train_samples / train_seconds,
+            "learning_rate": self._learning_rate,
+            **{name: float(value) for name, value in (logs or {}).items()},
+        }
+        self.run.record["epochs"].append(entry)
+        if self.plateau.improved:
+            self.run.save_checkpoint(self.model, BEST_CHECKPOINT)
+            self.run.record["best"] = entry
+        last = epoch + 1 == self.epochs or self.model.stop_training
+        # Also on improvement, so the best model is never ahead of the resume point
+        if (epoch + 1) % self.checkpoint_every == 0 or last or self.plateau.improved:
+            self.run.save_checkpoint(self.model, LAST_CHECKPOINT)
+            self.run.record["checkpoint"] = {"epoch": epoch + 1, "plateau": dict(self.plateau.state)}
+        self.run.save()
+        logger.info(json.dumps({"run_id": self.run.run_id, **entry}))
+
+def fit(
+    run: TrainingRun,
+    model: tf.keras.Model,
+    train_dataset: tf.data.Dataset,
+    validation_dataset: tf.data.Dataset,
+    train_samples: int,
+    epochs: int,
+    patience: int = 3,
+    checkpoint_every: int = 1,
+) -> tf.keras.Model:
+    """
+    Trains model for run, starting after the run's last checkpoint when it
+    has one (model must then be that checkpoint). Stops early when
+    val_loss stops improving, halving the learning rate on each epoch
+    without improvement, and returns the model with the best weights.
+    """
+    checkpoint = run.record["checkpoint"]
+    initial_epoch = checkpoint["epoch"] if checkpoint else 0
+    # Epochs after the checkpoint are redone
+    run.record["epochs"] = run.record["epochs"][:initial_epoch]
+    run.record["status"] = RUNNING
+    run.save()
+    plateau = PlateauControl(checkpoint["plateau"] if checkpoint else None, patience=patience)
+    if checkpoint and plateau.state["wait"] >= patience:
+        # The run had already stopped early; nothing left to train
+        initial_epoch = epochs
+    recorder = RunRecorder(run, plateau, train_samples, epochs, checkpoint_every)
+    if initial_epoch:
+        logger.info(f"Resuming run {run.run_id} after epoch {initial_epoch}")
+    try:
+        if initial_epoch < epochs:
+            model.fit(
+                train_dataset,
+                epochs=epochs,
+                initial_epoch=initial_epoch,
+                validation_data=validation_dataset,
+                callbacks=[plateau, recorder],
+            )
+    except BaseException as e:
+        run.record["status"] = FAILED
+        run.record["error"] = str(e) or type(e).__name__
+        run.save()
+        raise
+
+    finished = len(run.record["epochs"])
+    run.record["stop_reason"] = "early_stopping" if finished < epochs else "epochs"
+    best = run.load_checkpoint(BEST_CHECKPOINT)
+    if best is not None:
+        model.set_weights(best.get_weights())
+    return model
+
+def complete(run: TrainingRun, version: str):
+    run.record["status"] = COMPLETED
+    run.record["version"] = version
+    run.record["error"] = None
+    run.save()
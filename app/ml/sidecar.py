@@ -0,0 +1,473 @@
+"""
+Shared inference sidecar.
+
+One process loads TensorFlow and the model weights; every API worker started
+with INFERENCE_BACKEND=sidecar forwards its batches to it over a local socket
+instead of loading its own copy, so memory no longer grows with the number
+of workers.
+
+    INFERENCE_SIDECAR_AUTHKEY=<secret> python -m app.ml.sidecar
+    INFERENCE_SIDECAR_AUTHKEY=<secret> INFERENCE_BACKEND=sidecar uvicorn main:app --workers 4
+
+Messages are length-prefixed JSON headers followed by the raw bytes of a
+float32 array, so nothing received is ever unpickled. Both ends prove they
+know INFERENCE_SIDECAR_AUTHKEY (HMAC challenge-response) before any request,
+and Unix sockets are only created inside a directory private to the user.
+Traffic is not encrypted; keep TCP addresses on a trusted network.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import select
+import socket
+import stat
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from app.core.config import settings
+from app.ml.backends import SIDECAR_BACKEND
+from app.ml.executor import configure_tensorflow_threads
+from app.ml.predict import LEGACY_VERSION, ServedModel, load_served_model
+from app.ml.registry import RegistryError, model_registry
+
+logger = logging.getLogger(__name__)
+
+FRAME_LENGTH = struct.Struct("!I")
+MAX_HEADER_BYTES = 1024 * 1024
+# Well above INFERENCE_MAX_BATCH_SIZE images of 224x224x3 float32
+MAX_PAYLOAD_BYTES = 512 * 1024 * 1024
+ARRAY_DTYPE = np.dtype("<f4")
+CHALLENGE_BYTES = 32
+HANDSHAKE_TIMEOUT_SECONDS = 10.0
+
+class SidecarError(Exception):
+    pass
+
+class AuthenticationError(SidecarError):
+    pass
+
+def parse_address(address: str) -> Union[str, Tuple[str, int]]:
+    """
+    "host:port" listens on TCP, anything else is a Unix socket path.
+    """
+    host, sep, port = address.rpartition(":")
+    if sep and host and port.isdigit():
+        return host, int(port)
+    return address
+
+def _authkey(authkey: Optional[str]) -> bytes:
+    if not authkey:
+        raise SidecarError("INFERENCE_SIDECAR_AUTHKEY must be set to use the inference sidecar")
+    return authkey.encode()
+
+class Connection:
+    """
+    Frames over a socket: a 4-byte length, a JSON header and, when the
+    header has a shape, that many float32 values as raw bytes.
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+
+    def send(self, header: dict, array: Optional[np.ndarray] = None):
+        if array is not None:
+            # Raw bytes instead of serializing the array avoids an extra copy per batch
+            array = np.ascontiguousarray(array, dtype=ARRAY_DTYPE)
+            header = {**header, "shape": list(array.shape)}
+        encoded = json.dumps(header).encode()
+        self.sock.sendall(FRAME_LENGTH.pack(len(encoded)) + encoded)
+        if array is not None and array.nbytes:
+            self.sock.sendall(memoryview(array).cast("B"))
+
+    def _recv_exactly(self, size: int) -> bytearray:
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            count = self.sock.recv_into(view[received:])
+            if not count:
+                raise EOFError("Connection closed")
+            received += count
+        return buffer
+
+    def recv(self, allow_array: bool = True) -> Tuple[dict, Optional[np.ndarray]]:
+        (length,) = FRAME_LENGTH.unpack(self._recv_exactly(FRAME_LENGTH.size))
+        if length > MAX_HEADER_BYTES:
+            raise SidecarError(f"Frame header of {length} bytes exceeds the {MAX_HEADER_BYTES} bytes limit")
+        header = json.loads(self._recv_exactly(length))
+        if not isinstance(header, dict):
+            raise SidecarError("Malformed frame header")
+        shape = header.pop("shape", None)
+        if shape is None:
+            return header, None
+        if not allow_array:
+            raise SidecarError("Unexpected array payload")
+        if not isinstance(shape, list) or len(shape) > 8 or not all(isinstance(n, int) and n >= 0 for n in shape):
+            raise SidecarError("Malformed array shape")
+        size = int(np.prod(shape, dtype=np.int64)) * ARRAY_DTYPE.itemsize
+        if size > MAX_PAYLOAD_BYTES:
+            raise SidecarError(f"Array of {size} bytes exceeds the {MAX_PAYLOAD_BYTES} bytes limit")
+        return header, np.frombuffer(self._recv_exactly(size), dtype=ARRAY_DTYPE).reshape(shape)
+
+    def poll(self, timeout: float) -> bool:
+        readable, _, _ = select.select([self.sock], [], [], timeout)
+        return bool(readable)
+
+    def close(self):
+        self.sock.close()
+
+def _challenge(conn: Connection, authkey: bytes):
+    nonce = secrets.token_bytes(CHALLENGE_BYTES)
+    conn.send({"challenge": nonce.hex()})
+    header, _ = conn.recv(allow_array=False)
+    expected = hmac.new(authkey, nonce, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(str(header.get("response", "")).encode(), expected.encode()):
+        conn.send({"welcome": False})
+        raise AuthenticationError("Wrong authkey digest")
+    conn.send({"welcome": True})
+
+def _answer(conn: Connection, authkey: bytes):
+    header, _ = conn.recv(allow_array=False)
+    try:
+        nonce = bytes.fromhex(header["challenge"])
+    except (KeyError, TypeError, ValueError):
+        raise AuthenticationError("Malformed challenge")
+    conn.send({"response": hmac.new(authkey, nonce, hashlib.sha256).hexdigest()})
+    header, _ = conn.recv(allow_array=False)
+    if header.get("welcome") is not True:
+        raise AuthenticationError("Authkey rejected")
+
+def _open_socket(address: Union[str, Tuple[str, int]]) -> socket.socket:
+    return socket.socket(socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX, socket.SOCK_STREAM)
+
+def _private_socket_dir(path: str) -> str:
+    """
+    Creates the socket's directory with mode 0700, or checks that an
+    existing one belongs to this user and nobody else can enter it.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise SidecarError(
+            f"The sidecar socket must be in a directory owned by this user with mode 0700; {directory} is not"
+        )
+    return directory
+
+class InferenceSidecar:
+    """
+    Serves forward passes for the API workers. Each worker connection is
+    handled on its own thread; at most max_concurrent forward passes run at
+    once. Up to max_models versions stay loaded so workers can move to a new
+    version one by one while the others still use the previous one.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        authkey: Optional[str] = None,
+        backend_name: str = "keras",
+        max_concurrent: int = 1,
+        max_models: int = 2,
+    ):
+        self.address = parse_address(address)
+        # Refuse to serve without a key: anyone who can reach the socket could run inference
+        self.authkey = _authkey(authkey)
+        self.backend_name = backend_name
+        self.max_models = max_models
+        self._models: "OrderedDict[str, ServedModel]" = OrderedDict()
+        self._load_lock = threading.Lock()
+        self._slots = threading.Semaphore(max_concurrent)
+        self._connections = 0
+        self._listener: Optional[socket.socket] = None
+
+    def load(self, version: Optional[str], warm_up_batch_sizes: Sequence[int] = (1,)) -> ServedModel:
+        if version is None:
+            # Same fallback as resolve_model_source: legacy model when nothing is active
+            version = model_registry.active_version() or LEGACY_VERSION
+        with self._load_lock:
+            served = self._models.get(version)
+            if served is None:
+                requested = None if version == LEGACY_VERSION else version
+                served = load_served_model(requested, warm_up_batch_sizes, backend_name=self.backend_name)
+                if served is None:
+                    raise RegistryError("No model available to load")
+                self._models[served.version] = served
+                logger.info(f"Sidecar loaded model {served.version} ({served.backend.name})")
+            self._models.move_to_end(served.version)
+            while len(self._models) > self.max_models:
+                evicted, _ = self._models.popitem(last=False)
+                logger.info(f"Sidecar unloaded model {evicted}")
+            return served
+
+    def predict(self, version: str, batch: np.ndarray) -> np.ndarray:
+        served = self._models.get(version)
+        if served is None:
+            # Evicted while a worker was still on it; load it back
+            served = self.load(version)
+        with self._slots:
+            return np.asarray(served.backend.predict(batch), dtype=np.float32)
+
+    def embed(self, version: str, batch: np.ndarray) -> np.ndarray:
+        served = self._models.get(version) or self.load(version)
+        with self._slots:
+            return np.asarray(served.backend.embed(batch), dtype=np.float32)
+
+    def status(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "backend": self.backend_name,
+            "models": list(self._models),
+            "connections": self._connections,
+        }
+
+    def _handle(self, sock: socket.socket):
+        conn = Connection(sock)
+        try:
+            sock.settimeout(HANDSHAKE_TIMEOUT_SECONDS)
+            _challenge(conn, self.authkey)
+            _answer(conn, self.authkey)
+            sock.settimeout(None)
+        except (SidecarError, EOFError, OSError, ValueError) as e:
+            # A client without the authkey, or one that hung up during the handshake
+            logger.warning(f"Rejected sidecar connection: {str(e)}")
+            conn.close()
+            return
+        self._connections += 1
+        try:
+            while True:
+                try:
+                    request, batch = conn.recv()
+                except (EOFError, OSError):
+                    return
+                except (SidecarError, ValueError) as e:
+                    # Out of sync with the client after a malformed frame; drop it
+                    logger.warning(f"Malformed sidecar request: {str(e)}")
+                    return
+                command = request.get("command")
+                try:
+                    if command in ("predict", "embed") and batch is not None:
+                        run = self.predict if command == "predict" else self.embed
+                        conn.send({"status": "ok"}, run(request.get("version"), batch))
+                    elif command == "load":
+                        served = self.load(request.get("version"), request.get("warm_up_batch_sizes") or [1])
+                        conn.send({"status": "ok", "result": {
+                            "version": served.version,
+                            "backend": served.backend.name,
+                            "class_indices": served.class_indices,
+                            "fingerprint": served.fingerprint,
+                            # None when the sidecar's backend can't embed images (TFLite)
+                            "embedding_fingerprint": getattr(served.backend, "embedding_fingerprint", None),
+                        }})
+                    elif command == "status":
+                        conn.send({"status": "ok", "result": self.status()})
+                    else:
+                        conn.send({"status": "error", "kind": "SidecarError", "message": f"Unknown command: {command}"})
+                except (EOFError, OSError):
+                    return
+                except Exception as e:
+                    logger.error(f"Sidecar {command} failed: {str(e)}")
+                    conn.send({"status": "error", "kind": type(e).__name__, "message": str(e)})
+        finally:
+            self._connections -= 1
+            conn.close()
+
+    def serve_forever(self, preload: bool = True, warm_up_batch_sizes: Sequence[int] = (1,)):
+        if preload:
+            try:
+                self.load(None, warm_up_batch_sizes)
+            except Exception as e:
+                # Workers get the error when they ask for the model
+                logger.error(f"Sidecar could not preload the model: {str(e)}")
+        if isinstance(self.address, str):
+            _private_socket_dir(self.address)
+        self._listener = _open_socket(self.address)
+        if isinstance(self.address, str):
+            if os.path.exists(self.address) and stat.S_ISSOCK(os.lstat(self.address).st_mode):
+                # Left behind by a previous sidecar that didn't shut down cleanly
+                os.remove(self.address)
+            # Created 0600 from the start, not chmod-ed after other users could connect
+            umask = os.umask(0o177)
+            try:
+                self._listener.bind(self.address)
+            finally:
+                os.umask(umask)
+        else:
+            self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._listener.bind(self.address)
+        self._listener.listen()
+        logger.info(f"Inference sidecar listening on {self.address}")
+        try:
+            while True:
+                try:
+                    sock, _ = self._listener.accept()
+                except OSError as e:
+                    logger.warning(f"Failed to accept a sidecar connection: {str(e)}")
+                    continue
+                # The handshake runs on the connection's thread so a slow client can't stall accept()
+                threading.Thread(target=self._handle, args=(sock,), name="sidecar-connection", daemon=True).start()
+        finally:
+            self._listener.close()
+
+class SidecarClient:
+    """
+    Worker-side connection pool to the sidecar. A connection carries one
+    request at a time, so each inference thread checks one out; broken
+    connections (e.g. the sidecar restarted) are dropped and reopened.
+    """
+
+    def __init__(self, address: str, authkey: Optional[str] = None, timeout: float = 30.0, connect_timeout: float = 120.0):
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self._idle: List[Connection] = []
+        self._lock = threading.Lock()
+
+    def _connect(self, wait: bool) -> Connection:
+        # The sidecar may still be starting up (importing TensorFlow, loading weights)
+        authkey = _authkey(self.authkey)
+        deadline = time.monotonic() + (self.connect_timeout if wait else 0)
+        while True:
+            sock = _open_socket(self.address)
+            try:
+                sock.connect(self.address)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise SidecarError(f"Inference sidecar is not reachable at {self.address}")
+                time.sleep(0.5)
+        conn = Connection(sock)
+        try:
+            sock.settimeout(HANDSHAKE_TIMEOUT_SECONDS)
+            _answer(conn, authkey)
+            _challenge(conn, authkey)
+            sock.settimeout(None)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    @contextmanager
+    def _connection(self, wait: bool = False) -> Iterator[Connection]:
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect(wait)
+        try:
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+        with self._lock:
+            self._idle.append(conn)
+
+    def _receive(self, conn: Connection, timeout: float) -> Tuple[dict, Optional[np.ndarray]]:
+        if not conn.poll(timeout):
+            raise SidecarError(f"Inference sidecar did not answer within {timeout:.0f}s")
+        response, array = conn.recv()
+        if response.get("status") != "ok":
+            message = str(response.get("message"))
+            raise RegistryError(message) if response.get("kind") == "RegistryError" else SidecarError(message)
+        return response, array
+
+    def _call(self, request: dict, wait: bool = False, timeout: Optional[float] = None):
+        for attempt in (0, 1):
+            try:
+                with self._connection(wait) as conn:
+                    conn.send(request)
+                    return self._receive(conn, timeout or self.timeout)[0].get("result")
+            except (EOFError, BrokenPipeError, ConnectionResetError):
+                # Pooled connection to a sidecar that has since restarted
+                if attempt:
+                    raise SidecarError("Lost connection to the inference sidecar")
+
+    def load(self, version: Optional[str], warm_up_batch_sizes: Sequence[int] = (1,)) -> ServedModel:
+        # Loading may import TensorFlow and warm up the model in the sidecar
+        info = self._call(
+            {"command": "load", "version": version, "warm_up_batch_sizes": list(warm_up_batch_sizes)},
+            wait=True,
+            timeout=self.connect_timeout,
+        )
+        backend = SidecarBackend(self, info["version"], info["backend"], info.get("embedding_fingerprint"))
+        return ServedModel(info["version"], backend, info["class_indices"], info["fingerprint"])
+
+    def predict(self, version: str, batch: np.ndarray, command: str = "predict") -> np.ndarray:
+        for attempt in (0, 1):
+            try:
+                with self._connection() as conn:
+                    conn.send({"command": command, "version": version}, batch)
+                    _, result = self._receive(conn, self.timeout)
+                    if result is None:
+                        raise SidecarError("Inference sidecar answered without an array")
+                    return result
+            except (EOFError, BrokenPipeError, ConnectionResetError):
+                if attempt:
+                    raise SidecarError("Lost connection to the inference sidecar")
+
+    def status(self) -> dict:
+        return self._call({"command": "status"})
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+class SidecarBackend:
+    """
+    Inference backend that runs forward passes in the shared sidecar.
+    """
+
+    name = SIDECAR_BACKEND
+
+    def __init__(self, client: SidecarClient, version: str, remote_backend: str, embedding_fingerprint: Optional[str] = None):
+        self.client = client
+        self.version = version
+        self.remote_backend = remote_backend
+        self.embedding_fingerprint = embedding_fingerprint
+        self.model = None
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.client.predict(self.version, batch.astype(np.float32, copy=False))
+
+    def embed(self, batch: np.ndarray) -> np.ndarray:
+        return self.client.predict(self.version, batch.astype(np.float32, copy=False), command="embed")
+
+sidecar_client = SidecarClient(
+    settings.INFERENCE_SIDECAR_ADDRESS,
+    authkey=settings.INFERENCE_SIDECAR_AUTHKEY,
+    timeout=settings.INFERENCE_SIDECAR_TIMEOUT_SECONDS,
+    connect_timeout=settings.INFERENCE_SIDECAR_CONNECT_TIMEOUT_SECONDS,
+)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared inference process for the API workers")
+    parser.add_argument('--address', default=settings.INFERENCE_SIDECAR_ADDRESS)
+    parser.add_argument('--backend', default=settings.INFERENCE_SIDECAR_BACKEND, choices=['keras', 'tflite'])
+    parser.add_argument('--max-concurrent', type=int, default=settings.INFERENCE_WORKERS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    configure_tensorflow_threads(settings.TF_INTRA_OP_THREADS, settings.TF_INTER_OP_THREADS)
+    sidecar = InferenceSidecar(
+        args.address,
+        authkey=settings.INFERENCE_SIDECAR_AUTHKEY,
+        backend_name=args.backend,
+        max_concurrent=args.max_concurrent,
+    )
+    sidecar.serve_forever(warm_up_batch_sizes=sorted({1, settings.INFERENCE_MAX_BATCH_SIZE}))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    import tensorflow as tf
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+INDEX_DIR = os.path.join(DATA_DIR, 'similarity')
+# Where the indexed reference images live (dataset.DATASET_DIR, without importing TensorFlow)
+DATASET_DIR = os.path.join(DATA_DIR, 'dataset')
+EMBEDDINGS_FILE = 'embeddings.f16'
+ITEMS_FILE = 'items.json'
+INDEX_FORMAT_VERSION = 1
+EMBEDDER_NAME = 'dino_embedder'
+
+def create_embedder(model: "tf.keras.Model") -> "tf.keras.Model":
+    """
+    The part of a classifier built by create_model that ends at the pooled
+    MobileNetV2 features, sharing the classifier's weights.
+    """
+    import tensorflow as tf
+
+    pooling = [layer for layer in model.layers if isinstance(layer, tf.keras.layers.GlobalAveragePooling2D)]
+    if not pooling:
+        raise ValueError("The model has no pooled feature layer to embed images with")
+    return tf.keras.Model(inputs=model.input, outputs=pooling[-1].output, name=EMBEDDER_NAME)
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class SimilarityIndex:
+    """
+    Embeddings of the reference images, one L2-normalized float16 row per
+    image, so a dot product is the cosine similarity.
+
+    Rows live in a flat file read through np.memmap and are only ever
+    appended; items.json (image key, path, label, split for every row) is
+    replaced atomically after the rows are written, like the feature cache.
+    Readers pick up a newer items.json on their next search, so the index
+    can be extended while the API is serving from it.
+    """
+
+    def __init__(self, directory: str = INDEX_DIR, chunk_rows: int = 16384):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.embeddings_path = os.path.join(directory, EMBEDDINGS_FILE)
+        self.items_path = os.path.join(directory, ITEMS_FILE)
+        # (items, embeddings, fingerprint, rows by key), swapped as a whole on reload
+        self._snapshot: Tuple[List[dict], np.ndarray, Optional[str], dict] = self._empty()
+        self._loaded_signature: Optional[tuple] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _empty() -> tuple:
+        return [], np.zeros((0, 0), dtype=np.float16), None, {}
+
+    def __len__(self) -> int:
+        return len(self._snapshot[0])
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        return self._snapshot[2]
+
+    def refresh(self) -> bool:
+        """
+        Loads items.json again if it changed on disk. Returns whether the
+        index has any rows.
+        """
+        try:
+            stat = os.stat(self.items_path)
+            signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except FileNotFoundError:
+            signature = None
+        if signature != self._loaded_signature:
+            with self._lock:
+                if signature != self._loaded_signature:
+                    self._load(signature)
+        return len(self) > 0
+
+    def _load(self, signature: Optional[tuple]):
+        if signature is None:
+            self._snapshot = self._empty()
+        else:
+            with open(self.items_path) as f:
+                header = json.load(f)
+            if header.get("format_version") != INDEX_FORMAT_VERSION:
+                raise ValueError(f"Unsupported similarity index format: {header.get('format_version')}")
+            items = header["items"]
+            embeddings = np.memmap(
+                self.embeddings_path, dtype=np.float16, mode='r', shape=(len(items), header["dim"])
+            ) if items else np.zeros((0, header["dim"]), dtype=np.float16)
+            keys = {item["key"]: row for row, item in enumerate(items)}
+            self._snapshot = (items, embeddings, header["fingerprint"], keys)
+        self._loaded_signature = signature
+
+    def item(self, key: str) -> Optional[dict]:
+        items, _, _, keys = self._snapshot
+        row = keys.get(key)
+        return items[row] if row is not None else None
+
+    def image_path(self, item: dict) -> str:
+        return os.path.join(DATASET_DIR, item["path"])
+
+    def append(self, items: List[dict], embeddings: np.ndarray, fingerprint: str) -> int:
+        """
+        Adds rows for new images. Every row of an index must come from the
+        same embedder weights (fingerprint).
+        """
+        self.refresh()
+        current_items, current, current_fingerprint, _ = self._snapshot
+        embeddings = normalize(embeddings).astype(np.float16)
+        if current_items and (fingerprint != current_fingerprint or embeddings.shape[1] != current.shape[1]):
+            raise ValueError("Embeddings come from different weights than the index; rebuild it")
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.embeddings_path, 'ab') as f:
+            # Drop bytes left by an append that crashed before items.json was written
+            f.truncate(len(current_items) * embeddings.shape[1] * 2)
+            f.write(embeddings.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_path = self.items_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                "format_version": INDEX_FORMAT_VERSION,
+                "dim": int(embeddings.shape[1]),
+                "fingerprint": fingerprint,
+                "items": current_items + items,
+            }, f)
+        os.replace(tmp_path, self.items_path)
+        self.refresh()
+        return len(self)
+
+    def clear(self):
+        for path in (self.items_path, self.embeddings_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.refresh()
+
+    def search(self, queries: np.ndarray, k: int) -> List[List[Tuple[dict, float]]]:
+        """
+        Top-k most similar images for each query embedding, best first.
+        Scans the matrix in chunks: one matrix multiply per chunk scores all
+        queries at once, and only each chunk's k best survive to the merge.
+        """
+        items, embeddings, _, _ = self._snapshot
+        queries = normalize(queries)
+        k = min(k, len(items))
+        if k <= 0:
+            return [[] for _ in queries]
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(items), self.chunk_rows):
+            block = np.asarray(embeddings[start:start + self.chunk_rows], dtype=np.float32)
+            scores = queries @ block.T
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                rows = top + start
+            else:
+                rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            if best_scores.shape[1] > k:
+                top = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, top, axis=1)
+                best_rows = np.take_along_axis(best_rows, top, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        # float16 rounding can push a perfect match slightly past 1
+        best_scores = np.clip(best_scores, -1.0, 1.0)
+        return [
+            [(items[row], float(score)) for row, score in zip(query_rows, query_scores)]
+            for query_rows, query_scores in zip(best_rows, best_scores)
+        ]
+
+    def stats(self) -> dict:
+        items, embeddings, fingerprint, _ = self._snapshot
+        return {
+            "images": len(items),
+            "dim": int(embeddings.shape[1]),
+            "fingerprint": fingerprint,
+            "bytes": int(embeddings.nbytes),
+        }
+
+similarity_index = SimilarityIndex(settings.SIMILARITY_INDEX_DIR or INDEX_DIR)
+
+def similar_images_batch(queries: List[Tuple[np.ndarray, int]]) -> List[dict]:
+    """
+    Embeds a batch of (preprocessed image, k) queries with the served model
+    in one forward pass and looks all of them up in the index at once.
+    """
+    from app.ml.predict import get_served_model, model_unavailable_error
+
+    served = get_served_model()
+    if served is None:
+        return [model_unavailable_error() for _ in queries]
+    try:
+        indexed = similarity_index.refresh()
+    except (OSError, ValueError, KeyError) as e:
+        # A corrupt or wrong-format items.json; answered like a missing index until it's rebuilt
+        logger.error(f"Could not load the similarity index: {str(e)}")
+        indexed, load_error = False, str(e)
+    else:
+        load_error = None
+    if getattr(served.backend, 'embedding_fingerprint', None) is None:
+        error = {"error": "Similarity unavailable", "message": f"The {served.backend.name} backend can't compute image embeddings"}
+    elif load_error is not None:
+        error = {"error": "Similarity unavailable", "message": f"The similarity index can't be read; rebuild it ({load_error})"}
+    elif not indexed:
+        error = {"error": "Similarity unavailable", "message": "The similarity index has not been built yet"}
+    elif served.backend.embedding_fingerprint != similarity_index.fingerprint:
+        error = {"error": "Similarity unavailable", "message": "The similarity index was built with different weights; rebuild it"}
+    else:
+        error = None
+    if error is not None:
+        return [error for _ in queries]
+    try:
+        embeddings = served.backend.embed(np.stack([image for image, _ in queries]))
+        matches = similarity_index.search(embeddings, max(k for _, k in queries))
+    except Exception as e:
+        return [{"error": "Search failed", "message": str(e)} for _ in queries]
+    return [
+        {
+            "success": True,
+            "matches": [{**item, "score": score} for item, score in image_matches[:k]],
+            "model_version": served.version,
+        }
+        for (_, k), image_matches in zip(queries, matches)
+    ]
+
+def update_index(index: SimilarityIndex = similarity_index, rebuild: bool = False, batch_size: int = 32) -> dict:
+    """
+    Embeds the images of dataset/train and dataset/validation that are not
+    in the index yet (by content hash) and appends them, so adding images
+    only costs a forward pass over the new ones. rebuild starts from scratch,
+    e.g. after removing images.
+    """
+    from app.ml.dataset import SPLITS, get_class_names, list_images
+    from app.ml.predict import decode_image, get_served_model
+
+    served = get_served_model()
+    if served is None or getattr(served.backend, 'embedding_fingerprint', None) is None:
+        raise RuntimeError("Building the similarity index needs a loaded Keras (or sidecar) model")
+    fingerprint = served.backend.embedding_fingerprint
+    if rebuild:
+        index.clear()
+    index.refresh()
+    if len(index) and index.fingerprint != fingerprint:
+        logger.info("Model weights changed since the index was built, rebuilding it")
+        index.clear()
+
+    class_names = get_class_names()
+    pending_images, pending_items = [], []
+    added = 0
+
+    def flush():
+        nonlocal added
+        index.append(pending_items, served.backend.embed(np.stack(pending_images)), fingerprint)
+        added += len(pending_items)
+        pending_images.clear()
+        pending_items.clear()
+
+    for split in SPLITS:
+        for path, label in list_images(split, class_names):
+            with open(path, 'rb') as f:
+                content = f.read()
+            # Same key as the training shards; identical files share a row
+            key = hashlib.sha1(content).hexdigest()
+            if index.item(key) is not None or any(item["key"] == key for item in pending_items):
+                continue
+            try:
+                pending_images.append(decode_image(content))
+            except Exception as e:
+                logger.warning(f"Skipping {path}: {str(e)}")
+                continue
+            pending_items.append({
+                "key": key,
+                "path": os.path.relpath(path, DATASET_DIR),
+                "label": class_names[label],
+                "split": split,
+            })
+            if len(pending_items) >= batch_size:
+                flush()
+    if pending_items:
+        flush()
+    logger.info(f"Similarity index: {added} images added, {len(index)} total")
+    return {"added": added, **index.stats()}
@@ -1,13 +1,33 @@
 import tensorflow as tf
 from tensorflow.keras.applications import MobileNetV2
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D
+from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Resizing
 from tensorflow.keras.models import Model
+from app.ml.backends import CascadeBackend, KerasBackend, TFLiteBackend
+from app.ml.dataset import build_shards, ensure_shards, make_dataset, shards_summary
+from app.ml.features import FEATURES_DIR, FeatureCache, base_fingerprint, create_feature_extractor, split_features
+from app.ml.predict import IMAGE_SIZE, decode_image
+from app.ml.registry import CASCADE_ARTIFACT, LABELS_ARTIFACT, MODEL_ARTIFACT, TFLITE_ARTIFACT, RegistryError, model_registry, write_label_manifest
+from app.ml import runner
+from app.ml.runner import TrainingRun
+from typing import Optional
+import json
+import logging
+import numpy as np
 import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
 
 # Definir la ruta base para los datos
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+# Legacy single-model location, used before the model registry
+MODEL_FILENAME = 'dino_analyzer_model.keras'
+LABELS_FILENAME = 'dino_analyzer_model.labels.json'
 
 def get_data_generators():
+    # Legacy ImageDataGenerator pipeline, kept for comparison benchmarks
+    # (it reads dataset/ itself, so train/ and validation/ become the classes)
     train_datagen = tf.keras.preprocessing.image.ImageDataGenerator(
         rescale=1./255,
         rotation_range=20,
@@ -36,8 +56,9 @@ def get_data_generators():
 
     return train_generator, validation_generator
 
-def create_model(num_classes):
-    base_model = MobileNetV2(weights='imagenet', include_top=False)
+def create_model(num_classes, base_model=None):
+    if base_model is None:
+        base_model = MobileNetV2(weights='imagenet', include_top=False)
     
     x = base_model.output
     x = GlobalAveragePooling2D()(x)
@@ -51,30 +72,209 @@ def create_model(num_classes):
         
     return model
 
-def train_model():
-    train_generator, validation_generator = get_data_generators()
-    
-    model = create_model(len(train_generator.class_indices))
-    
+# Adam's default for a run from ImageNet weights; fine-tuning a trained head takes smaller steps
+FULL_LEARNING_RATE = 1e-3
+INCREMENTAL_LEARNING_RATE = 1e-4
+
+def remap_classes(model, old_class_indices: dict, class_indices: dict):
+    """
+    Gives a trained model the output layer for class_indices. Classes it
+    already knew keep their trained weights, new ones start untrained and
+    removed ones are dropped.
+    """
+    if old_class_indices == class_indices:
+        return model
+    old_kernel, old_bias = model.layers[-1].get_weights()
+    # Auto-generated names restart per session and could clash with the loaded layers'
+    names = {layer.name for layer in model.layers}
+    name = 'predictions'
+    while name in names:
+        name += '_remapped'
+    predictions = Dense(len(class_indices), activation='softmax', name=name)(model.layers[-2].output)
+    remapped = Model(inputs=model.input, outputs=predictions)
+    kernel, bias = remapped.layers[-1].get_weights()
+    for name, index in class_indices.items():
+        if name in old_class_indices:
+            kernel[:, index] = old_kernel[:, old_class_indices[name]]
+            bias[index] = old_bias[old_class_indices[name]]
+    remapped.layers[-1].set_weights([kernel, bias])
+    return remapped
+
+def build_training_model(config: dict, class_indices: dict):
+    """
+    A new model from ImageNet weights, or for incremental runs the parent
+    version's model adapted to the current classes; compiled for training.
+    """
+    if config["parent_version"] is None:
+        model = create_model(len(class_indices))
+    else:
+        parent = config["parent_version"]
+        model = remap_classes(
+            tf.keras.models.load_model(model_registry.artifact_path(parent, MODEL_ARTIFACT)),
+            model_registry.read_labels(parent)['class_indices'],
+            class_indices,
+        )
     model.compile(
-        optimizer='adam',
+        optimizer=tf.keras.optimizers.Adam(learning_rate=config["learning_rate"]),
         loss='categorical_crossentropy',
         metrics=['accuracy']
     )
-    
-    # Crear directorio para modelos si no existe
-    models_dir = os.path.join(DATA_DIR, 'models')
-    os.makedirs(models_dir, exist_ok=True)
-    
-    history = model.fit(
-        train_generator,
-        steps_per_epoch=train_generator.samples // train_generator.batch_size,
-        epochs=10,
-        validation_data=validation_generator,
-        validation_steps=validation_generator.samples // validation_generator.batch_size
+    return model
+
+def train_model(
+    epochs: int = 10,
+    batch_size: int = 32,
+    incremental: bool = False,
+    resume: Optional[str] = None,
+    learning_rate: Optional[float] = None,
+    patience: int = 3,
+    checkpoint_every: int = 1,
+) -> Optional[dict]:
+    """
+    Trains a model from the packed shards (built on first use from
+    dataset/train and dataset/validation) and publishes it to the registry.
+
+    The run is recorded under data/runs/<run id>/ (see app/ml/runner.py):
+    checkpoints to resume from after a crash (resume=<run id> or "latest"),
+    early stopping and learning-rate reduction on val_loss, and per-epoch
+    wall time and images/sec in run.json. incremental fine-tunes the active
+    version's model instead of starting from ImageNet weights, and does
+    nothing when the dataset hasn't changed since that version was trained.
+    Returns the run record, or None when there was nothing to train.
+    Resuming a run that already completed returns its record as is.
+    """
+    manifest = ensure_shards()
+    class_indices = {name: index for index, name in enumerate(manifest["class_names"])}
+    if resume is not None:
+        run = TrainingRun.load(resume)
+        if run.record["status"] == runner.COMPLETED:
+            # Its model is already published; training again would publish a duplicate
+            logger.info(f"Run {run.run_id} already completed as model {run.record['version']}, nothing to do")
+            return run.record
+        if run.record["config"]["dataset_fingerprint"] != manifest["fingerprint"]:
+            raise ValueError(f"The dataset changed since run {run.run_id} started; start a new run")
+        model = run.load_checkpoint()
+    else:
+        parent_version = None
+        if incremental:
+            parent_version = model_registry.active_version()
+            if parent_version is None:
+                raise RegistryError("Incremental training needs an active model version to start from")
+            if model_registry.read_metrics(parent_version).get("dataset_fingerprint") == manifest["fingerprint"]:
+                logger.info(f"Dataset unchanged since model {parent_version} was trained, nothing to do")
+                return None
+        run = TrainingRun.create({
+            "mode": "incremental" if incremental else "full",
+            "parent_version": parent_version,
+            "epochs": epochs,
+            "batch_size": batch_size,
+            "learning_rate": learning_rate or (INCREMENTAL_LEARNING_RATE if incremental else FULL_LEARNING_RATE),
+            "patience": patience,
+            "checkpoint_every": checkpoint_every,
+            "dataset_fingerprint": manifest["fingerprint"],
+            "class_indices": class_indices,
+        })
+        model = None
+    config = run.record["config"]
+    if model is None:
+        model = build_training_model(config, class_indices)
+
+    model = runner.fit(
+        run,
+        model,
+        make_dataset('train', manifest, batch_size=config["batch_size"], training=True),
+        make_dataset('validation', manifest, batch_size=config["batch_size"]),
+        train_samples=manifest["splits"]["train"]["count"],
+        epochs=config["epochs"],
+        patience=config["patience"],
+        checkpoint_every=config["checkpoint_every"],
     )
     
-    model.save(os.path.join(models_dir, 'dino_analyzer_model.keras'))
+    # Guardar una nueva versión en el registro de modelos y activarla
+    best = run.record["best"] or run.record["epochs"][-1]
+    metrics = {
+        name: best[name] for name in ("loss", "accuracy", "val_loss", "val_accuracy") if name in best
+    }
+    metrics["train_samples"] = manifest["splits"]["train"]["count"]
+    metrics["validation_samples"] = manifest["splits"]["validation"]["count"]
+    metrics["dataset_fingerprint"] = manifest["fingerprint"]
+    metrics["training_mode"] = config["mode"]
+    metrics["parent_version"] = config["parent_version"]
+    metrics["run_id"] = run.run_id
+    metrics["epochs_trained"] = len(run.record["epochs"])
+    metrics["best_epoch"] = best["epoch"]
+    runner.complete(run, model_registry.publish(model, class_indices, metrics))
+    return run.record
+
+def create_head(num_classes, feature_dim):
+    """
+    The trainable layers of create_model, on top of pooled base features.
+    """
+    features = tf.keras.Input(shape=(feature_dim,))
+    x = Dense(1024, activation='relu')(features)
+    predictions = Dense(num_classes, activation='softmax')(x)
+    return Model(inputs=features, outputs=predictions)
+
+def train_head(epochs: int = 10, batch_size: int = 32):
+    """
+    Bottleneck training: runs the frozen base once per image (cached on disk
+    per base weights, keyed by image content), trains only the classification
+    head on the cached features and folds it back into a full model that is
+    published like any other version.
+
+    Features are computed on un-augmented images, so this trades augmentation
+    for speed; use train_model for a full run.
+    """
+    manifest = ensure_shards()
+    class_indices = {name: index for index, name in enumerate(manifest["class_names"])}
+    num_classes = len(class_indices)
+
+    base_model = MobileNetV2(weights='imagenet', include_top=False)
+    extractor = create_feature_extractor(base_model)
+    feature_dim = extractor.output_shape[-1]
+    fingerprint = base_fingerprint(base_model)
+    cache = FeatureCache(os.path.join(FEATURES_DIR, fingerprint[:16]), feature_dim)
+
+    train_rows, train_labels, train_extracted = split_features('train', manifest, extractor, cache)
+    validation_rows, validation_labels, validation_extracted = split_features('validation', manifest, extractor, cache)
+    features = cache.features()
+
+    head = create_head(num_classes, feature_dim)
+    head.compile(
+        optimizer='adam',
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    history = head.fit(
+        features[train_rows],
+        tf.keras.utils.to_categorical(train_labels, num_classes),
+        batch_size=batch_size,
+        epochs=epochs,
+        shuffle=True,
+        validation_data=(
+            features[validation_rows],
+            tf.keras.utils.to_categorical(validation_labels, num_classes),
+        ),
+    )
+
+    # Plegar la cabeza entrenada sobre la base congelada para servir un modelo completo
+    model = create_model(num_classes, base_model)
+    model.layers[-2].set_weights(head.layers[-2].get_weights())
+    model.layers[-1].set_weights(head.layers[-1].get_weights())
+
+    metrics = {
+        name: float(values[-1]) for name, values in history.history.items()
+    }
+    metrics["train_samples"] = manifest["splits"]["train"]["count"]
+    metrics["validation_samples"] = manifest["splits"]["validation"]["count"]
+    metrics["dataset_fingerprint"] = manifest["fingerprint"]
+    metrics["training_mode"] = "bottleneck"
+    metrics["feature_cache"] = {
+        "base_fingerprint": fingerprint,
+        "rows": len(cache),
+        "extracted": train_extracted + validation_extracted,
+    }
+    model_registry.publish(model, class_indices, metrics)
     return history
 
 def get_train_generator():
@@ -85,5 +285,313 @@ def get_train_generator():
     train_generator, _ = get_data_generators()
     return train_generator
 
+def export_label_manifest():
+    """
+    Writes the label manifest for an already trained model without retraining.
+    Useful for models saved before the manifest existed. The classes come
+    from the shard manifest, as in train_model.
+    """
+    manifest = ensure_shards()
+    class_indices = {name: index for index, name in enumerate(manifest["class_names"])}
+    models_dir = os.path.join(DATA_DIR, 'models')
+    os.makedirs(models_dir, exist_ok=True)
+    return write_label_manifest(
+        class_indices, models_dir,
+        filename=LABELS_FILENAME, model_filename=MODEL_FILENAME
+    )
+
+QUANTIZATION_MODES = ('none', 'float16', 'int8')
+
+class ExportRejected(Exception):
+    pass
+
+def load_image_folder(split: str, class_indices: dict):
+    """
+    Loads dataset/<split> with exactly the preprocessing used when serving.
+    Images of classes the model doesn't know are skipped.
+    """
+    split_dir = os.path.join(DATA_DIR, 'dataset', split)
+    images, labels = [], []
+    for class_name in sorted(os.listdir(split_dir)):
+        if class_name not in class_indices:
+            continue
+        class_dir = os.path.join(split_dir, class_name)
+        for filename in sorted(os.listdir(class_dir)):
+            with open(os.path.join(class_dir, filename), 'rb') as f:
+                images.append(decode_image(f))
+            labels.append(class_indices[class_name])
+    return np.stack(images), np.array(labels)
+
+def top1_accuracy(backend, images: np.ndarray, labels: np.ndarray, batch_size: int = 32) -> float:
+    correct = 0
+    for start in range(0, len(images), batch_size):
+        predictions = backend.predict(images[start:start + batch_size])
+        correct += int(np.sum(np.argmax(predictions, axis=1) == labels[start:start + batch_size]))
+    return correct / len(images)
+
+def convert_to_tflite(model, quantization: str = 'none', representative_images=None) -> bytes:
+    """
+    Converts a Keras model to TFLite. float16 halves the weights; int8 uses
+    full integer kernels calibrated on representative_images while keeping
+    float inputs and outputs, so serving code doesn't change.
+    """
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode: {quantization}")
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantization == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        if representative_images is None:
+            raise ValueError("int8 quantization needs representative images")
+
+        def representative_dataset():
+            for image in representative_images:
+                yield [image[np.newaxis].astype(np.float32)]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+    return converter.convert()
+
+def export_tflite(version: str = None, quantization: str = 'none', max_accuracy_drop: float = 0.01) -> dict:
+    """
+    Exports a registered model version to TFLite and stores it next to the
+    Keras model. The export is rejected, and nothing is stored, if its top-1
+    accuracy on the validation split falls more than max_accuracy_drop below
+    the Keras model's.
+    """
+    version = version or model_registry.active_version()
+    if version is None:
+        raise ExportRejected("No model version to export")
+    with open(model_registry.artifact_path(version, LABELS_ARTIFACT)) as f:
+        class_indices = json.load(f)['class_indices']
+    model = tf.keras.models.load_model(model_registry.artifact_path(version, MODEL_ARTIFACT))
+
+    images, labels = load_image_folder('validation', class_indices)
+    tflite_model = convert_to_tflite(model, quantization, representative_images=images)
+
+    with tempfile.NamedTemporaryFile(suffix='.tflite') as f:
+        f.write(tflite_model)
+        f.flush()
+        tflite_accuracy = top1_accuracy(TFLiteBackend(f.name), images, labels)
+    keras_accuracy = top1_accuracy(KerasBackend(model), images, labels)
+
+    report = {
+        "quantization": quantization,
+        "keras_top1": keras_accuracy,
+        "tflite_top1": tflite_accuracy,
+        "size_bytes": len(tflite_model),
+        "validation_samples": int(len(images)),
+    }
+    if keras_accuracy - tflite_accuracy > max_accuracy_drop:
+        raise ExportRejected(
+            f"TFLite top-1 {tflite_accuracy:.4f} regresses more than {max_accuracy_drop} "
+            f"from Keras top-1 {keras_accuracy:.4f}"
+        )
+    model_registry.add_artifact(version, TFLITE_ARTIFACT, tflite_model)
+    model_registry.update_metrics(version, {"tflite": report})
+    return report
+
+# First stage of the cascade: a 0.35-width MobileNetV2 at 96x96
+CASCADE_IMAGE_SIZE = (96, 96)
+CASCADE_ALPHA = 0.35
+
+def create_cascade_model(num_classes, image_size=CASCADE_IMAGE_SIZE, alpha=CASCADE_ALPHA, weights='imagenet'):
+    """
+    Small first-stage model for the cascade. Takes the same 224x224 input as
+    create_model and downsizes it itself, so serving feeds both models the
+    same batch; a single softmax layer replaces the Dense(1024) head.
+    """
+    inputs = tf.keras.Input(shape=(*IMAGE_SIZE, 3))
+    base_model = MobileNetV2(input_shape=(*image_size, 3), alpha=alpha, weights=weights, include_top=False)
+    base_model.trainable = False
+    x = Resizing(*image_size)(inputs)
+    x = base_model(x, training=False)
+    x = GlobalAveragePooling2D()(x)
+    predictions = Dense(num_classes, activation='softmax')(x)
+    return Model(inputs=inputs, outputs=predictions)
+
+def predict_probabilities(backend, images: np.ndarray, batch_size: int = 32) -> np.ndarray:
+    return np.concatenate([
+        backend.predict(images[start:start + batch_size]) for start in range(0, len(images), batch_size)
+    ])
+
+def calibrate_threshold(confidences: np.ndarray, first_stage_correct: np.ndarray, full_correct: np.ndarray, max_accuracy_drop: float) -> float:
+    """
+    Lowest first-stage confidence threshold whose cascade accuracy stays
+    within max_accuracy_drop of the full model's, i.e. the one that
+    escalates the fewest images. Images at or above the threshold are
+    answered by the first stage.
+    """
+    order = np.argsort(-confidences, kind='stable')
+    confidences = confidences[order]
+    # Correct answers when the k most confident images (k = 0..n) are answered by the first stage
+    correct = (
+        np.concatenate([[0], np.cumsum(first_stage_correct[order])])
+        + np.concatenate([np.cumsum(full_correct[order][::-1])[::-1], [0]])
+    )
+    target = full_correct.mean() - max_accuracy_drop
+    # A threshold can only split the images between two different confidences
+    splits = np.concatenate([[True], confidences[:-1] > confidences[1:], [True]])
+    answered = int(np.flatnonzero(splits & (correct / len(confidences) >= target - 1e-9)).max())
+    if answered == 0:
+        # Escalate everything seen during calibration
+        return float(np.nextafter(confidences[0], np.inf))
+    return float(confidences[answered - 1])
+
+def mean_latency_ms(backend, images: np.ndarray) -> float:
+    """
+    Mean single-image latency, as for an unbatched request.
+    """
+    backend.predict(images[:1])
+    started = time.perf_counter()
+    for image in images:
+        backend.predict(image[np.newaxis])
+    return (time.perf_counter() - started) / len(images) * 1000
+
+def evaluate_cascade(first_stage, full, images: np.ndarray, labels: np.ndarray, max_accuracy_drop: float = 0.01, latency_samples: int = 50) -> dict:
+    """
+    Calibrates the threshold on images and reports the cascade's accuracy,
+    escalation rate and single-image latency against the full model alone.
+    The threshold is fitted on the same images, so its accuracy is slightly
+    optimistic.
+    """
+    first_probabilities = predict_probabilities(first_stage, images)
+    first_correct = np.argmax(first_probabilities, axis=1) == labels
+    full_correct = np.argmax(predict_probabilities(full, images), axis=1) == labels
+    confidences = first_probabilities.max(axis=1)
+    threshold = calibrate_threshold(confidences, first_correct, full_correct, max_accuracy_drop)
+    escalate = confidences < threshold
+
+    sample = images[np.linspace(0, len(images) - 1, min(latency_samples, len(images))).astype(int)]
+    full_ms = mean_latency_ms(full, sample)
+    cascade_ms = mean_latency_ms(CascadeBackend(first_stage, full, threshold, record_metrics=False), sample)
+    return {
+        "threshold": threshold,
+        "max_accuracy_drop": max_accuracy_drop,
+        "validation_samples": int(len(images)),
+        "full_top1": float(full_correct.mean()),
+        "first_stage_top1": float(first_correct.mean()),
+        "cascade_top1": float(np.where(escalate, full_correct, first_correct).mean()),
+        "escalation_rate": float(escalate.mean()),
+        "latency_samples": int(len(sample)),
+        "full_latency_ms": full_ms,
+        "cascade_latency_ms": cascade_ms,
+        "latency_saved_ms": full_ms - cascade_ms,
+    }
+
+def train_cascade(version: str = None, epochs: int = 10, batch_size: int = 32, max_accuracy_drop: float = 0.01, weights: str = 'imagenet') -> dict:
+    """
+    Trains the small first-stage model for a registered version on the same
+    shards, calibrates its confidence threshold against the version's model
+    on the validation split and stores both with the version. Rejected, and
+    nothing stored, when the cascade isn't faster than the full model.
+    """
+    version = version or model_registry.active_version()
+    if version is None:
+        raise ExportRejected("No model version to add a cascade to")
+    class_indices = model_registry.read_labels(version)['class_indices']
+    manifest = ensure_shards()
+    if {name: index for index, name in enumerate(manifest["class_names"])} != class_indices:
+        raise ExportRejected(f"Model {version} was trained on different classes than the current shards")
+
+    first_stage = create_cascade_model(len(class_indices), weights=weights)
+    first_stage.compile(
+        optimizer='adam',
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    history = first_stage.fit(
+        make_dataset('train', manifest, batch_size=batch_size, training=True),
+        epochs=epochs,
+        validation_data=make_dataset('validation', manifest, batch_size=batch_size)
+    )
+
+    full = tf.keras.models.load_model(model_registry.artifact_path(version, MODEL_ARTIFACT))
+    images, labels = load_image_folder('validation', class_indices)
+    report = evaluate_cascade(KerasBackend(first_stage), KerasBackend(full), images, labels, max_accuracy_drop)
+    report.update({
+        "image_size": list(CASCADE_IMAGE_SIZE),
+        "alpha": CASCADE_ALPHA,
+        "training": {name: float(values[-1]) for name, values in history.history.items()},
+    })
+    if report["latency_saved_ms"] <= 0:
+        raise ExportRejected(
+            f"Cascade escalates {report['escalation_rate']:.1%} of images and is not faster "
+            f"({report['cascade_latency_ms']:.1f} ms vs {report['full_latency_ms']:.1f} ms)"
+        )
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, CASCADE_ARTIFACT)
+        first_stage.save(path)
+        with open(path, 'rb') as f:
+            model_registry.add_artifact(version, CASCADE_ARTIFACT, f.read())
+    model_registry.update_metrics(version, {"cascade": report})
+    return report
+
 if __name__ == '__main__':
-    train_model() 
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Dino model training")
+    subparsers = parser.add_subparsers(dest='command')
+    train_parser = subparsers.add_parser('train', help="Train and publish a new model version (default)")
+    train_parser.add_argument('--epochs', type=int, default=10)
+    train_parser.add_argument('--batch-size', type=int, default=32)
+    train_parser.add_argument('--incremental', action='store_true', help="Fine-tune the active version on the changed dataset")
+    train_parser.add_argument('--resume', default=None, metavar='RUN_ID', help="Continue a run from its last checkpoint ('latest' for the most recent)")
+    train_parser.add_argument('--learning-rate', type=float, default=None)
+    train_parser.add_argument('--patience', type=int, default=3, help="Epochs without val_loss improvement before stopping")
+    train_parser.add_argument('--checkpoint-every', type=int, default=1)
+    train_parser.add_argument('--cascade', action='store_true', help="Also train its cascade first stage (for --epochs too)")
+    head_parser = subparsers.add_parser('train-head', help="Train only the head on cached base features")
+    head_parser.add_argument('--epochs', type=int, default=10)
+    head_parser.add_argument('--cascade', action='store_true', help="Also train its cascade first stage (for --epochs too)")
+    cascade_parser = subparsers.add_parser('train-cascade', help="Train and calibrate the cascade first stage of a version")
+    cascade_parser.add_argument('--version', default=None)
+    cascade_parser.add_argument('--epochs', type=int, default=10)
+    cascade_parser.add_argument('--max-accuracy-drop', type=float, default=0.01)
+    subparsers.add_parser('labels', help="Write the label manifest for the legacy model")
+    shards_parser = subparsers.add_parser('build-shards', help="Pack new dataset/train and dataset/validation images into shards")
+    shards_parser.add_argument('--rebuild', action='store_true', help="Re-decode every image from scratch")
+    export_parser = subparsers.add_parser('export-tflite', help="Export a version to TFLite")
+    export_parser.add_argument('--version', default=None)
+    export_parser.add_argument('--quantization', choices=QUANTIZATION_MODES, default='none')
+    export_parser.add_argument('--max-accuracy-drop', type=float, default=0.01)
+    index_parser = subparsers.add_parser('build-index', help="Add new dataset images to the similar-image index")
+    index_parser.add_argument('--rebuild', action='store_true', help="Re-embed every image from scratch")
+    args = parser.parse_args()
+    if args.command is None:
+        args = parser.parse_args(['train'])
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == 'labels':
+        print(export_label_manifest())
+    elif args.command == 'train-head':
+        train_head(epochs=args.epochs)
+        if args.cascade:
+            print(json.dumps(train_cascade(epochs=args.epochs), indent=2))
+    elif args.command == 'train-cascade':
+        print(json.dumps(train_cascade(args.version, args.epochs, max_accuracy_drop=args.max_accuracy_drop), indent=2))
+    elif args.command == 'build-shards':
+        print(json.dumps(shards_summary(build_shards(rebuild=args.rebuild)), indent=2))
+    elif args.command == 'export-tflite':
+        print(json.dumps(export_tflite(args.version, args.quantization, args.max_accuracy_drop), indent=2))
+    elif args.command == 'build-index':
+        from app.ml.similarity import update_index
+        print(json.dumps(update_index(rebuild=args.rebuild), indent=2))
+    else:
+        record = train_model(
+            epochs=args.epochs,
+            batch_size=args.batch_size,
+            incremental=args.incremental,
+            resume=args.resume,
+            learning_rate=args.learning_rate,
+            patience=args.patience,
+            checkpoint_every=args.checkpoint_every,
+        )
+        if record is None:
+            print("Dataset unchanged, nothing to train")
+        else:
+            print(json.dumps({name: record[name] for name in ("run_id", "version", "stop_reason", "best")}, indent=2))
+            if args.cascade:
+                print(json.dumps(train_cascade(record["version"], args.epochs), indent=2))
\ No newline at end of file
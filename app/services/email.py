@@ -1,122 +1,379 @@
+import asyncio
+import logging
 import smtplib
-from email.mime.text import MIMEText
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from email.message import Message
 from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Dict, List, Optional, Tuple
+
 from app.core.config import settings
-from fastapi import HTTPException
-import logging
-import ssl
 
 logger = logging.getLogger(__name__)
 
+class EmailQueueFull(Exception):
+    pass
+
+@dataclass
+class OutgoingEmail:
+    message: Message
+    attempts: int = 0
+
+    @property
+    def recipient(self) -> str:
+        return self.message["To"]
+
+def password_reset_message(sender: str, to_email: str, reset_link: str) -> Message:
+    message = MIMEMultipart()
+    message["From"] = sender
+    message["To"] = to_email
+    message["Subject"] = "Reset Your Password - Dino Encyclopedia"
+
+    html_content = f"""
+    <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+        <h2 style="color: #333;">Password Reset Request</h2>
+        <p>You have requested to reset your password for your Dino Encyclopedia account.</p>
+        <p>Click the button below to reset your password:</p>
+        <div style="text-align: center; margin: 25px 0;">
+            <a href="{reset_link}"
+               style="background-color: #4CAF50;
+                      color: white;
+                      padding: 14px 28px;
+                      text-align: center;
+                      text-decoration: none;
+                      display: inline-block;
+                      border-radius: 4px;
+                      font-size: 16px;">
+                Reset Password
+            </a>
+        </div>
+        <p>If you didn't request this, you can safely ignore this email.</p>
+        <p>This link will expire in 1 hour.</p>
+        <hr style="border: 1px solid #eee; margin: 20px 0;">
+        <p style="color: #666; font-size: 14px;">Best regards,<br>Dino Encyclopedia Team</p>
+    </div>
+    """
+    message.attach(MIMEText(html_content, "html"))
+    return message
+
+def is_transient(error: Exception) -> bool:
+    """
+    Connection problems and 4xx replies are worth retrying; 5xx replies
+    (unknown mailbox, rejected credentials...) will not change on their own.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    # Other SMTP errors (e.g. STARTTLS not offered) and TLS failures are configuration problems
+    return isinstance(error, OSError) and not isinstance(error, (smtplib.SMTPException, ssl.SSLError))
+
+class SmtpConnection:
+    """
+    One authenticated SMTP session kept open across messages. Only used from
+    the delivery thread, so it needs no locking.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        starttls: bool = True,
+        use_ssl: bool = False,
+        timeout: float = 10.0,
+        max_messages: int = 100,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.connections_opened = 0
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._sent = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._smtp is not None
+
+    def _connect(self):
+        context = ssl.create_default_context()
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=context)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls and not self.use_ssl:
+                smtp.starttls(context=context)
+            # Local relays and debugging servers usually don't offer AUTH
+            if self.username:
+                smtp.login(self.username, self.password or "")
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self._sent = 0
+        self.connections_opened += 1
+        logger.info(f"Opened SMTP connection to {self.host}:{self.port}")
+
+    def send(self, message: Message):
+        # Servers cap messages per session, so recycle before hitting the limit
+        if self._smtp is not None and self._sent >= self.max_messages:
+            self.close()
+        reused = self._smtp is not None
+        if not reused:
+            self._connect()
+        try:
+            self._smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            if not reused:
+                raise
+            # The server dropped an idle session; retry once on a fresh one
+            self._connect()
+            self._smtp.send_message(message)
+        except (smtplib.SMTPResponseException, OSError):
+            # Leave the session usable (or start over) for the next message
+            self.reset()
+            raise
+        self._sent += 1
+
+    def reset(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.rset()
+        except (smtplib.SMTPException, OSError):
+            self.close()
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
 class EmailService:
-    def __init__(self):
-        if not settings.SMTP_SERVER:
-            logger.error("SMTP server is not configured")
-            raise ValueError("SMTP server is not configured. Please add SMTP_SERVER to your .env file")
-        
-        if not settings.SMTP_PORT:
-            logger.error("SMTP port is not configured")
-            raise ValueError("SMTP port is not configured. Please add SMTP_PORT to your .env file")
-        
-        if not settings.SMTP_USERNAME:
-            logger.error("SMTP username is not configured")
-            raise ValueError("SMTP username is not configured. Please add SMTP_USERNAME to your .env file")
-        
-        if not settings.SMTP_PASSWORD:
-            logger.error("SMTP password is not configured")
-            raise ValueError("SMTP password is not configured. Please add SMTP_PASSWORD to your .env file")
-        
-        if not settings.EMAIL_SENDER:
-            logger.error("Email sender is not configured")
-            raise ValueError("Email sender is not configured. Please add EMAIL_SENDER to your .env file")
-        
-        self.smtp_server = settings.SMTP_SERVER
-        self.smtp_port = settings.SMTP_PORT
-        self.smtp_username = settings.SMTP_USERNAME
-        self.smtp_password = settings.SMTP_PASSWORD
-        self.sender_email = settings.EMAIL_SENDER
-        
-        logger.info(f"Initializing SMTP email service with server: {self.smtp_server}:{self.smtp_port}")
-        logger.info(f"Using sender email: {self.sender_email}")
-
-    async def send_password_reset_email(self, to_email: str, reset_link: str):
+    """
+    Asynchronous outgoing mail. Messages go into a bounded queue and return
+    right away; a worker task takes them off in batches and sends each batch
+    on a single delivery thread over one persistent SMTP connection, which is
+    closed after idle_timeout seconds without mail. Transient failures are
+    retried with exponential backoff up to max_retries times.
+
+    Nothing is started until the first message is queued.
+    """
+
+    def __init__(
+        self,
+        connection: Optional[SmtpConnection],
+        sender: Optional[str],
+        queue_size: int = 1000,
+        batch_size: int = 20,
+        batch_wait_ms: float = 50.0,
+        max_retries: int = 5,
+        retry_backoff_seconds: float = 2.0,
+        idle_timeout: float = 30.0,
+    ):
+        self.connection = connection
+        self.sender = sender
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000.0
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.idle_timeout = idle_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._retries: Dict[int, asyncio.TimerHandle] = {}
+        self._stats = {"queued": 0, "sent": 0, "retried": 0, "failed": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.connection is not None and bool(self.sender)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _ensure_started(self):
+        if self._worker is not None and not self._worker.done():
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smtp-delivery")
+        self._worker = asyncio.create_task(self._run())
+
+    def enqueue(self, message: Message):
         """
-        Send password reset email using SMTP
+        Queues a message for delivery. Must be called from the event loop.
         """
+        if not self.enabled:
+            raise RuntimeError("SMTP is not configured. Please add SMTP_SERVER and EMAIL_SENDER to your .env file")
+        self._ensure_started()
         try:
-            logger.info(f"Attempting to send password reset email to {to_email}")
-            
-            if not to_email:
-                raise ValueError("Recipient email is required")
-            
-            if not reset_link:
-                raise ValueError("Reset link is required")
-            
-            # Create message
-            message = MIMEMultipart()
-            message["From"] = self.sender_email
-            message["To"] = to_email
-            message["Subject"] = "Reset Your Password - Dino Encyclopedia"
-            
-            # Create HTML content
-            html_content = f"""
-            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <h2 style="color: #333;">Password Reset Request</h2>
-                <p>You have requested to reset your password for your Dino Encyclopedia account.</p>
-                <p>Click the button below to reset your password:</p>
-                <div style="text-align: center; margin: 25px 0;">
-                    <a href="{reset_link}" 
-                       style="background-color: #4CAF50; 
-                              color: white; 
-                              padding: 14px 28px; 
-                              text-align: center; 
-                              text-decoration: none; 
-                              display: inline-block; 
-                              border-radius: 4px;
-                              font-size: 16px;">
-                        Reset Password
-                    </a>
-                </div>
-                <p>If you didn't request this, you can safely ignore this email.</p>
-                <p>This link will expire in 1 hour.</p>
-                <hr style="border: 1px solid #eee; margin: 20px 0;">
-                <p style="color: #666; font-size: 14px;">Best regards,<br>Dino Encyclopedia Team</p>
-            </div>
-            """
-            
-            # Attach HTML content
-            message.attach(MIMEText(html_content, "html"))
-            
-            # Create secure SSL/TLS connection
-            context = ssl.create_default_context()
-            
+            self._queue.put_nowait(OutgoingEmail(message))
+        except asyncio.QueueFull:
+            raise EmailQueueFull(f"Email queue is full ({self.queue_size} messages)")
+        self._stats["queued"] += 1
+
+    async def send_password_reset_email(self, to_email: str, reset_link: str) -> bool:
+        """
+        Queues the password reset email; delivery happens in the background.
+        """
+        if not to_email:
+            raise ValueError("Recipient email is required")
+        if not reset_link:
+            raise ValueError("Reset link is required")
+        self.enqueue(password_reset_message(self.sender, to_email, reset_link))
+        logger.info(f"Queued password reset email to {to_email}")
+        return True
+
+    async def _next_batch(self) -> Optional[List[OutgoingEmail]]:
+        try:
+            first = await asyncio.wait_for(self._queue.get(), timeout=self.idle_timeout)
+        except asyncio.TimeoutError:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
             try:
-                with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                    server.starttls(context=context)
-                    server.login(self.smtp_username, self.smtp_password)
-                    server.send_message(message)
-                    logger.info(f"Successfully sent password reset email to {to_email}")
-                    return True
-                    
-            except smtplib.SMTPAuthenticationError:
-                error_msg = "SMTP authentication failed. Please check your credentials."
-                logger.error(error_msg)
-                raise HTTPException(status_code=500, detail=error_msg)
-            except smtplib.SMTPException as e:
-                error_msg = f"Failed to send email: {str(e)}"
-                logger.error(error_msg)
-                raise HTTPException(status_code=500, detail=error_msg)
-            
-        except ValueError as e:
-            logger.error(f"Validation error: {str(e)}")
-            raise HTTPException(status_code=400, detail=str(e))
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Email sending error: {str(e)}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to send reset email: {str(e)}"
-            )
-
-email_service = EmailService() 
\ No newline at end of file
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _deliver(self, batch: List[OutgoingEmail]) -> List[Tuple[OutgoingEmail, Optional[Exception]]]:
+        results = []
+        connection_error = None
+        for item in batch:
+            if connection_error is not None:
+                # The server is unreachable; don't wait out a timeout per message
+                results.append((item, connection_error))
+                continue
+            try:
+                self.connection.send(item.message)
+                results.append((item, None))
+            except Exception as e:
+                results.append((item, e))
+                if not self.connection.is_open and is_transient(e):
+                    connection_error = e
+        return results
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            if batch is None:
+                if self.connection.is_open:
+                    await loop.run_in_executor(self._executor, self.connection.close)
+                continue
+            try:
+                results = await loop.run_in_executor(self._executor, self._deliver, batch)
+            except Exception as e:
+                results = [(item, e) for item in batch]
+            for item, error in results:
+                if error is None:
+                    self._stats["sent"] += 1
+                else:
+                    self._handle_failure(loop, item, error)
+                self._queue.task_done()
+
+    def _handle_failure(self, loop: asyncio.AbstractEventLoop, item: OutgoingEmail, error: Exception):
+        item.attempts += 1
+        if not is_transient(error) or item.attempts > self.max_retries:
+            self._stats["failed"] += 1
+            logger.error(f"Giving up on email to {item.recipient} after {item.attempts} attempt(s): {str(error)}")
+            return
+        delay = self.retry_backoff_seconds * (2 ** (item.attempts - 1))
+        self._stats["retried"] += 1
+        logger.warning(f"Retrying email to {item.recipient} in {delay:.1f}s: {str(error)}")
+        self._retries[id(item)] = loop.call_later(delay, self._requeue, item)
+
+    def _requeue(self, item: OutgoingEmail):
+        self._retries.pop(id(item), None)
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self._stats["failed"] += 1
+            logger.error(f"Dropping email to {item.recipient}: queue is full")
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        Delivers what is already queued (up to timeout seconds), then closes
+        the SMTP connection. Messages still waiting for a retry are dropped.
+        """
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stopping with {self._queue.qsize()} email(s) still queued")
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        if self._retries:
+            logger.warning(f"Dropping {len(self._retries)} email(s) waiting for a retry")
+            for handle in self._retries.values():
+                handle.cancel()
+            self._retries.clear()
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.connection.close)
+        self._executor.shutdown(wait=True)
+        self._worker = None
+        self._queue = None
+        self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "enabled": self.enabled,
+            "queue_depth": self.queue_depth,
+            "waiting_retry": len(self._retries),
+            "connections_opened": self.connection.connections_opened if self.connection is not None else 0,
+        }
+
+def create_email_service() -> EmailService:
+    connection = None
+    if settings.SMTP_SERVER:
+        connection = SmtpConnection(
+            settings.SMTP_SERVER,
+            settings.SMTP_PORT,
+            username=settings.SMTP_USERNAME,
+            password=settings.SMTP_PASSWORD,
+            starttls=settings.SMTP_STARTTLS,
+            use_ssl=settings.SMTP_USE_SSL,
+            timeout=settings.SMTP_TIMEOUT_SECONDS,
+            max_messages=settings.SMTP_MAX_MESSAGES_PER_CONNECTION,
+        )
+    else:
+        logger.warning("SMTP server is not configured; emails will not be sent")
+    return EmailService(
+        connection,
+        settings.EMAIL_SENDER,
+        queue_size=settings.EMAIL_QUEUE_SIZE,
+        batch_size=settings.EMAIL_BATCH_SIZE,
+        batch_wait_ms=settings.EMAIL_BATCH_WAIT_MS,
+        max_retries=settings.EMAIL_MAX_RETRIES,
+        retry_backoff_seconds=settings.EMAIL_RETRY_BACKOFF_SECONDS,
+        idle_timeout=settings.SMTP_IDLE_TIMEOUT_SECONDS,
+    )
+
+email_service = create_email_service()
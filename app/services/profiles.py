@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from typing import Optional
+
+from app.core.config import settings
+from app.core.supabase import get_supabase
+from app.models.user import UserProfile, UserUpdate
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Only the columns UserProfile needs, instead of select("*")
+PROFILE_COLUMNS = ",".join(UserProfile.model_fields)
+
+class ProfileRepository:
+    """
+    Read-through cache in front of the Supabase profiles table.
+
+    Lookups by email or id are served from a bounded TTL cache and only hit
+    the database on a miss. The blocking supabase client runs in a worker
+    thread so handlers never stall the event loop. Every write goes through
+    this class so the cached copy is refreshed or dropped.
+    """
+
+    def __init__(self, table: str = "profiles", cache_size: int = 10000, ttl: float = 60.0):
+        self.table = table
+        self._cache = TTLCache(maxsize=cache_size, ttl=ttl)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+    def _remember(self, profile: dict):
+        self._cache.set(("email", profile["email"]), profile)
+        self._cache.set(("id", str(profile["id"])), profile)
+
+    def invalidate(self, profile: dict):
+        self._cache.pop(("email", profile.get("email")))
+        self._cache.pop(("id", str(profile.get("id"))))
+
+    def add_uploads(self, email: str, count: int):
+        """
+        Applies upload counts already written to Supabase to the cached
+        profile, if there is one, instead of dropping it. Looked up with
+        peek so it doesn't count towards the cache hit rate.
+        """
+        cached = self._cache.peek(("email", email))
+        if cached is not None:
+            self._remember({
+                **cached,
+                "images_uploaded_count": (cached.get("images_uploaded_count") or 0) + count,
+                "has_entries": True,
+            })
+
+    async def _select_one(self, column: str, value: str) -> Optional[dict]:
+        def query():
+            return get_supabase().table(self.table).select(PROFILE_COLUMNS).eq(column, value).limit(1).execute()
+
+        result = await asyncio.to_thread(query)
+        return result.data[0] if result.data else None
+
+    async def _get(self, column: str, value: str) -> Optional[dict]:
+        profile = self._cache.get((column, value))
+        if profile is None:
+            profile = await self._select_one(column, value)
+            if profile is None:
+                return None
+            self._remember(profile)
+        return dict(profile)
+
+    async def get_by_email(self, email: str) -> Optional[dict]:
+        return await self._get("email", email)
+
+    async def get_by_id(self, user_id: str) -> Optional[dict]:
+        return await self._get("id", str(user_id))
+
+    async def create(self, data: dict) -> Optional[dict]:
+        result = await asyncio.to_thread(
+            lambda: get_supabase().table(self.table).insert(data).execute()
+        )
+        if not result.data:
+            return None
+        profile = result.data[0]
+        self._remember(profile)
+        return dict(profile)
+
+    async def update(self, user_id: str, changes: UserUpdate) -> Optional[dict]:
+        data = changes.model_dump(exclude_unset=True)
+        cached = self._cache.get(("id", str(user_id)))
+        if cached is not None:
+            self.invalidate(cached)
+        if not data:
+            return await self.get_by_id(user_id)
+        result = await asyncio.to_thread(
+            lambda: get_supabase().table(self.table).update(data).eq("id", str(user_id)).execute()
+        )
+        if not result.data:
+            return None
+        profile = result.data[0]
+        self._remember(profile)
+        return dict(profile)
+
+    async def delete(self, user_id: str):
+        cached = self._cache.get(("id", str(user_id)))
+        if cached is not None:
+            self.invalidate(cached)
+        await asyncio.to_thread(
+            lambda: get_supabase().table(self.table).delete().eq("id", str(user_id)).execute()
+        )
+
+profile_repository = ProfileRepository(
+    cache_size=settings.PROFILE_CACHE_SIZE,
+    ttl=settings.PROFILE_CACHE_TTL_SECONDS,
+)
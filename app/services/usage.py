@@ -0,0 +1,285 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+import uuid
+from collections import Counter, deque
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.supabase import get_supabase
+from app.services.profiles import profile_repository
+
+logger = logging.getLogger(__name__)
+
+SPILL_PATTERN = "usage-*.jsonl"
+# <spill file>.<pid of the worker recovering it>.claimed
+CLAIMED_PATTERN = SPILL_PATTERN + ".*.claimed"
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+@dataclass
+class PredictionEvent:
+    uid: str
+    # Only used to link a profile that has no firebase_uid yet
+    email: Optional[str]
+    label: str
+    confidence: float
+    model_version: Optional[str]
+    created_at: str
+
+class UsageRecorder:
+    """
+    Write-behind recorder for the prediction history and the per-user
+    upload counters (images_uploaded_count, has_entries).
+
+    Predictions are appended to an in-memory buffer and the response goes
+    out right away; a background task sends the buffer to Supabase every
+    flush_interval seconds (sooner once max_rows are waiting). Each flush is
+    one call to the record_usage function per max_rows events, with the
+    counter increments already added up per user (by Firebase uid, which
+    unlike the email never changes), so a heavy user costs one row update
+    per flush instead of one per upload.
+
+    Every call carries a batch id that stays with its events until the
+    call succeeds, and record_usage ignores a batch id it has already
+    applied, so retrying a call that timed out after committing doesn't
+    count the events twice.
+
+    Events that could not be written when the worker shuts down are spilled
+    to spill_dir and picked up by the next worker that starts.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        flush_interval: float = 5.0,
+        max_rows: int = 500,
+        max_events: int = 100000,
+        spill_dir: Optional[str] = None,
+        function: str = "record_usage",
+    ):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.max_events = max_events
+        self.spill_dir = spill_dir
+        self.function = function
+        self._buffer: Deque[PredictionEvent] = deque()
+        # Chunks that have been sent at least once, with their batch id
+        self._retries: Deque[Tuple[str, List[PredictionEvent]]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._stats = {"recorded": 0, "flushed": 0, "dropped": 0, "failed_flushes": 0, "spilled": 0, "recovered": 0}
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer) + sum(len(events) for _, events in self._retries)
+
+    def _append(self, event: PredictionEvent):
+        if len(self._buffer) >= self.max_events:
+            # Supabase has been unreachable for a long time; keep the newest events
+            self._buffer.popleft()
+            self._stats["dropped"] += 1
+        self._buffer.append(event)
+
+    def record(self, uid: Optional[str], email: Optional[str], result: dict):
+        """
+        Buffers a successful prediction made for a signed-in user. Never
+        blocks; must be called from the event loop.
+        """
+        if not self.enabled or not uid or "prediction" not in result:
+            return
+        self._append(PredictionEvent(
+            uid=uid,
+            email=email,
+            label=result["prediction"],
+            confidence=result["confidence"],
+            model_version=result.get("model_version"),
+            created_at=datetime.now(timezone.utc).isoformat(),
+        ))
+        self._stats["recorded"] += 1
+        if len(self._buffer) >= self.max_rows and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _write(self, batch_id: str, events: List[PredictionEvent]):
+        get_supabase().rpc(self.function, {
+            "batch_id": batch_id,
+            "counts": dict(Counter(event.uid for event in events)),
+            "emails": {event.uid: event.email for event in events if event.email},
+            "predictions": [asdict(event) for event in events],
+        }).execute()
+
+    async def flush(self) -> int:
+        """
+        Writes the buffered events, max_rows per call, retrying earlier
+        failed calls first under their original batch id. Stops at the
+        first failed call and keeps the rest for the next flush.
+        """
+        flushed = 0
+        while self._retries or self._buffer:
+            if not self._retries:
+                chunk = [self._buffer.popleft() for _ in range(min(self.max_rows, len(self._buffer)))]
+                self._retries.append((str(uuid.uuid4()), chunk))
+            batch_id, chunk = self._retries[0]
+            try:
+                await asyncio.to_thread(self._write, batch_id, chunk)
+            except Exception as e:
+                self._stats["failed_flushes"] += 1
+                logger.warning(f"Could not write {len(chunk)} usage event(s), will retry: {str(e)}")
+                break
+            self._retries.popleft()
+            flushed += len(chunk)
+            self._stats["flushed"] += len(chunk)
+            # Bring cached profiles up to date with the counters just written
+            for email, count in Counter(event.email for event in chunk if event.email).items():
+                profile_repository.add_uploads(email, count)
+        return flushed
+
+    async def _run(self):
+        while not self._stopping:
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=self.flush_interval)
+            finally:
+                waiter.cancel()
+            self._wakeup.clear()
+            await self.flush()
+
+    def _spill(self):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"usage-{os.getpid()}-{time.time_ns()}.jsonl")
+        # Sent chunks keep their batch id, since they may have been applied already
+        lines = [(batch_id, event) for batch_id, events in self._retries for event in events]
+        lines += [(None, event) for event in self._buffer]
+        with open(path + ".tmp", "w") as f:
+            for batch_id, event in lines:
+                f.write(json.dumps({**asdict(event), "batch_id": batch_id}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self._stats["spilled"] += len(lines)
+        logger.warning(f"Spilled {len(lines)} unwritten usage event(s) to {path}")
+        self._retries.clear()
+        self._buffer.clear()
+
+    def _spill_files(self) -> List[str]:
+        """
+        Spill files nobody is recovering: unclaimed ones, and ones claimed
+        by a worker that died before it finished with them.
+        """
+        paths = glob.glob(os.path.join(self.spill_dir, SPILL_PATTERN))
+        for claimed in glob.glob(os.path.join(self.spill_dir, CLAIMED_PATTERN)):
+            try:
+                pid = int(claimed.rsplit(".", 2)[1])
+            except ValueError:
+                continue
+            if pid != os.getpid() and not _pid_alive(pid):
+                paths.append(claimed)
+        return sorted(paths)
+
+    def _load_spill(self, path: str) -> Tuple[int, int]:
+        """
+        Queues the events of a claimed spill file. Returns (recovered,
+        dropped); lines that can't be parsed or attributed are dropped.
+        """
+        batches: Dict[str, List[PredictionEvent]] = {}
+        recovered = dropped = 0
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    fields = json.loads(line)
+                    batch_id = fields.pop("batch_id", None)
+                    # Events spilled before they were keyed by uid can't be attributed
+                    event = PredictionEvent(**fields) if fields.get("uid") else None
+                except (ValueError, TypeError, AttributeError):
+                    event = None
+                if event is None:
+                    dropped += 1
+                elif batch_id is None:
+                    self._append(event)
+                    recovered += 1
+                else:
+                    batches.setdefault(batch_id, []).append(event)
+                    recovered += 1
+        self._retries.extend(batches.items())
+        return recovered, dropped
+
+    def _recover(self):
+        for path in self._spill_files():
+            # Several workers start at once; the rename lets only one of them take a file
+            original = path.rsplit(".", 2)[0] if path.endswith(".claimed") else path
+            claimed = f"{original}.{os.getpid()}.claimed"
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            try:
+                recovered, dropped = self._load_spill(claimed)
+            except OSError as e:
+                # Left claimed; another worker picks it up once this one is gone
+                logger.error(f"Could not read usage spill file {claimed}: {str(e)}")
+                continue
+            # Nothing is flushed before the file is gone, so a crash here can't write events twice
+            os.remove(claimed)
+            self._stats["recovered"] += recovered
+            self._stats["dropped"] += dropped
+            logger.info(f"Recovered {recovered} usage event(s) from {original}")
+            if dropped:
+                logger.warning(f"Dropped {dropped} unreadable or unattributable usage event(s) from {original}")
+
+    def start(self):
+        if not self.enabled or self._worker is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        if self.spill_dir:
+            self._recover()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Writes what is still buffered; whatever can't be written is spilled
+        to disk instead of being lost.
+        """
+        if self._worker is None:
+            return
+        # Not cancelled: a write already sent must not be retried or lost
+        self._stopping = True
+        self._wakeup.set()
+        await self._worker
+        self._worker = None
+        await self.flush()
+        if self.pending:
+            if self.spill_dir:
+                self._spill()
+            else:
+                logger.error(f"Dropping {self.pending} unwritten usage event(s)")
+                self._stats["dropped"] += self.pending
+                self._retries.clear()
+                self._buffer.clear()
+
+    def stats(self) -> dict:
+        return {**self._stats, "pending": self.pending}
+
+usage_recorder = UsageRecorder(
+    enabled=settings.USAGE_RECORDING_ENABLED,
+    flush_interval=settings.USAGE_FLUSH_INTERVAL_SECONDS,
+    max_rows=settings.USAGE_FLUSH_MAX_ROWS,
+    max_events=settings.USAGE_BUFFER_MAX_EVENTS,
+    spill_dir=settings.USAGE_SPILL_DIR,
+)
@@ -0,0 +1,368 @@
+"""
+Bulk user import.
+
+Creates Firebase users in batches through the admin SDK's import_users and
+their Supabase profiles in multi-row inserts, instead of one create_user and
+one insert per user. Used by POST /api/v1/admin/users/import (run in the
+background, progress in GET /api/v1/admin/users/import/{job_id}) and from
+the command line:
+
+    python -m app.services.user_import students.csv
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import secrets
+import sys
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from firebase_admin import auth as firebase_auth
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.models.user import UserCreate
+
+logger = logging.getLogger(__name__)
+
+# Firebase limits
+MAX_IMPORT_BATCH = 1000
+MAX_LOOKUP_BATCH = 100
+MIN_PASSWORD_LENGTH = 6
+
+# Row outcomes
+CREATED = "created"
+INVALID = "invalid"
+DUPLICATE = "duplicate"
+EXISTS = "exists"
+FAILED = "failed"
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+ERROR = "error"
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _error_message(error: Exception) -> str:
+    # postgrest's APIError carries the database message in .message
+    return getattr(error, "message", None) or str(error)
+
+class ImportJobStore:
+    """
+    Job status as one JSON file per job, replaced atomically on every
+    update, so any worker of the API can report on a job another one runs.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def create(self, total: int) -> dict:
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": QUEUED,
+            "created_at": _now(),
+            "updated_at": _now(),
+            "total": total,
+            "processed": 0,
+            "counts": {},
+            "rows": [],
+            "error": None,
+        }
+        self.save(job)
+        return job
+
+    def save(self, job: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        job["updated_at"] = _now()
+        tmp_path = self._path(job["id"]) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._path(job["id"]))
+
+    def get(self, job_id: str) -> Optional[dict]:
+        # Job ids are uuid hex; anything else can't be a job file
+        if len(job_id) != 32 or any(c not in "0123456789abcdef" for c in job_id):
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+class UserImporter:
+    """
+    Imports users in batches:
+
+    1. each row is validated like POST /auth/register (duplicates within
+       the import are rejected);
+    2. emails that already have a Firebase account are skipped;
+    3. passwords are hashed here with PBKDF2-SHA256 (Firebase re-hashes them
+       with its own scheme on first sign-in) and up to firebase_batch_size
+       users are created per import_users call;
+    4. profiles for the created users are inserted profile_chunk_size rows
+       per request. A chunk that fails is retried row by row to find the
+       offending rows, and the Firebase users of rows whose profile could
+       not be created are deleted again, so no account is left without a
+       profile.
+
+    Every row gets a result with its outcome and error.
+    """
+
+    def __init__(
+        self,
+        supabase_client,
+        firebase_batch_size: int = 500,
+        profile_chunk_size: int = 200,
+        pbkdf2_rounds: int = 10000,
+        table: str = "profiles",
+    ):
+        self.supabase = supabase_client
+        self.firebase_batch_size = min(firebase_batch_size, MAX_IMPORT_BATCH)
+        self.profile_chunk_size = profile_chunk_size
+        self.pbkdf2_rounds = pbkdf2_rounds
+        self.table = table
+
+    def _validate(self, rows: List[dict]) -> Tuple[List[dict], List[dict]]:
+        results, valid = [], []
+        seen = set()
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                results.append({"row": index, "email": None, "status": INVALID, "error": "row must be an object"})
+                continue
+            try:
+                user = UserCreate(**row)
+            except ValidationError as e:
+                message = "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors())
+                results.append({"row": index, "email": row.get("email"), "status": INVALID, "error": message})
+                continue
+            if len(user.password) < MIN_PASSWORD_LENGTH:
+                results.append({"row": index, "email": user.email, "status": INVALID,
+                                "error": f"password: must be at least {MIN_PASSWORD_LENGTH} characters"})
+                continue
+            email_key = user.email.lower()
+            if email_key in seen:
+                results.append({"row": index, "email": user.email, "status": DUPLICATE,
+                                "error": "email appears more than once in this import"})
+                continue
+            seen.add(email_key)
+            valid.append({"row": index, "user": user})
+        return results, valid
+
+    def _existing_emails(self, emails: List[str]) -> set:
+        existing = set()
+        for chunk in _chunks(emails, MAX_LOOKUP_BATCH):
+            found = firebase_auth.get_users([firebase_auth.EmailIdentifier(email) for email in chunk])
+            existing.update(user.email.lower() for user in found.users if user.email)
+        return existing
+
+    def _hash_password(self, password: str) -> Tuple[bytes, bytes]:
+        salt = secrets.token_bytes(16)
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, self.pbkdf2_rounds), salt
+
+    def _import_firebase(self, batch: List[dict]) -> Tuple[List[dict], List[dict]]:
+        """
+        Returns (imported rows, row results for the ones Firebase rejected).
+        """
+        records = []
+        for entry in batch:
+            user = entry["user"]
+            # Same id for the Firebase user and the profile row
+            entry["uid"] = str(uuid.uuid4())
+            password_hash, salt = self._hash_password(user.password)
+            records.append(firebase_auth.ImportUserRecord(
+                uid=entry["uid"],
+                email=user.email,
+                display_name=user.full_name or None,
+                password_hash=password_hash,
+                password_salt=salt,
+            ))
+        result = firebase_auth.import_users(records, hash_alg=firebase_auth.UserImportHash.pbkdf2_sha256(self.pbkdf2_rounds))
+        rejected = {error.index: error.reason for error in result.errors}
+        imported = [entry for index, entry in enumerate(batch) if index not in rejected]
+        failures = [
+            {"row": batch[index]["row"], "email": batch[index]["user"].email, "status": FAILED, "error": f"firebase: {reason}"}
+            for index, reason in rejected.items()
+        ]
+        return imported, failures
+
+    def _profile_row(self, entry: dict) -> dict:
+        user = entry["user"]
+        return {
+            "id": entry["uid"],
+            "firebase_uid": entry["uid"],
+            "email": user.email,
+            "full_name": user.full_name,
+            "profile_picture": user.profile_picture,
+        }
+
+    def _insert(self, rows: List[dict]):
+        self.supabase.table(self.table).insert(rows).execute()
+
+    def _insert_profiles(self, imported: List[dict]) -> Dict[int, str]:
+        """
+        Returns the profile insert error of every row that failed, by row.
+        """
+        failed = {}
+        for chunk in _chunks(imported, self.profile_chunk_size):
+            try:
+                self._insert([self._profile_row(entry) for entry in chunk])
+                continue
+            except Exception as e:
+                logger.warning(f"Profile chunk of {len(chunk)} failed ({_error_message(e)}), retrying row by row")
+            # A multi-row insert is all or nothing; isolate the rows that fail
+            for entry in chunk:
+                try:
+                    self._insert([self._profile_row(entry)])
+                except Exception as e:
+                    failed[entry["row"]] = _error_message(e)
+        return failed
+
+    def _delete_firebase_users(self, uids: List[str]) -> set:
+        """
+        Compensating delete. Returns the uids that could not be deleted.
+        """
+        not_deleted = set()
+        for chunk in _chunks(uids, MAX_IMPORT_BATCH):
+            try:
+                result = firebase_auth.delete_users(chunk)
+                not_deleted.update(chunk[error.index] for error in result.errors)
+            except Exception as e:
+                logger.error(f"Compensating delete of {len(chunk)} Firebase users failed: {str(e)}")
+                not_deleted.update(chunk)
+        return not_deleted
+
+    def run(self, rows: List[dict], progress: Optional[Callable[[List[dict], int], None]] = None) -> List[dict]:
+        """
+        Imports the rows and returns one result per row, in row order.
+        progress(results so far, rows processed) is called after each batch.
+        """
+        results, valid = self._validate(rows)
+        processed = len(results)
+        if progress is not None:
+            progress(results, processed)
+
+        for batch in _chunks(valid, self.firebase_batch_size):
+            existing = self._existing_emails([entry["user"].email for entry in batch])
+            new = []
+            for entry in batch:
+                if entry["user"].email.lower() in existing:
+                    results.append({"row": entry["row"], "email": entry["user"].email, "status": EXISTS,
+                                    "error": "a user with this email already exists"})
+                else:
+                    new.append(entry)
+
+            imported, failures = self._import_firebase(new) if new else ([], [])
+            results.extend(failures)
+
+            profile_errors = self._insert_profiles(imported)
+            orphaned = self._delete_firebase_users(
+                [entry["uid"] for entry in imported if entry["row"] in profile_errors]
+            ) if profile_errors else set()
+            for entry in imported:
+                user = entry["user"]
+                if entry["row"] not in profile_errors:
+                    results.append({"row": entry["row"], "email": user.email, "status": CREATED, "uid": entry["uid"]})
+                    continue
+                result = {"row": entry["row"], "email": user.email, "status": FAILED,
+                          "error": f"profile: {profile_errors[entry['row']]}"}
+                if entry["uid"] in orphaned:
+                    result["error"] += f" (Firebase user {entry['uid']} could not be removed)"
+                    result["uid"] = entry["uid"]
+                results.append(result)
+
+            processed += len(batch)
+            if progress is not None:
+                progress(results, processed)
+
+        return sorted(results, key=lambda result: result["row"])
+
+def summarize(results: List[dict]) -> Dict[str, int]:
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return counts
+
+def create_importer() -> UserImporter:
+    from app.core.supabase import get_supabase
+    return UserImporter(
+        get_supabase(),
+        firebase_batch_size=settings.BULK_IMPORT_FIREBASE_BATCH_SIZE,
+        profile_chunk_size=settings.BULK_IMPORT_PROFILE_CHUNK_SIZE,
+        pbkdf2_rounds=settings.BULK_IMPORT_PBKDF2_ROUNDS,
+    )
+
+job_store = ImportJobStore(settings.BULK_IMPORT_JOBS_DIR)
+
+def run_import_job(job: dict, rows: List[dict], importer: Optional[UserImporter] = None, store: ImportJobStore = job_store) -> dict:
+    """
+    Runs an import, recording progress and the final per-row report in the
+    job store. Blocking; the API runs it on a background thread.
+    """
+    importer = importer or create_importer()
+    job["status"] = RUNNING
+    store.save(job)
+
+    def progress(results: List[dict], processed: int):
+        job["processed"] = processed
+        job["counts"] = summarize(results)
+        store.save(job)
+
+    try:
+        results = importer.run(rows, progress)
+    except Exception as e:
+        logger.error(f"User import {job['id']} failed: {str(e)}")
+        job["status"] = ERROR
+        job["error"] = str(e)
+        store.save(job)
+        return job
+    job["rows"] = results
+    job["counts"] = summarize(results)
+    job["processed"] = len(rows)
+    job["status"] = COMPLETED
+    store.save(job)
+    logger.info(f"User import {job['id']} finished: {job['counts']}")
+    return job
+
+def read_rows(path: str) -> List[dict]:
+    """
+    Reads users from a CSV file with an email,password[,full_name,profile_picture]
+    header, or from a JSON list of objects with the same fields.
+    """
+    with open(path, newline="") as f:
+        if path.lower().endswith(".json"):
+            return json.load(f)
+        return [{key: value for key, value in row.items() if value not in (None, "")} for row in csv.DictReader(f)]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import users into Firebase and Supabase in bulk")
+    parser.add_argument("path", help="CSV (email,password,full_name,profile_picture) or JSON file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    from app.core.firebase import initialize_firebase
+    initialize_firebase()
+
+    rows = read_rows(args.path)
+    job = run_import_job(job_store.create(len(rows)), rows)
+    for result in job["rows"]:
+        if result["status"] != CREATED:
+            print(f"row {result['row']} {result.get('email')}: {result['status']} - {result.get('error')}", file=sys.stderr)
+    print(json.dumps({"job_id": job["id"], "status": job["status"], "counts": job["counts"], "error": job["error"]}, indent=2))
+    return 0 if job["status"] == COMPLETED and job["counts"].get(CREATED, 0) + job["counts"].get(EXISTS, 0) == len(rows) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
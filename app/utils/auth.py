@@ -1,6 +1,9 @@
-import requests
-from fastapi import HTTPException
+import httpx
+from fastapi import HTTPException, Request
+from typing import Optional
 from app.core.config import settings
+from app.core.http import post_json
+from app.utils.tokens import InvalidTokenError, KeysUnavailableError, token_verifier
 
 async def verify_password_firebase(email: str, password: str) -> dict:
     """
@@ -8,18 +11,18 @@ async def verify_password_firebase(email: str, password: str) -> dict:
     Returns the Firebase auth tokens if successful
     """
     try:
-        url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={settings.FIREBASE_WEB_API_KEY}"
+        url = f"{settings.FIREBASE_AUTH_URL}/accounts:signInWithPassword?key={settings.FIREBASE_WEB_API_KEY}"
         payload = {
             "email": email,
             "password": password,
             "returnSecureToken": True
         }
-        response = requests.post(url, json=payload)
+        response = await post_json(url, payload)
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.HTTPError as e:
-        if response.status_code == 400:
-            error_data = response.json()
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 400:
+            error_data = e.response.json()
             error_message = error_data.get('error', {}).get('message', 'Invalid credentials')
             raise HTTPException(status_code=401, detail=error_message)
         raise HTTPException(status_code=500, detail="Authentication service error")
@@ -28,35 +31,49 @@ async def verify_password_firebase(email: str, password: str) -> dict:
 
 async def verify_firebase_token(token: str) -> dict:
     """
-    Verify Firebase ID token
+    Verify Firebase ID token locally against the cached signing keys
     Returns the decoded token if valid
     """
     try:
-        url = f"https://identitytoolkit.googleapis.com/v1/accounts:lookup?key={settings.FIREBASE_WEB_API_KEY}"
-        payload = {"idToken": token}
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as e:
+        return await token_verifier.verify(token)
+    except InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
+    except KeysUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def optional_current_user(request: Request) -> Optional[dict]:
+    """
+    Claims of the caller's ID token (Authorization: Bearer or the auth_token
+    cookie), or None for anonymous callers and tokens that don't verify, for
+    public endpoints that only attribute requests to a user
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        token = request.cookies.get("auth_token")
+    if not token:
+        return None
+    try:
+        return await token_verifier.verify(token)
+    except (InvalidTokenError, KeysUnavailableError):
+        return None
+
 async def refresh_firebase_token(refresh_token: str) -> dict:
     """
     Refresh Firebase auth tokens using a refresh token
     Returns new set of tokens if successful
     """
     try:
-        url = f"https://securetoken.googleapis.com/v1/token?key={settings.FIREBASE_WEB_API_KEY}"
+        url = f"{settings.FIREBASE_TOKEN_URL}/token?key={settings.FIREBASE_WEB_API_KEY}"
         payload = {
             "grant_type": "refresh_token",
             "refresh_token": refresh_token
         }
-        response = requests.post(url, json=payload)
+        response = await post_json(url, payload)
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.HTTPError:
+    except httpx.HTTPStatusError:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,250 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request
+
+from app.core.config import settings
+from app.utils.auth import optional_current_user
+
+logger = logging.getLogger(__name__)
+
+MEMORY_BACKEND = "memory"
+REDIS_BACKEND = "redis"
+
+class MemoryTokenBuckets:
+    """
+    Token buckets kept in this process. With several workers each one has
+    its own buckets, so a client can get up to workers times the limit; use
+    RedisTokenBuckets to share them. Buckets idle the longest are dropped
+    past max_keys (they would have refilled anyway).
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        """
+        Takes cost tokens from key's bucket. Returns (allowed, seconds until
+        enough tokens are back when not allowed).
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    async def close(self):
+        pass
+
+# Refill, take and store in one atomic step, with the Redis clock so every
+# worker agrees on the time. Numbers go back as strings: Lua numbers are
+# truncated to integers in replies.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+class RedisTokenBuckets:
+    """
+    Token buckets in Redis (or anything speaking its protocol with Lua
+    scripting, e.g. Valkey), shared by every worker and instance.
+    Needs the redis package (pip install redis).
+    """
+
+    def __init__(self, client, prefix: str = "dino:ratelimit:"):
+        # Any redis.asyncio-compatible client, e.g. fakeredis.FakeAsyncRedis() in tests
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url: str, timeout: float = 0.25) -> "RedisTokenBuckets":
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis needs the redis package: pip install redis")
+        # Short timeouts: a slow Redis must not hold up requests (they are admitted instead)
+        return cls(redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout))
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        allowed, retry_after = await self._script(keys=[self.prefix + key], args=[rate, burst, cost])
+        return bool(int(allowed)), float(retry_after)
+
+    async def close(self):
+        await self.client.aclose()
+
+@dataclass
+class Caller:
+    """
+    Who a classification request is admitted for: "user:<uid>" for
+    signed-in users, "ip:<address>" otherwise.
+    """
+    key: str
+    claims: Optional[dict] = None
+    # Anonymous callers are turned away once the inference queue is this full
+    queue_limit: Optional[int] = None
+
+    @property
+    def uid(self) -> Optional[str]:
+        return self.claims.get("uid") if self.claims else None
+
+    @property
+    def email(self) -> Optional[str]:
+        return self.claims.get("email") if self.claims else None
+
+class AdmissionController:
+    """
+    Per-client token buckets in front of the inference endpoints: every
+    request takes a token from its user's bucket (or its IP's, for
+    anonymous callers) and is answered 429 with Retry-After when the bucket
+    is empty, before it costs any decoding or inference. Images of batch
+    requests also take a token each from a separate, larger per-image
+    bucket, so an album isn't held to the per-request rate. If the bucket
+    backend fails, requests are let through rather than turned away.
+    """
+
+    def __init__(
+        self,
+        buckets,
+        enabled: bool = True,
+        user_rate: float = 5.0,
+        user_burst: float = 20,
+        ip_rate: float = 2.0,
+        ip_burst: float = 10,
+        batch_user_rate: float = 50.0,
+        batch_user_burst: float = 1000,
+        batch_ip_rate: float = 10.0,
+        batch_ip_burst: float = 200,
+        anonymous_queue_limit: Optional[int] = None,
+    ):
+        self.buckets = buckets
+        self.enabled = enabled
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.batch_user_rate = batch_user_rate
+        self.batch_user_burst = batch_user_burst
+        self.batch_ip_rate = batch_ip_rate
+        self.batch_ip_burst = batch_ip_burst
+        self.anonymous_queue_limit = anonymous_queue_limit
+        self._stats = {"admitted": 0, "limited": 0, "backend_errors": 0}
+
+    def caller(self, request: Request, claims: Optional[dict]) -> Caller:
+        if claims is not None:
+            return Caller(f"user:{claims['uid']}", claims)
+        return Caller(f"ip:{client_ip(request)}", None, self.anonymous_queue_limit)
+
+    async def admit(self, caller: Caller, cost: float = 1.0) -> float:
+        """
+        Takes cost tokens for caller. Returns 0 when the request may go
+        ahead, otherwise the seconds to wait before retrying.
+        """
+        if caller.claims is not None:
+            return await self._take(caller.key, self.user_rate, self.user_burst, cost)
+        return await self._take(caller.key, self.ip_rate, self.ip_burst, cost)
+
+    async def admit_images(self, caller: Caller, count: int = 1) -> float:
+        """
+        Like admit, for count images of a batch request, from the caller's
+        per-image bucket.
+        """
+        if caller.claims is not None:
+            return await self._take(f"batch:{caller.key}", self.batch_user_rate, self.batch_user_burst, count)
+        return await self._take(f"batch:{caller.key}", self.batch_ip_rate, self.batch_ip_burst, count)
+
+    async def _take(self, key: str, rate: float, burst: float, cost: float) -> float:
+        if not self.enabled:
+            return 0.0
+        try:
+            allowed, retry_after = await self.buckets.take(key, rate, burst, cost)
+        except Exception as e:
+            self._stats["backend_errors"] += 1
+            logger.warning(f"Rate limit backend unavailable, admitting request: {str(e)}")
+            return 0.0
+        self._stats["admitted" if allowed else "limited"] += 1
+        return 0.0 if allowed else max(retry_after, 0.001)
+
+    def stats(self) -> dict:
+        return {**self._stats, "enabled": self.enabled}
+
+    async def close(self):
+        await self.buckets.close()
+
+def client_ip(request: Request) -> str:
+    if settings.RATE_LIMIT_TRUST_FORWARDED_FOR:
+        # Only behind a proxy that sets the header; otherwise clients could pick their own IP.
+        # The last entry is the one the proxy added, earlier ones come from the client.
+        forwarded = request.headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+def create_admission_controller() -> AdmissionController:
+    if settings.RATE_LIMIT_BACKEND == REDIS_BACKEND:
+        buckets = RedisTokenBuckets.from_url(settings.RATE_LIMIT_REDIS_URL)
+    elif settings.RATE_LIMIT_BACKEND == MEMORY_BACKEND:
+        buckets = MemoryTokenBuckets()
+    else:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {settings.RATE_LIMIT_BACKEND}")
+    return AdmissionController(
+        buckets,
+        enabled=settings.RATE_LIMIT_ENABLED,
+        user_rate=settings.RATE_LIMIT_USER_RATE,
+        user_burst=settings.RATE_LIMIT_USER_BURST,
+        ip_rate=settings.RATE_LIMIT_IP_RATE,
+        ip_burst=settings.RATE_LIMIT_IP_BURST,
+        batch_user_rate=settings.RATE_LIMIT_BATCH_USER_RATE,
+        batch_user_burst=settings.RATE_LIMIT_BATCH_USER_BURST,
+        batch_ip_rate=settings.RATE_LIMIT_BATCH_IP_RATE,
+        batch_ip_burst=settings.RATE_LIMIT_BATCH_IP_BURST,
+        anonymous_queue_limit=int(settings.INFERENCE_MAX_QUEUE_SIZE * settings.INFERENCE_ANONYMOUS_QUEUE_SHARE),
+    )
+
+admission_controller = create_admission_controller()
+
+async def admit_request(request: Request, claims: Optional[dict] = Depends(optional_current_user)) -> Caller:
+    """
+    Dependency for the inference endpoints: identifies the caller and
+    rejects the request with 429 when its bucket is empty.
+    """
+    caller = admission_controller.caller(request, claims)
+    retry_after = await admission_controller.admit(caller)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, please slow down",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+    return caller
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Dict, Optional
+
+from google.auth import exceptions as google_auth_exceptions
+from google.auth import jwt
+
+from app.core.config import settings
+from app.core.http import get_http_client
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+KEYS_RETRY_SECONDS = 30
+KEYS_MIN_FORCED_REFRESH_SECONDS = 60
+
+class InvalidTokenError(Exception):
+    pass
+
+class KeysUnavailableError(Exception):
+    pass
+
+class FirebaseTokenVerifier:
+    """
+    Verifies Firebase ID tokens locally.
+
+    Signatures are checked against Google's public signing certificates,
+    which are fetched once and refreshed in the background according to
+    their Cache-Control max-age. Tokens that already passed verification are
+    kept in a TTL/LRU cache until their exp (capped by max_cache_ttl), so
+    repeat requests skip the RSA check entirely.
+    """
+
+    def __init__(
+        self,
+        project_id: Optional[str],
+        certs_url: str,
+        cache_size: int = 10000,
+        max_cache_ttl: float = 300,
+        clock_skew: int = 0,
+    ):
+        self.project_id = project_id
+        self.certs_url = certs_url
+        self.max_cache_ttl = max_cache_ttl
+        self.clock_skew = clock_skew
+        self._cache = TTLCache(maxsize=cache_size)
+        self._certs: Dict[str, str] = {}
+        self._certs_expire_at = 0.0
+        self._last_fetch = 0.0
+        self._fetch_lock = asyncio.Lock()
+        self._refresher: Optional[asyncio.Task] = None
+
+    @property
+    def issuer(self) -> str:
+        return f"https://securetoken.google.com/{self.project_id}"
+
+    def stats(self) -> dict:
+        return {
+            **self._cache.stats(),
+            "keys": len(self._certs),
+            "keys_expire_in": max(0.0, self._certs_expire_at - time.time()),
+        }
+
+    async def refresh_keys(self, force: bool = False) -> Dict[str, str]:
+        async with self._fetch_lock:
+            if not force and self._certs and time.time() < self._certs_expire_at:
+                return self._certs
+            response = await get_http_client().get(self.certs_url)
+            response.raise_for_status()
+            max_age = 3600
+            match = re.search(r"max-age=(\d+)", response.headers.get("cache-control", ""))
+            if match:
+                max_age = int(match.group(1))
+            self._certs = response.json()
+            self._last_fetch = time.time()
+            self._certs_expire_at = self._last_fetch + max_age
+            logger.info(f"Loaded {len(self._certs)} Firebase signing keys, valid for {max_age}s")
+            return self._certs
+
+    async def _certs_for(self, key_id: Optional[str]) -> Dict[str, str]:
+        try:
+            certs = await self.refresh_keys()
+            if key_id and key_id not in certs and time.time() - self._last_fetch > KEYS_MIN_FORCED_REFRESH_SECONDS:
+                # Google rotated its keys before our cached copy expired
+                certs = await self.refresh_keys(force=True)
+        except Exception as e:
+            if not self._certs:
+                raise KeysUnavailableError(f"Could not fetch token signing keys: {str(e)}")
+            logger.warning(f"Using stale token signing keys: {str(e)}")
+            certs = self._certs
+        return certs
+
+    async def verify(self, token: str) -> dict:
+        """
+        Returns the decoded claims of a valid ID token, with uid set to sub.
+        Raises InvalidTokenError otherwise.
+        """
+        claims = self._cache.get(token)
+        if claims is not None:
+            return claims
+
+        if not token or not isinstance(token, str):
+            raise InvalidTokenError("Token must be a non-empty string")
+        try:
+            header = jwt.decode_header(token)
+        except (ValueError, google_auth_exceptions.GoogleAuthError) as e:
+            raise InvalidTokenError(f"Malformed token: {str(e)}")
+        if header.get("alg") != "RS256":
+            raise InvalidTokenError("Token has an unexpected signing algorithm")
+
+        certs = await self._certs_for(header.get("kid"))
+        try:
+            claims = jwt.decode(
+                token,
+                certs=certs,
+                audience=self.project_id,
+                clock_skew_in_seconds=self.clock_skew,
+            )
+        except (ValueError, google_auth_exceptions.GoogleAuthError) as e:
+            raise InvalidTokenError(str(e))
+
+        if claims.get("iss") != self.issuer:
+            raise InvalidTokenError("Token has an unexpected issuer")
+        subject = claims.get("sub")
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise InvalidTokenError("Token has an invalid subject")
+
+        claims["uid"] = subject
+        ttl = min(self.max_cache_ttl, claims["exp"] - time.time())
+        if ttl > 0:
+            self._cache.set(token, claims, ttl=ttl)
+        return claims
+
+    async def _refresh_periodically(self):
+        while True:
+            try:
+                await self.refresh_keys(force=True)
+                delay = max(KEYS_RETRY_SECONDS, self._certs_expire_at - time.time() - 60)
+            except Exception as e:
+                logger.error(f"Failed to refresh token signing keys: {str(e)}")
+                delay = KEYS_RETRY_SECONDS
+            await asyncio.sleep(delay)
+
+    def start(self):
+        """
+        Starts refreshing the signing keys in the background. Without a
+        project ID no token can verify, so there is nothing to refresh.
+        """
+        if not self.project_id:
+            logger.info("FIREBASE_PROJECT_ID is not set; ID tokens won't be verified")
+            return
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
+token_verifier = FirebaseTokenVerifier(
+    project_id=settings.FIREBASE_PROJECT_ID,
+    certs_url=settings.FIREBASE_CERTS_URL,
+    cache_size=settings.TOKEN_CACHE_SIZE,
+    max_cache_ttl=settings.TOKEN_CACHE_MAX_TTL_SECONDS,
+    clock_skew=settings.TOKEN_CLOCK_SKEW_SECONDS,
+)
@@ -0,0 +1,217 @@
+from fastapi import HTTPException, Request, UploadFile
+from multipart import MultipartParser
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import parse_options_header
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+import asyncio
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Streamed multipart files stay in memory up to this size, then go to disk
+MULTIPART_SPOOL_BYTES = 1024 * 1024
+
+class RequestTooLarge(HTTPException):
+    def __init__(self, max_bytes: int):
+        super().__init__(status_code=413, detail=f"Request body exceeds the {max_bytes} bytes limit")
+
+async def read_upload(upload: UploadFile, max_bytes: int) -> bytes:
+    """
+    Reads an uploaded file in chunks, rejecting it with 413 as soon as it
+    grows past max_bytes instead of buffering the whole body first.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes} bytes limit")
+
+    buffer = bytearray()
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes} bytes limit")
+    return bytes(buffer)
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects request bodies larger than the limit configured for their path
+    prefix while they are still streaming in, before the multipart parser
+    spools them. Uses the declared Content-Length when present and counts
+    received bytes for chunked uploads.
+    """
+
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        # Longest prefix first so specific routes can override broader ones
+        self.limits = sorted(limits.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _limit_for(self, path: str) -> Optional[int]:
+        for prefix, limit in self.limits:
+            if path.startswith(prefix):
+                return limit
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self._limit_for(scope["path"])
+        if max_bytes is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+            await self._reject(scope, receive, send, max_bytes)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise RequestTooLarge(max_bytes)
+            return message
+
+        async def tracking_send(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except RequestTooLarge:
+            if response_started:
+                raise
+            await self._reject(scope, receive, send, max_bytes)
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send, max_bytes: int):
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": f"Request body exceeds the {max_bytes} bytes limit"},
+        )
+        await response(scope, receive, send)
+
+async def iter_multipart_files(
+    request: Request,
+    field: str,
+    max_files: int,
+    max_file_bytes: Callable[[UploadFile], int],
+    body_consumed: Optional[asyncio.Event] = None,
+) -> AsyncIterator[Tuple[str, Optional[UploadFile], Optional[dict]]]:
+    """
+    Parses a multipart/form-data body while it streams in and yields
+    (filename, upload, error) for each file of field as soon as that file
+    has arrived, instead of spooling the whole request first like
+    request.form(). More of the body is only read when the next file is
+    asked for, so a slow consumer slows the upload down rather than
+    buffering it.
+
+    Each file is spooled (to disk past MULTIPART_SPOOL_BYTES) and closed
+    when the next one is asked for. Files over max_file_bytes(upload) are
+    skipped with an error. After max_files files, or on a malformed or too
+    large body, a last error is yielded and reading stops. body_consumed is
+    set once the generator is done with the body.
+    """
+    _, params = parse_options_header(request.headers.get("Content-Type", ""))
+    if b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+
+    # Parser callbacks can't await, so they queue events that are handled after each chunk
+    events = []
+    header = {"name": b"", "value": b""}
+
+    def on_header_field(data: bytes, start: int, end: int):
+        header["name"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        events.append(("header", (header["name"].lower(), header["value"])))
+        header["name"] = header["value"] = b""
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": lambda: events.append(("begin", None)),
+        "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+        "on_part_end": lambda: events.append(("end", None)),
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": lambda: events.append(("headers", None)),
+    })
+    files = 0
+    part_headers = []
+    upload, limit, error = None, 0, None
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            pending = events[:]
+            events.clear()
+            for event, value in pending:
+                if event == "begin":
+                    part_headers = []
+                elif event == "header":
+                    part_headers.append(value)
+                elif event == "headers":
+                    _, options = parse_options_header(dict(part_headers).get(b"content-disposition", b""))
+                    if options.get(b"name", b"").decode("utf-8", "replace") != field or b"filename" not in options:
+                        continue
+                    files += 1
+                    if files > max_files:
+                        yield "", None, {"error": "Too many files", "message": f"At most {max_files} files per request"}
+                        return
+                    upload = UploadFile(
+                        SpooledTemporaryFile(max_size=MULTIPART_SPOOL_BYTES),
+                        size=0,
+                        filename=options[b"filename"].decode("utf-8", "replace"),
+                        headers=Headers(raw=part_headers),
+                    )
+                    limit, error = max_file_bytes(upload), None
+                elif event == "data" and upload is not None and error is None:
+                    if upload.size + len(value) > limit:
+                        error = {"error": "File too large", "message": f"File exceeds the {limit} bytes limit"}
+                    else:
+                        await upload.write(value)
+                elif event == "end" and upload is not None:
+                    await upload.seek(0)
+                    try:
+                        yield upload.filename, None if error else upload, error
+                    finally:
+                        await upload.close()
+                        upload = None
+        parser.finalize()
+    except RequestTooLarge as e:
+        yield "", None, {"error": "Request too large", "message": e.detail}
+    except MultipartParseError as e:
+        yield "", None, {"error": "Invalid multipart body", "message": str(e)}
+    finally:
+        if upload is not None:
+            await upload.close()
+        if body_consumed is not None:
+            body_consumed.set()
+
+class RequestStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for content that is produced while the request body
+    is still being read. StreamingResponse watches for disconnects by
+    calling receive(), which would take request body chunks away from the
+    reader, so this only starts watching once body_consumed is set.
+    """
+
+    def __init__(self, content, body_consumed: asyncio.Event, **kwargs):
+        super().__init__(content, **kwargs)
+        self.body_consumed = body_consumed
+
+    async def listen_for_disconnect(self, receive: Receive):
+        await self.body_consumed.wait()
+        await super().listen_for_disconnect(receive)
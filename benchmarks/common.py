@@ -0,0 +1,116 @@
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_IMAGE = os.path.join(ROOT_DIR, 'app', 'ml', 'trex.png')
+
+# Metric name suffixes and which direction is better
+LOWER_IS_BETTER = ('_ms', '_mb')
+HIGHER_IS_BETTER = ('_per_sec',)
+# Error rates are compared in absolute terms (a baseline of 0 is the common case)
+ERROR_RATE = 'error_rate'
+
+def latency_summary(samples_seconds: List[float]) -> Dict[str, float]:
+    samples = np.asarray(samples_seconds) * 1000
+    return {
+        "samples": int(len(samples)),
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+    }
+
+def time_calls(fn: Callable[[], object], iterations: int, warmup: int = 3) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+            capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def write_results(path: str, results: dict):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+def read_results(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+def _direction(metric: str) -> Optional[int]:
+    if metric.endswith(LOWER_IS_BETTER):
+        return -1
+    if metric.endswith(HIGHER_IS_BETTER):
+        return 1
+    return None
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[dict]:
+    """
+    Compares every latency/throughput/memory metric present in both runs. Returns
+    one row per metric; a row is a regression when the metric got worse by
+    more than tolerance (relative).
+    """
+    rows = []
+    for benchmark, metrics in sorted(current.get("benchmarks", {}).items()):
+        previous = baseline.get("benchmarks", {}).get(benchmark)
+        if not previous:
+            continue
+        for metric, value in sorted(metrics.items()):
+            old = previous.get(metric)
+            if metric == ERROR_RATE and isinstance(value, (int, float)) and isinstance(old, (int, float)):
+                rows.append({
+                    "benchmark": benchmark,
+                    "metric": metric,
+                    "baseline": old,
+                    "current": value,
+                    "change": value - old,
+                    "regression": value - old > tolerance / 10,
+                })
+                continue
+            direction = _direction(metric)
+            if direction is None or not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or old == 0:
+                continue
+            change = (value - old) / abs(old)
+            rows.append({
+                "benchmark": benchmark,
+                "metric": metric,
+                "baseline": old,
+                "current": value,
+                "change": change,
+                "regression": change * direction < -tolerance,
+            })
+    return rows
+
+def format_comparison(rows: List[dict]) -> str:
+    lines = [f"{'benchmark':<40} {'metric':<16} {'baseline':>12} {'current':>12} {'change':>8}"]
+    for row in rows:
+        flag = '  REGRESSION' if row["regression"] else ''
+        lines.append(
+            f"{row['benchmark']:<40} {row['metric']:<16} {row['baseline']:>12.3f} "
+            f"{row['current']:>12.3f} {row['change']:>+8.1%}{flag}"
+        )
+    return "\n".join(lines)
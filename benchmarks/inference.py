@@ -0,0 +1,39 @@
+import time
+from typing import Dict, Sequence
+
+from benchmarks.common import SAMPLE_IMAGE, latency_summary, time_calls
+
+def run(iterations: int = 50, batch_sizes: Sequence[int] = (1, 4, 8, 16, 32), batch_repeats: int = 5) -> Dict[str, dict]:
+    """
+    Single-image latency of predict_dinosaur (decode + forward pass) and
+    batched throughput of predict_batch, on the active model version.
+    """
+    from app.ml.predict import decode_image, get_model_status, load_and_warm_up, predict_batch, predict_dinosaur
+
+    if not load_and_warm_up(warm_up_batch_sizes=sorted(set(batch_sizes))):
+        return {"inference": {"skipped": f"no model to serve ({get_model_status()['state']})"}}
+    model_version = get_model_status()["version"]
+
+    with open(SAMPLE_IMAGE, 'rb') as f:
+        content = f.read()
+    results = {
+        "inference.predict_dinosaur": {
+            **latency_summary(time_calls(lambda: predict_dinosaur(content), iterations)),
+            "model_version": model_version,
+        },
+    }
+
+    image = decode_image(content)
+    for batch_size in batch_sizes:
+        batch = [image] * batch_size
+        predict_batch(batch)
+        started = time.perf_counter()
+        for _ in range(batch_repeats):
+            predict_batch(batch)
+        elapsed = time.perf_counter() - started
+        results[f"inference.predict_batch.{batch_size}"] = {
+            "batch_size": batch_size,
+            "images_per_sec": batch_size * batch_repeats / elapsed,
+            "batch_ms": elapsed / batch_repeats * 1000,
+        }
+    return results
@@ -0,0 +1,140 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from benchmarks.common import ROOT_DIR, SAMPLE_IMAGE, latency_summary
+from benchmarks.stubs import StubServer
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_api(env: Dict[str, str], port: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR,
+        env={**os.environ, **env},
+    )
+
+async def wait_until(client: httpx.AsyncClient, path: str, process: subprocess.Popen, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API process exited with code {process.returncode}")
+        try:
+            if (await client.get(path)).status_code == 200:
+                return True
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    return False
+
+async def run_load(
+    send: Callable[[int], Awaitable[httpx.Response]],
+    requests: int,
+    concurrency: int,
+) -> dict:
+    """
+    Sends requests with a fixed number of concurrent clients and reports
+    throughput, latency percentiles and status codes.
+    """
+    latencies = []
+    statuses = Counter()
+    counter = iter(range(requests))
+
+    async def worker():
+        for index in counter:
+            started = time.perf_counter()
+            try:
+                status = (await send(index)).status_code
+            except httpx.TransportError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[str(status)] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    errors = sum(count for status, count in statuses.items() if status != "200")
+    return {
+        **latency_summary(latencies),
+        "concurrency": concurrency,
+        "requests_per_sec": requests / elapsed,
+        "error_rate": errors / requests,
+        "status_codes": dict(statuses),
+    }
+
+async def _run(stub: StubServer, requests: int, concurrency: int, startup_timeout: float) -> Dict[str, dict]:
+    port = _free_port()
+    env = {
+        **stub.app_environment(),
+        # Measure the model path, not the prediction cache
+        "PREDICTION_CACHE_SIZE": "0",
+        "PREDICTION_CACHE_PATH": "",
+        "MODEL_REGISTRY_POLL_SECONDS": "0",
+        # All requests come from one IP; measure capacity, not the rate limit
+        "RATE_LIMIT_ENABLED": "false",
+    }
+    process = start_api(env, port)
+    results = {}
+    try:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits) as client:
+            if not await wait_until(client, "/health", process, startup_timeout):
+                raise RuntimeError("API did not start in time")
+
+            async def login(index: int) -> httpx.Response:
+                # A distinct user per request so every login reaches both stubs
+                return await client.post("/api/v1/auth/login", json={
+                    "email": f"user{index}@example.com", "password": "benchmark-password",
+                })
+
+            results["load.auth_login"] = await run_load(login, requests, concurrency)
+
+            if await wait_until(client, "/ready", process, startup_timeout):
+                with open(SAMPLE_IMAGE, "rb") as f:
+                    image = f.read()
+
+                async def predict(index: int) -> httpx.Response:
+                    return await client.post(
+                        "/api/v1/predict/predict/", files={"image": ("trex.png", image, "image/png")}
+                    )
+
+                results["load.predict"] = await run_load(predict, requests, concurrency)
+            else:
+                results["load.predict"] = {"skipped": "model did not become ready"}
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return results
+
+def run(
+    requests: int = 200,
+    concurrency: int = 16,
+    stub: Optional[StubServer] = None,
+    stub_latency_ms: float = 20,
+    startup_timeout: float = 180,
+) -> Dict[str, dict]:
+    """
+    End-to-end load test of /api/v1/auth/login and /api/v1/predict against a
+    real uvicorn process, with Firebase and Supabase served by local stubs.
+    """
+    own_stub = stub is None
+    if own_stub:
+        stub = StubServer(latency_ms=stub_latency_ms).start()
+    try:
+        return asyncio.run(_run(stub, requests, concurrency, startup_timeout))
+    finally:
+        if own_stub:
+            stub.stop()
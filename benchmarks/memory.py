@@ -0,0 +1,121 @@
+import asyncio
+import os
+import secrets
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+
+from benchmarks.common import ROOT_DIR, SAMPLE_IMAGE
+from benchmarks.load import _free_port, start_api, wait_until
+from benchmarks.stubs import StubServer
+
+MODES = ('keras', 'sidecar')
+
+def process_memory(pid: int) -> Optional[Dict[str, float]]:
+    """
+    Resident and proportional set size in MB. PSS splits pages shared between
+    processes among them, so summing it over workers doesn't double count.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    values = {}
+    for line in lines:
+        key, _, rest = line.partition(":")
+        if key in ("Rss", "Pss"):
+            values[key.lower() + "_mb"] = int(rest.split()[0]) / 1024
+    return values
+
+def start_sidecar(env: Dict[str, str], address: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "app.ml.sidecar", "--address", address],
+        cwd=ROOT_DIR,
+        env={**os.environ, **env},
+    )
+
+def stop(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+async def _measure(stub: StubServer, mode: str, workers: int, startup_timeout: float) -> dict:
+    env = {
+        **stub.app_environment(),
+        "INFERENCE_BACKEND": mode,
+        "PREDICTION_CACHE_SIZE": "0",
+        "PREDICTION_CACHE_PATH": "",
+        "MODEL_REGISTRY_POLL_SECONDS": "0",
+        "RATE_LIMIT_ENABLED": "false",
+    }
+    sidecar = None
+    processes = []
+    try:
+        if mode == 'sidecar':
+            address = os.path.join(tempfile.mkdtemp(prefix="dino-sidecar-"), "inference.sock")
+            env["INFERENCE_SIDECAR_ADDRESS"] = address
+            env["INFERENCE_SIDECAR_AUTHKEY"] = secrets.token_hex(16)
+            sidecar = start_sidecar(env, address)
+            processes.append(sidecar)
+        ports = [_free_port() for _ in range(workers)]
+        api = [start_api(env, port) for port in ports]
+        processes.extend(api)
+
+        with open(SAMPLE_IMAGE, "rb") as f:
+            image = f.read()
+        async with httpx.AsyncClient(timeout=60) as client:
+            for port, process in zip(ports, api):
+                if not await wait_until(client, f"http://127.0.0.1:{port}/ready", process, startup_timeout):
+                    return {"skipped": "model did not become ready"}
+                # Steady state: the model has served real requests in every worker
+                for _ in range(3):
+                    await client.post(
+                        f"http://127.0.0.1:{port}/api/v1/predict/predict/",
+                        files={"image": ("trex.png", image, "image/png")},
+                    )
+
+        worker_memory = [process_memory(process.pid) for process in api]
+        if any(memory is None for memory in worker_memory):
+            return {"skipped": "per-process memory needs /proc/<pid>/smaps_rollup (Linux)"}
+        sidecar_memory = process_memory(sidecar.pid) if sidecar is not None else {"rss_mb": 0.0, "pss_mb": 0.0}
+        return {
+            "workers": workers,
+            "rss_total_mb": sum(memory["rss_mb"] for memory in worker_memory) + sidecar_memory["rss_mb"],
+            "pss_total_mb": sum(memory["pss_mb"] for memory in worker_memory) + sidecar_memory["pss_mb"],
+            "worker_rss_mean_mb": sum(memory["rss_mb"] for memory in worker_memory) / workers,
+            "sidecar_rss_mb": sidecar_memory["rss_mb"],
+        }
+    finally:
+        stop(processes)
+
+def run(
+    workers: Sequence[int] = (1, 2, 4),
+    modes: Sequence[str] = MODES,
+    stub: Optional[StubServer] = None,
+    startup_timeout: float = 180,
+) -> Dict[str, dict]:
+    """
+    Memory footprint of N API worker processes, each loading its own model
+    (keras) versus all of them sharing one inference sidecar (sidecar).
+    Totals include the sidecar process.
+    """
+    own_stub = stub is None
+    if own_stub:
+        stub = StubServer().start()
+    results = {}
+    try:
+        for mode in modes:
+            for count in workers:
+                results[f"memory.{mode}.workers_{count}"] = asyncio.run(_measure(stub, mode, count, startup_timeout))
+    finally:
+        if own_stub:
+            stub.stop()
+    return results
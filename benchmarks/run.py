@@ -0,0 +1,88 @@
+"""
+Benchmark runner.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --suites inference --baseline benchmarks/baseline.json
+
+Exits with status 1 when a metric regresses past --tolerance against the
+baseline, so it can gate a deployment.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from benchmarks import common
+from benchmarks.stubs import StubServer
+
+SUITES = ('inference', 'training_input', 'load', 'memory', 'startup')
+
+def run_suite(name: str, args, stub: StubServer) -> dict:
+    if name == 'inference':
+        from benchmarks import inference
+        return inference.run(iterations=args.iterations, batch_sizes=args.batch_sizes)
+    if name == 'training_input':
+        from benchmarks import training_input
+        return training_input.run(max_batches=args.input_batches)
+    if name == 'load':
+        from benchmarks import load
+        return load.run(requests=args.requests, concurrency=args.concurrency, stub=stub)
+    if name == 'memory':
+        from benchmarks import memory
+        return memory.run(workers=args.memory_workers, stub=stub)
+    if name == 'startup':
+        from benchmarks import startup
+        return startup.run(runs=args.startup_runs, stub=stub)
+    raise ValueError(f"Unknown suite: {name}")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Dino API benchmarks")
+    parser.add_argument('--suites', default=','.join(SUITES), help=f"Comma-separated subset of {', '.join(SUITES)}")
+    parser.add_argument('--output', default=None, help="Write the results as JSON to this file")
+    parser.add_argument('--baseline', default=None, help="Compare against a previous results file")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Allowed relative regression (0.10 = 10%%)")
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--batch-sizes', type=lambda value: [int(size) for size in value.split(',')], default=[1, 4, 8, 16, 32])
+    parser.add_argument('--input-batches', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--memory-workers', type=lambda value: [int(count) for count in value.split(',')], default=[1, 2, 4])
+    parser.add_argument('--startup-runs', type=int, default=5)
+    parser.add_argument('--stub-latency-ms', type=float, default=20)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    suites = [suite.strip() for suite in args.suites.split(',') if suite.strip()]
+    for suite in suites:
+        if suite not in SUITES:
+            parser.error(f"Unknown suite: {suite}")
+
+    # Point every suite (and the app settings they import) at the local stubs,
+    # so benchmarks never reach the real Firebase/Supabase projects
+    stub = StubServer(latency_ms=args.stub_latency_ms).start()
+    os.environ.update(stub.app_environment())
+
+    results = {"environment": common.environment(), "suites": suites, "benchmarks": {}}
+    try:
+        for suite in suites:
+            print(f"Running {suite}...", file=sys.stderr)
+            results["benchmarks"].update(run_suite(suite, args, stub))
+    finally:
+        stub.stop()
+
+    if args.output:
+        common.write_results(args.output, results)
+    print(json.dumps(results["benchmarks"], indent=2, sort_keys=True))
+
+    if args.baseline:
+        rows = common.compare(results, common.read_results(args.baseline), args.tolerance)
+        print(common.format_comparison(rows))
+        regressions = [row for row in rows if row["regression"]]
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed more than {args.tolerance:.0%}", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+
+from benchmarks.common import ROOT_DIR
+from benchmarks.load import _free_port, start_api
+from benchmarks.memory import stop
+from benchmarks.stubs import StubServer
+
+ROLES = ('all', 'auth', 'predict')
+# Reported as loaded/not loaded after importing main, per role
+HEAVY_PACKAGES = ('tensorflow', 'firebase_admin', 'supabase', 'numpy', 'PIL')
+
+def _import_times(stderr: str) -> List[tuple]:
+    """
+    Parses `python -X importtime` output into (module, self_us, cumulative_us).
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((module.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+def import_profile(env: Dict[str, str], top: int = 10) -> dict:
+    """
+    Imports main in a fresh interpreter and reports its total import time,
+    the packages that account for most of it (own import time of all their
+    modules) and which heavy packages got loaded.
+    """
+    check = f"import main, sys; print(','.join(name for name in {HEAVY_PACKAGES!r} if name in sys.modules))"
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", check],
+        cwd=ROOT_DIR, env={**os.environ, **env}, capture_output=True, text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing main failed: {process.stderr[-2000:]}")
+    rows = _import_times(process.stderr)
+    packages = Counter()
+    for module, self_us, _ in rows:
+        packages[module.split(".")[0]] += self_us
+    loaded = set(filter(None, process.stdout.strip().split(",")))
+    return {
+        "import_ms": next(cumulative for module, _, cumulative in rows if module == "main") / 1000,
+        "top_packages_ms": {name: us / 1000 for name, us in packages.most_common(top)},
+        "loaded": {name: name in loaded for name in HEAVY_PACKAGES},
+    }
+
+def time_to_first_response(env: Dict[str, str], timeout: float = 60) -> float:
+    """
+    Seconds from spawning a uvicorn worker to its first answered /health,
+    interpreter start, imports and lifespan startup included.
+    """
+    port = _free_port()
+    started = time.perf_counter()
+    process = start_api(env, port)
+    try:
+        with httpx.Client(timeout=1) as client:
+            while time.perf_counter() - started < timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"API process exited with code {process.returncode}")
+                try:
+                    if client.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                        return time.perf_counter() - started
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+        raise RuntimeError(f"API did not answer /health within {timeout}s")
+    finally:
+        stop([process])
+
+def run(runs: int = 5, roles: Sequence[str] = ROLES, stub: Optional[StubServer] = None) -> Dict[str, dict]:
+    """
+    Cold start per SERVICE_ROLE: import time of main (median of runs, with
+    the packages that cost the most in the last run) and time until a new
+    worker answers its first request.
+    """
+    own_stub = stub is None
+    if own_stub:
+        stub = StubServer().start()
+    results = {}
+    try:
+        for role in roles:
+            env = {**stub.app_environment(), "SERVICE_ROLE": role, "MODEL_REGISTRY_POLL_SECONDS": "0"}
+            profiles = [import_profile(env) for _ in range(runs)]
+            first_response = [time_to_first_response(env) for _ in range(runs)]
+            results[f"startup.{role}"] = {
+                "import_ms": statistics.median(profile["import_ms"] for profile in profiles),
+                "first_response_ms": statistics.median(first_response) * 1000,
+                "top_packages_ms": profiles[-1]["top_packages_ms"],
+                "loaded": profiles[-1]["loaded"],
+            }
+    finally:
+        if own_stub:
+            stub.stop()
+    return results
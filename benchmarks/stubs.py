@@ -0,0 +1,255 @@
+import datetime
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Set
+from urllib.parse import parse_qs, urlparse
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt, jwt
+
+PROJECT_ID = "benchmark"
+KEY_ID = "benchmark-key"
+BAD_PASSWORD = "wrong-password"
+
+class StubKeys:
+    """
+    Throwaway RSA key used both as the Firebase service account key and to
+    sign the ID tokens the stub hands out (its certificate is served as the
+    token signing keys).
+    """
+
+    def __init__(self):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "benchmark")])
+        now = datetime.datetime.utcnow()
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name)
+            .public_key(key.public_key()).serial_number(1)
+            .not_valid_before(now - datetime.timedelta(minutes=5))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256())
+        )
+        self.private_key_pem = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ).decode()
+        self.certificate_pem = cert.public_bytes(serialization.Encoding.PEM).decode()
+        self._signer = crypt.RSASigner.from_string(self.private_key_pem, key_id=KEY_ID)
+
+    def id_token(self, uid: str, email: str, lifetime: int = 3600) -> str:
+        now = int(time.time())
+        return jwt.encode(self._signer, {
+            "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+            "aud": PROJECT_ID,
+            "sub": uid,
+            "user_id": uid,
+            "email": email,
+            "iat": now,
+            "auth_time": now,
+            "exp": now + lifetime,
+        }).decode()
+
+def _profile(email: str) -> dict:
+    return {
+        "id": "3fa85f64-5717-4562-b3fc-2c963f66afa6",
+        "email": email,
+        "full_name": "Benchmark User",
+        "images_uploaded_count": 0,
+        "has_entries": False,
+        "profile_picture": "no_profile",
+        "created_at": "2024-01-01T00:00:00+00:00",
+    }
+
+class StubState:
+    """
+    Accounts created through the Firebase admin API, rows of the profiles
+    table and the prediction history written through record_usage, so bulk
+    imports see earlier users and unique-email conflicts like against the
+    real services.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users: Dict[str, dict] = {}
+        self.profiles: Dict[str, dict] = {}
+        self.predictions: List[dict] = []
+        self.usage_batches: Set[str] = set()
+
+def _handler(keys: StubKeys, state: StubState, latency_seconds: float):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body, headers: Dict[str, str] = None):
+            payload = json.dumps(body).encode()
+            if latency_seconds:
+                time.sleep(latency_seconds)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_POST(self):
+            body = self._body()
+            path = urlparse(self.path).path
+            if path.endswith("/accounts:signInWithPassword"):
+                if body.get("password") == BAD_PASSWORD:
+                    return self._send(400, {"error": {"message": "INVALID_PASSWORD"}})
+                uid = f"uid-{zlib.crc32(body['email'].encode()):08x}"
+                return self._send(200, {
+                    "idToken": keys.id_token(uid, body["email"]),
+                    "refreshToken": "benchmark-refresh-token",
+                    "expiresIn": "3600",
+                    "localId": uid,
+                    "email": body["email"],
+                })
+            if path.endswith("/accounts:lookup"):
+                # Admin SDK via FIREBASE_AUTH_EMULATOR_HOST
+                with state.lock:
+                    users = [
+                        state.users[uid] for uid in body.get("localId", [])
+                        if uid in state.users
+                    ] + [
+                        user for user in state.users.values()
+                        if user["email"] in [email.lower() for email in body.get("email", [])]
+                    ]
+                return self._send(200, {"users": users} if users else {})
+            if path.endswith("/accounts:batchCreate"):
+                errors = []
+                with state.lock:
+                    emails = {user["email"] for user in state.users.values()}
+                    for index, user in enumerate(body.get("users", [])):
+                        email = user.get("email", "").lower()
+                        if user["localId"] in state.users or email in emails:
+                            errors.append({"index": index, "message": "DUPLICATE_EMAIL"})
+                            continue
+                        emails.add(email)
+                        state.users[user["localId"]] = {"localId": user["localId"], "email": email}
+                return self._send(200, {"error": errors} if errors else {})
+            if path.endswith("/accounts:batchDelete"):
+                with state.lock:
+                    for uid in body.get("localIds", []):
+                        state.users.pop(uid, None)
+                return self._send(200, {})
+            if path == "/rest/v1/profiles":
+                rows = body if isinstance(body, list) else [body]
+                with state.lock:
+                    # A multi-row insert is one statement: all rows or none
+                    emails = {profile["email"] for profile in state.profiles.values()}
+                    for row in rows:
+                        if row.get("email") in emails:
+                            return self._send(409, {
+                                "code": "23505",
+                                "message": 'duplicate key value violates unique constraint "unique_email"',
+                                "details": f"Key (email)=({row.get('email')}) already exists.",
+                                "hint": None,
+                            })
+                        emails.add(row.get("email"))
+                    for row in rows:
+                        state.profiles[row.get("id") or row["email"]] = row
+                return self._send(201, rows)
+            if path == "/rest/v1/rpc/record_usage":
+                with state.lock:
+                    if body["batch_id"] in state.usage_batches:
+                        return self._send(200, [{"recorded": 0}])
+                    state.usage_batches.add(body["batch_id"])
+                    for uid, email in body["emails"].items():
+                        for profile in state.profiles.values():
+                            if profile.get("firebase_uid") is None and profile.get("email") == email:
+                                profile["firebase_uid"] = uid
+                    for uid, count in body["counts"].items():
+                        for profile in state.profiles.values():
+                            if profile.get("firebase_uid") == uid:
+                                profile["images_uploaded_count"] = profile.get("images_uploaded_count", 0) + count
+                                profile["has_entries"] = True
+                    state.predictions.extend(body["predictions"])
+                return self._send(200, [{"recorded": len(body["predictions"])}])
+            if path.startswith("/rest/v1/"):
+                return self._send(201, body if isinstance(body, list) else [body])
+            self._send(404, {"error": "not found"})
+
+        def do_PATCH(self):
+            body = self._body()
+            self._send(200, [body])
+
+        def do_DELETE(self):
+            self._body()
+            self._send(200, [])
+
+        def do_GET(self):
+            # postgrest-py sends "{}" as the body of its GETs
+            self._body()
+            url = urlparse(self.path)
+            if url.path == "/certs":
+                return self._send(200, {KEY_ID: keys.certificate_pem}, {"Cache-Control": "public, max-age=3600"})
+            if url.path == "/rest/v1/profiles":
+                email = parse_qs(url.query).get("email", ["eq.benchmark@example.com"])[0]
+                return self._send(200, [_profile(email.split("eq.", 1)[-1])])
+            self._send(404, {"error": "not found"})
+
+    return StubHandler
+
+class StubServer:
+    """
+    Local stand-in for the Firebase Auth REST API, its token signing keys
+    and the Supabase REST API, so the auth paths can be load-tested offline.
+    Also answers the Firebase admin SDK (through FIREBASE_AUTH_EMULATOR_HOST)
+    for user lookups, imports and deletes; those users and the inserted
+    profiles are kept in state.
+    latency_ms simulates the network round trip of the real services.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0):
+        self.keys = StubKeys()
+        self.state = StubState()
+        self._server = ThreadingHTTPServer((host, port), _handler(self.keys, self.state, latency_ms / 1000))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-server", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def app_environment(self) -> Dict[str, str]:
+        """
+        Settings that point the API at this stub.
+        """
+        return {
+            "FIREBASE_PROJECT_ID": PROJECT_ID,
+            "FIREBASE_PRIVATE_KEY_ID": KEY_ID,
+            "FIREBASE_PRIVATE_KEY": self.keys.private_key_pem,
+            "FIREBASE_CLIENT_EMAIL": f"benchmark@{PROJECT_ID}.iam.gserviceaccount.com",
+            "FIREBASE_CLIENT_ID": "0",
+            "FIREBASE_CLIENT_CERT_URL": f"{self.url}/certs",
+            "FIREBASE_WEB_API_KEY": "benchmark",
+            "FIREBASE_AUTH_URL": f"{self.url}/identitytoolkit/v1",
+            "FIREBASE_TOKEN_URL": f"{self.url}/securetoken/v1",
+            "FIREBASE_CERTS_URL": f"{self.url}/certs",
+            "FIREBASE_AUTH_EMULATOR_HOST": self.url.split("://", 1)[1],
+            "SUPABASE_URL": self.url,
+            "SUPABASE_KEY": "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.e30.benchmark",
+        }
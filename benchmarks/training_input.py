@@ -0,0 +1,34 @@
+import time
+from typing import Dict, Iterable, Optional
+
+def _images_per_sec(batches: Iterable, max_batches: Optional[int] = None) -> dict:
+    started = time.perf_counter()
+    images = 0
+    for index, batch in enumerate(batches):
+        images += len(batch[0])
+        if max_batches is not None and index + 1 >= max_batches:
+            break
+    elapsed = time.perf_counter() - started
+    return {"images": images, "images_per_sec": images / elapsed, "elapsed_seconds": elapsed}
+
+def run(max_batches: int = 20, batch_size: int = 32) -> Dict[str, dict]:
+    """
+    Images/sec delivered to model.fit by the legacy ImageDataGenerator
+    pipeline and by the TFRecord/tf.data pipeline (with augmentation).
+    """
+    from app.ml.dataset import ensure_shards, make_dataset
+    from app.ml.train import get_data_generators
+
+    results = {}
+    train_generator, _ = get_data_generators()
+    results["training_input.image_data_generator"] = _images_per_sec(train_generator, max_batches)
+
+    started = time.perf_counter()
+    manifest = ensure_shards()
+    shards_seconds = time.perf_counter() - started
+    dataset = make_dataset('train', manifest, batch_size=batch_size, training=True)
+    # The first full epoch fills the in-memory cache; later epochs are what training sees
+    results["training_input.tf_data.first_epoch"] = _images_per_sec(dataset)
+    results["training_input.tf_data"] = _images_per_sec(dataset.repeat(), max_batches)
+    results["training_input.tf_data"]["shards_ready_seconds"] = shards_seconds
+    return results
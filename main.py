@@ -1,10 +1,13 @@
 from fastapi import FastAPI
 from app import create_app
+from app.api import health, metrics
 from app.api.v1.api import api_router
 from app.core.config import settings
 
 app = create_app()
-app.include_router(api_router, prefix="/api/v1")
+app.include_router(health.router, tags=["Health"])
+app.include_router(metrics.router, tags=["Health"])
+app.include_router(api_router, prefix=settings.API_V1_STR)
 
 if __name__ == "__main__":
     import uvicorn